@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
-from flask import Flask, jsonify, request, send_from_directory,session, send_file
+from flask import Flask, jsonify, request, send_from_directory,session, send_file, g, has_request_context
 from flask_cors import CORS
-import os, csv, json, shutil, glob, io, time
+import os, csv, json, shutil, glob, io, time, marshal, sqlite3, contextvars
 from datetime import datetime,timedelta, date
 from urllib.parse import unquote
 import requests
@@ -9,19 +9,28 @@ import requests
 import base64, re, math, uuid
 # from werkzeug.utils import secure_filename
 
-import hashlib
+import hashlib, hmac
 import jwt
 import bcrypt
 from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, closing
+from collections import OrderedDict
 import threading
+import logging, logging.handlers, queue, random, atexit, sys
+import mmap, struct, bisect, heapq
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，文件锁退化为空操作
+    fcntl = None
 # from dotenv import load_dotenv
-import zipfile, tempfile
+import zipfile, tempfile, gzip
 
 
 # 初始化Flask应用（必须在所有使用app的代码之前）
 app = Flask(__name__)
 CORS(app, resources={
-    r"/api/*": {"origins": "*"},
+    r"/api/*": {"origins": "*", "expose_headers": ["ETag"]},
     r"/files/images/*": {"origins": "*"}
 })
 app.config['JSON_AS_ASCII'] = False
@@ -29,6 +38,76 @@ app.url_map.charset = 'utf-8'
 app.config['JSONIFY_PRETTYPRINT_REGULAR'] = True
 
 
+# 日志配置
+LOG_LEVEL = os.environ.get('GLIFEIST_LOG_LEVEL', 'INFO').upper()  # 生产环境建议 WARNING
+LOG_DEBUG_SAMPLE_RATE = float(os.environ.get('GLIFEIST_LOG_DEBUG_SAMPLE_RATE', 1.0))  # 逐请求调试日志的抽样比例
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+
+# 按功能划分的日志记录器，均挂在 glifeist 之下
+logger = logging.getLogger("glifeist")
+request_logger = logging.getLogger("glifeist.request")  # 认证等逐请求的调试信息
+auth_logger = logging.getLogger("glifeist.auth")
+data_logger = logging.getLogger("glifeist.data")
+item_logger = logging.getLogger("glifeist.items")
+task_logger = logging.getLogger("glifeist.tasks")
+file_logger = logging.getLogger("glifeist.files")
+
+
+class RequestSampleFilter(logging.Filter):
+    """按请求抽样 DEBUG 日志：同一请求的调试日志要么全部输出要么全部丢弃，更高级别的日志不受影响"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate >= 1:
+            return True
+        if not has_request_context():
+            return random.random() < self.rate
+        if "log_sampled" not in g:
+            g.log_sampled = random.random() < self.rate
+        return g.log_sampled
+
+
+_log_listener = None
+
+
+def setup_logging():
+    """配置日志：请求线程只把记录放入队列，由后台线程写到标准输出，避免同步写日志文件阻塞请求"""
+    global _log_listener
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+    for handler in list(logger.handlers):
+        if isinstance(handler, logging.handlers.QueueHandler):
+            logger.removeHandler(handler)
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    _log_listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _log_listener.start()
+
+
+def stop_logging():
+    """停止后台日志线程，写出队列中剩余的记录"""
+    if _log_listener is not None:
+        _log_listener.stop()
+
+
+setup_logging()
+_request_sample_filter = RequestSampleFilter(LOG_DEBUG_SAMPLE_RATE)
+for _named_logger in (request_logger, auth_logger, data_logger, item_logger, task_logger, file_logger):
+    _named_logger.addFilter(_request_sample_filter)
+atexit.register(stop_logging)
+# 开发服务器的访问日志同样遵循日志级别，生产环境设为 WARNING 时不再逐请求输出
+logging.getLogger("werkzeug").setLevel(LOG_LEVEL)
+if hasattr(os, "register_at_fork"):
+    # gunicorn --preload 等场景下 fork 出的子进程没有父进程的后台线程，需要重新配置
+    os.register_at_fork(after_in_child=setup_logging)
+
+
 # 加载 .env 文件
 # load_dotenv()
 
@@ -53,7 +132,7 @@ def validate_jwt_secret():
             # 开发环境生成临时密钥
             import secrets
             jwt_secret = secrets.token_urlsafe(32)
-            print("警告: 使用临时 JWT 密钥，生产环境必须设置 JWT_SECRET")
+            auth_logger.warning("使用临时 JWT 密钥，生产环境必须设置 JWT_SECRET")
     return jwt_secret
 
 # JWT配置
@@ -64,25 +143,73 @@ JWT_ALGORITHM = 'HS256'
 JWT_ACCESS_EXPIRATION_DELTA = timedelta(minutes=120)
 JWT_REFRESH_EXPIRATION_DELTA = timedelta(days=7)
 JWT_LONG_TERM_EXPIRATION_DELTA = timedelta(days=365)
+JWT_IMAGE_EXPIRATION_DELTA = timedelta(hours=1)  # 图片令牌（附在 <img> 地址中）的有效期
+# 图片令牌使用由 JWT_SECRET 派生的单独密钥签名，不能当作访问令牌使用，访问令牌也不能当作图片令牌
+IMAGE_TOKEN_SECRET = hmac.new(JWT_SECRET.encode('utf-8'), b'glifeist-image-token', hashlib.sha256).digest()
+TOKEN_CACHE_MAX_ENTRIES = int(os.environ.get('GLIFEIST_TOKEN_CACHE_SIZE', 4096))  # 每个进程缓存的已验证令牌数
+# 是否检查令牌吊销（登出后令牌立即失效）
+TOKEN_REVOCATION_ENABLED = os.environ.get('GLIFEIST_TOKEN_REVOCATION', '1').lower() not in ('0', 'false', 'no', 'off')
+
+# 密码哈希配置：bcrypt 计算强度，修改后已有用户在下次登录时自动按新强度重新哈希
+BCRYPT_ROUNDS = int(os.environ.get('GLIFEIST_BCRYPT_ROUNDS', 12))
+PASSWORD_HASH_WORKERS = int(os.environ.get('GLIFEIST_PASSWORD_HASH_WORKERS', min(4, os.cpu_count() or 1)))  # 每个进程同时进行的哈希数
+PASSWORD_HASH_MAX_QUEUE = int(os.environ.get('GLIFEIST_PASSWORD_HASH_MAX_QUEUE', 64))  # 排队超过该数量时返回503
 
 # safe_save时检查数据完整性参数
 MAX_DIFFERENT_FIELDS=2
 MAX_DIFFERENT_ITEMS_PER_FIELD=10
 
+# 保存时发现数据已被其他请求修改（且请求未携带 If-Match）时，重新执行请求的最大次数
+VERSION_CONFLICT_RETRIES = 3
+
 # 备份配置
 _last_backup_time = None
 _backup_interval = 600  # 10分钟间隔
 _max_backups = 10  # 最多保留10个备份
 
+# 主数据存储后端：json（默认，每个用户一个 master_data.json）或 sqlite（每个用户一个 master_data.db）
+STORAGE_BACKEND = os.environ.get('GLIFEIST_STORAGE_BACKEND', 'json').lower()
+if STORAGE_BACKEND not in ('json', 'sqlite'):
+    raise ValueError(f"不支持的存储后端: {STORAGE_BACKEND}")
+
+# 主数据变更日志（仅json后端）：保存时只追加变化部分，后台线程定期合并回 master_data.json
+DATA_JOURNAL_ENABLED = os.environ.get('GLIFEIST_DATA_JOURNAL', '1').lower() not in ('0', 'false', 'no', 'off')
+# JSON文件默认紧凑写入，设为1时缩进排版便于人工查看
+JSON_PRETTY_PRINT = os.environ.get('GLIFEIST_JSON_PRETTY', '0').lower() in ('1', 'true', 'yes', 'on')
+DATA_JOURNAL_COMPACT_BYTES = int(os.environ.get('GLIFEIST_DATA_JOURNAL_COMPACT_BYTES', 512 * 1024))  # 日志超过该大小时触发合并
+
+# 每日自动任务（批量归档、循环任务刷新）：由后台线程在每个日界执行，设为0时只能手动触发
+AUTO_TASKS_ENABLED = os.environ.get('GLIFEIST_AUTO_TASKS', '1').lower() not in ('0', 'false', 'no', 'off')
+# 已归档任务在主数据中保留的天数（按完成时间），超过后由每日自动任务移入按月压缩的归档分段；设为负数时不移出
+TASK_ARCHIVE_RETENTION_DAYS = int(os.environ.get('GLIFEIST_TASK_ARCHIVE_RETENTION_DAYS', 30))
+TASK_ARCHIVE_PAGE_SIZE = 50  # 归档任务查询默认每页数量
+# 每个进程缓存归档任务ID集合（分配任务ID时跳过已归档的ID）的用户数
+TASK_ARCHIVE_IDS_CACHE_SIZE = int(os.environ.get('GLIFEIST_TASK_ARCHIVE_IDS_CACHE_SIZE', 256))
+
+# 主数据缓存配置
+MASTER_DATA_CACHE_MAX_ENTRIES = int(os.environ.get('GLIFEIST_MASTER_DATA_CACHE_SIZE', 512))  # 每个进程最多缓存的文件数（json后端每个用户约十个分区文件）
+MASTER_DATA_CACHE_RACY_NS = 50_000_000  # 文件修改后50ms内的缓存视为不可信（文件系统时间戳精度有限）
+
 
 default_tasks = []
 _settings_cache = None
-_executing_auto_tasks = False # 添加一个全局变量来防止递归调用
 
 
 # 用户数据目录
 USERS_DIR = 'users'
 USERS_DB_FILE = os.path.join(USERS_DIR, 'users.json')
+USERS_SQLITE_FILE = os.path.join(USERS_DIR, 'users.db')
+TOKEN_REVOCATIONS_FILE = os.path.join(USERS_DIR, 'revocations.db')  # 登出和改密码产生的令牌吊销记录
+# 用户注册表后端：json（默认，users.json）或 sqlite（users.db，适合大量用户）
+USER_REGISTRY_BACKEND = os.environ.get('GLIFEIST_USER_REGISTRY', 'json').lower()
+if USER_REGISTRY_BACKEND not in ('json', 'sqlite'):
+    raise ValueError(f"不支持的用户注册表后端: {USER_REGISTRY_BACKEND}")
+USERS_PAGE_SIZE = 50  # 用户列表默认每页数量
+USERS_MAX_PAGE_SIZE = 500
+TASKS_PAGE_SIZE = 100  # 任务查询默认每页数量
+TASKS_MAX_PAGE_SIZE = 1000
+TASK_INDEX_CACHE_SIZE = int(os.environ.get('GLIFEIST_TASK_INDEX_CACHE_SIZE', 64))  # 每个进程缓存任务查询索引的用户数
+TASKS_BULK_MAX_OPERATIONS = 1000  # 批量修改任务一次最多包含的操作数
 DEFAULT_DATA_FILES = ['settings.json', 'logs.json', 'master_data.json']
 
 
@@ -1868,8 +1995,13 @@ def get_user_dir(username):
 
 # 全局配置管理器类
 class GlobalConfigManager:
+    """当前用户的数据路径
+
+    路径保存在 contextvars 中，只对当前请求（或后台任务所在线程）可见，同一进程内的多个线程
+    可以同时处理不同用户的请求。用户目录在注册时由 init_user_data 创建，这里不再每次请求都创建。
+    """
     _instance = None
-    _current_username = None
+    _current_paths = contextvars.ContextVar("glifeist_user_paths", default=None)
 
     def __new__(cls):
         if cls._instance is None:
@@ -1881,51 +2013,91 @@ class GlobalConfigManager:
         if self._initialized:
             return
         self._initialized = True
+        self._paths_cache = {}  # 用户名 -> 路径字典
+        self._checked_users = set()  # 本进程已确认目录完整的用户
         # self._current_user_settings = {}
         # self._current_user_data = {}
         # self.reset_to_global()
 
-    def set_current_user(self, username):
-        """设置当前用户"""
-        self._current_username = username
-
-        if username:
-            # 用户特定配置
-            user_dir = os.path.join(USERS_DIR, username)
-            self.DATA_FILE = os.path.join(user_dir, "master_data.json")
-            self.LOGS_FILE = os.path.join(user_dir, "logs.json")
-            self.SETTINGS_FILE = os.path.join(user_dir, "settings.json")
+    def __getattr__(self, name):
+        """读取当前上下文中用户的路径属性，如 DATA_DIR、IMAGES_DIR"""
+        paths = GlobalConfigManager._current_paths.get()
+        if paths is not None and name in paths:
+            return paths[name]
+        raise AttributeError(name)
+
+    @property
+    def current_username(self):
+        """当前上下文中的用户名，未设置时为 None"""
+        paths = GlobalConfigManager._current_paths.get()
+        return paths["USERNAME"] if paths else None
+
+    def user_paths(self, username):
+        """计算用户的各数据文件路径（结果按用户缓存，调用方不要修改）"""
+        paths = self._paths_cache.get(username)
+        if paths is not None:
+            return paths
+
+        user_dir = os.path.join(USERS_DIR, username)
+        paths = {
+            "USERNAME": username,
+            "DATA_FILE": os.path.join(user_dir, "master_data.json"),
+            "DATA_DIR": os.path.join(user_dir, "master_data"),
+            "DATA_DB_FILE": os.path.join(user_dir, "master_data.db"),
+            "LOGS_FILE": os.path.join(user_dir, "logs.json"),
+            "SETTINGS_FILE": os.path.join(user_dir, "settings.json"),
+            "TASK_ARCHIVE_DIR": os.path.join(user_dir, "task_archive"),
 
             # 用户文件夹路径
-            self.MARKDOWN_FILES_DIR = os.path.join(user_dir, "files")
-            self.NOTES_DIR = os.path.join(self.MARKDOWN_FILES_DIR, "notes")
-            self.IMAGES_DIR = os.path.join(self.MARKDOWN_FILES_DIR, "images")
-            self.JOURNALS_DIR = os.path.join(self.MARKDOWN_FILES_DIR, "journals")
-
-            self.MARKDOWN_TREE_FILE = os.path.join(self.NOTES_DIR, "file_tree.json")
-            # print("用户数据初始化完成:", user_dir)
-        # else:
-            # 全局配置（默认配置）
-            # self.reset_to_global()
+            "MARKDOWN_FILES_DIR": os.path.join(user_dir, "files"),
+        }
+        paths["NOTES_DIR"] = os.path.join(paths["MARKDOWN_FILES_DIR"], "notes")
+        paths["IMAGES_DIR"] = os.path.join(paths["MARKDOWN_FILES_DIR"], "images")
+        paths["JOURNALS_DIR"] = os.path.join(paths["MARKDOWN_FILES_DIR"], "journals")
+        paths["MARKDOWN_TREE_FILE"] = os.path.join(paths["NOTES_DIR"], "file_tree.json")
+        self._paths_cache[username] = paths
+        return paths
 
-        # 确保目录存在
-        self.ensure_directories_exist()
+    def set_current_user(self, username):
+        """设置当前上下文的用户，username 为空时清除"""
+        if not username:
+            GlobalConfigManager._current_paths.set(None)
+            return
 
+        GlobalConfigManager._current_paths.set(self.user_paths(username))
+        # 早期版本创建的用户可能缺少文件夹，每个进程只检查一次
+        if username not in self._checked_users:
+            self.ensure_directories_exist()
+            self._checked_users.add(username)
 
+    @contextmanager
+    def user_scope(self, username):
+        """在当前上下文内临时切换到指定用户，供后台任务使用"""
+        token = GlobalConfigManager._current_paths.set(self.user_paths(username))
+        try:
+            yield
+        finally:
+            GlobalConfigManager._current_paths.reset(token)
 
     def reset_to_global(self):
         """重置为全局配置"""
-        self._current_username = None
-        self.DATA_FILE = "./master_data.json"
-        self.LOGS_FILE = "logs.json"
-        self.SETTINGS_FILE = "settings.json"
-
-        # 全局文件夹路径
-        self.MARKDOWN_FILES_DIR = "./files"
-        self.NOTES_DIR = os.path.join(self.MARKDOWN_FILES_DIR, "notes")
-        self.IMAGES_DIR = os.path.join(self.MARKDOWN_FILES_DIR, "images")
-        self.JOURNALS_DIR = os.path.join(self.MARKDOWN_FILES_DIR, "journals")
-        self.MARKDOWN_TREE_FILE = os.path.join(self.NOTES_DIR, "file_tree.json")
+        markdown_files_dir = "./files"
+        notes_dir = os.path.join(markdown_files_dir, "notes")
+        GlobalConfigManager._current_paths.set({
+            "USERNAME": None,
+            "DATA_FILE": "./master_data.json",
+            "DATA_DIR": "./master_data",
+            "DATA_DB_FILE": "./master_data.db",
+            "LOGS_FILE": "logs.json",
+            "SETTINGS_FILE": "settings.json",
+
+            # 全局文件夹路径
+            "MARKDOWN_FILES_DIR": markdown_files_dir,
+            "NOTES_DIR": notes_dir,
+            "IMAGES_DIR": os.path.join(markdown_files_dir, "images"),
+            "JOURNALS_DIR": os.path.join(markdown_files_dir, "journals"),
+            "MARKDOWN_TREE_FILE": os.path.join(notes_dir, "file_tree.json"),
+        })
 
     def ensure_directories_exist(self):
         """确保所有必需的目录都存在"""
@@ -1940,37 +2112,78 @@ class GlobalConfigManager:
             for directory in dirs_to_create:
                 os.makedirs(directory, exist_ok=True)
         except Exception as e:
-            print(f"创建目录时出错: {e}")
+            data_logger.error("创建目录时出错: %s", e)
 
 # 创建全局配置管理器实例
 config_manager = GlobalConfigManager()
 
 
 # 用户系统初始化函数
+# 原子写入
+def dump_json_bytes(data):
+    """将数据序列化为UTF-8字节串（默认紧凑格式，见 JSON_PRETTY_PRINT）"""
+    if JSON_PRETTY_PRINT:
+        text = json.dumps(data, ensure_ascii=False, indent=2)
+    else:
+        text = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    return text.encode('utf-8')
+
+
+def write_file_atomic(path, content):
+    """先写入同目录下的临时文件并 fsync，再改名替换目标文件；任何时刻读到的都是完整文件"""
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix='.tmp')
+    try:
+        if hasattr(os, 'fchmod'):
+            # mkstemp 创建的文件权限为0600，沿用原文件权限
+            try:
+                mode = os.stat(path).st_mode & 0o777
+            except FileNotFoundError:
+                mode = 0o644
+            os.fchmod(fd, mode)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    # 同步目录项，保证改名在断电后依然有效
+    if hasattr(os, 'O_DIRECTORY'):
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def write_json_atomic(path, data):
+    """原子写入JSON文件"""
+    write_file_atomic(path, dump_json_bytes(data))
+
+
 def initialize_user_system():
     """初始化用户系统"""
     os.makedirs(USERS_DIR, exist_ok=True)
 
     # 如果用户数据库不存在，创建空文件
     if not os.path.exists(USERS_DB_FILE):
-        with open(USERS_DB_FILE, 'w') as f:
-            json.dump({}, f)
+        write_json_atomic(USERS_DB_FILE, {})
 
 # 在应用启动时调用初始化
 initialize_user_system()
 
 # 用户数据库操作函数
 def get_user_db():
-    """获取用户数据库"""
-    if os.path.exists(USERS_DB_FILE):
-        with open(USERS_DB_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
+    """获取用户数据库（副本）"""
+    return user_directory.all()
 
 def save_user_db(db):
     """保存用户数据库"""
-    with open(USERS_DB_FILE, 'w', encoding='utf-8') as f:
-        json.dump(db, f, ensure_ascii=False, indent=2)
+    user_directory.replace(db)
 
 
 
@@ -1988,13 +2201,14 @@ def init_user_data(username):
             shutil.copy(file, user_file)
         elif not os.path.exists(user_file):
             # 创建默认文件
-            with open(user_file, 'w', encoding='utf-8') as f:
-                if file == 'settings.json':
-                    # 使用 default_settings 创建默认设置文件
-                    json.dump(default_settings, f, ensure_ascii=False, indent=2)
-                elif file == 'master_data.json':
-                    # 使用 get_default_data 创建默认主数据文件
-                    json.dump(get_default_data(), f, ensure_ascii=False, indent=2)
+            if file == 'settings.json':
+                # 使用 default_settings 创建默认设置文件
+                write_json_atomic(user_file, default_settings)
+            elif file == 'master_data.json':
+                # 使用 get_default_data 创建默认主数据文件
+                write_json_atomic(user_file, get_default_data())
+            else:
+                open(user_file, 'w').close()
                 # elif file.endswith('.json'):
                 #     # 其他 JSON 文件创建空对象或数组
                 #     json.dump({} if file != 'logs.json' else {}, f, ensure_ascii=False, indent=2)
@@ -2050,43 +2264,345 @@ def generate_tokens_old(username):
     return access_token, refresh_token
 
 def generate_tokens(username, long_term=False):
-    """生成访问令牌和刷新令牌，支持长期登录选项"""
+    """生成访问令牌和刷新令牌，支持长期登录选项
+
+    每个令牌带唯一的 jti（用于单独吊销）和精确到小数的 iat（与用户的吊销水位线比较）。
+    """
+    now = datetime.utcnow()
+    issued_at = time.time()
+
+    def claims(**extra):
+        return {'username': username, 'iat': issued_at, 'jti': uuid.uuid4().hex, **extra}
+
     if long_term:
-        # 长期登录，使用14天过期时间
-        access_payload = {
-            'username': username,
-            'exp': datetime.utcnow() + JWT_LONG_TERM_EXPIRATION_DELTA,
-            'long_term': True  # 标记为长期登录
-        }
-        refresh_payload = {
-            'username': username,
-            'exp': datetime.utcnow() + JWT_LONG_TERM_EXPIRATION_DELTA
-        }
+        # 长期登录，使用365天过期时间
+        access_payload = claims(exp=now + JWT_LONG_TERM_EXPIRATION_DELTA, long_term=True)  # 标记为长期登录
+        refresh_payload = claims(exp=now + JWT_LONG_TERM_EXPIRATION_DELTA)
     else:
         # 普通登录，使用默认过期时间
-        access_payload = {
-            'username': username,
-            'exp': datetime.utcnow() + JWT_ACCESS_EXPIRATION_DELTA
-        }
-        refresh_payload = {
-            'username': username,
-            'exp': datetime.utcnow() + JWT_REFRESH_EXPIRATION_DELTA
-        }
+        access_payload = claims(exp=now + JWT_ACCESS_EXPIRATION_DELTA)
+        refresh_payload = claims(exp=now + JWT_REFRESH_EXPIRATION_DELTA)
 
     access_token = jwt.encode(access_payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
     refresh_token = jwt.encode(refresh_payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
     return access_token, refresh_token
 
+
+class TokenRevocationStore:
+    """令牌吊销记录
+
+    记录持久化在 SQLite 中，分两类：按用户的水位线（在此时间之前签发的令牌全部失效，改密码时写入），
+    以及单个令牌的 jti 拒绝列表（登出时写入，保留到令牌过期）。
+
+    每个进程在内存中持有一份副本。多个 gunicorn worker 之间通过 mmap 映射的 8 字节代数计数同步：
+    任一进程写入数据库后递增计数，其他进程在下次检查时发现计数变化才重新加载，
+    平常的检查只有一次计数读取和两次字典查找。
+    """
+
+    _GENERATION = struct.Struct('<Q')
+
+    def __init__(self, path):
+        self.path = path
+        self.generation_path = f"{path}.gen"
+        self._lock = threading.Lock()
+        self._map = None
+        self._generation = None  # 内存副本对应的代数
+        self._watermarks = {}  # 用户名 -> 水位线时间戳
+        self._denied = {}  # jti -> exp
+        self.reloads = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _open(self):
+        """首次使用时创建数据库和代数文件（导入模块时不触碰磁盘）"""
+        with self._lock:
+            if self._map is not None:
+                return self._map
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with closing(self._connect()) as conn, conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS user_watermarks ("
+                             "username TEXT PRIMARY KEY, not_before REAL NOT NULL)")
+                conn.execute("CREATE TABLE IF NOT EXISTS denied_tokens ("
+                             "jti TEXT PRIMARY KEY, exp REAL NOT NULL)")
+            fd = os.open(self.generation_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if os.fstat(fd).st_size < self._GENERATION.size:
+                    os.ftruncate(fd, self._GENERATION.size)
+                self._map = mmap.mmap(fd, self._GENERATION.size)
+            finally:
+                os.close(fd)
+            return self._map
+
+    def _reload(self, generation):
+        with self._lock:
+            if self._generation == generation:
+                return
+            with closing(self._connect()) as conn:
+                watermarks = dict(conn.execute("SELECT username, not_before FROM user_watermarks"))
+                denied = dict(conn.execute("SELECT jti, exp FROM denied_tokens WHERE exp > ?", (time.time(),)))
+            # 整体替换引用，检查方无需加锁
+            self._watermarks = watermarks
+            self._denied = denied
+            # 记录加载前读到的代数：加载期间若有新的写入，下次检查时还会再加载一次
+            self._generation = generation
+            self.reloads += 1
+
+    def _bump(self):
+        """数据库提交之后递增代数，通知其他进程重新加载"""
+        mm = self._map or self._open()
+        with data_locks.acquire(self.generation_path, exclusive=True):
+            self._GENERATION.pack_into(mm, 0, self._GENERATION.unpack_from(mm)[0] + 1)
+
+    def is_revoked(self, payload):
+        """判断已通过签名校验的令牌载荷是否被吊销"""
+        generation = self._GENERATION.unpack_from(self._map or self._open())[0]
+        if generation != self._generation:
+            self._reload(generation)
+        watermark = self._watermarks.get(payload.get('username'))
+        if watermark is not None and payload.get('iat', 0) < watermark:
+            return True
+        return payload.get('jti') in self._denied
+
+    def deny(self, jti, exp):
+        """吊销单个令牌，记录保留到令牌过期"""
+        self._open()
+        with closing(self._connect()) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO denied_tokens (jti, exp) VALUES (?, ?)", (jti, exp))
+            # 顺便清理已过期的记录
+            conn.execute("DELETE FROM denied_tokens WHERE exp <= ?", (time.time(),))
+        self._bump()
+
+    def revoke_user(self, username):
+        """使该用户此前签发的所有令牌（包括长期令牌）失效，返回水位线时间戳"""
+        self._open()
+        not_before = time.time()
+        # 比最长的令牌有效期还早的水位线已不起作用
+        stale_before = not_before - JWT_LONG_TERM_EXPIRATION_DELTA.total_seconds()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT INTO user_watermarks (username, not_before) VALUES (?, ?) "
+                "ON CONFLICT(username) DO UPDATE SET not_before = MAX(not_before, excluded.not_before)",
+                (username, not_before))
+            conn.execute("DELETE FROM user_watermarks WHERE not_before < ?", (stale_before,))
+        self._bump()
+        return not_before
+
+    def stats(self):
+        """获取吊销记录统计"""
+        return {
+            "pid": os.getpid(),
+            "generation": self._generation,
+            "reloads": self.reloads,
+            "user_watermarks": len(self._watermarks),
+            "denied_tokens": len(self._denied),
+        }
+
+
+token_revocations = TokenRevocationStore(TOKEN_REVOCATIONS_FILE)
+
+
+class TokenCache:
+    """已验证令牌的 LRU 缓存
+
+    以令牌摘要为键缓存解码后的载荷，条目在令牌自身的 exp 到期后失效；命中时跳过 jwt.decode
+    （HMAC 校验、JSON 解析和声明校验）。传入吊销记录时，命中与未命中都会检查吊销。
+    """
+
+    def __init__(self, max_entries, revocations=None):
+        self._entries = OrderedDict()  # 摘要 -> (exp, payload)
+        self._lock = threading.Lock()
+        self._max_entries = max_entries
+        self.revocations = revocations
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejected = 0
+
+    @staticmethod
+    def digest(token):
+        return hashlib.blake2b(token.encode('utf-8'), digest_size=16).digest()
+
+    def _check(self, payload):
+        if self.revocations is not None and self.revocations.is_revoked(payload):
+            self.rejected += 1
+            return None
+        return payload
+
+    def decode(self, token):
+        """返回令牌载荷，令牌无效、过期或已吊销时返回 None"""
+        key = self.digest(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                entry = None
+                self.misses += 1
+        if entry is not None:
+            return self._check(entry[1])
+
+        try:
+            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        except jwt.InvalidTokenError:  # 包括 ExpiredSignatureError
+            with self._lock:
+                self._entries.pop(key, None)
+            return None
+
+        # 早期签发的令牌没有 jti，用令牌摘要代替，登出时同样可以单独吊销
+        payload.setdefault('jti', key.hex())
+        exp = payload.get('exp')
+        if exp is not None:
+            with self._lock:
+                self._entries[key] = (exp, payload)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self._max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return self._check(payload)
+
+    def revoke(self, token):
+        """吊销单个令牌，对所有进程生效并在重启后保留，直到令牌过期"""
+        payload = self.decode(token)
+        if payload is None or 'exp' not in payload:
+            return False
+        with self._lock:
+            self._entries.pop(self.digest(token), None)
+        if self.revocations is not None:
+            self.revocations.deny(payload['jti'], payload['exp'])
+        return True
+
+    def stats(self):
+        """获取缓存命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            stats = {
+                "pid": os.getpid(),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "rejected": self.rejected,
+            }
+        if self.revocations is not None:
+            stats["revocations"] = self.revocations.stats()
+        return stats
+
+
+token_cache = TokenCache(TOKEN_CACHE_MAX_ENTRIES,
+                         revocations=token_revocations if TOKEN_REVOCATION_ENABLED else None)
+
+
 def verify_token(token):
     """验证JWT令牌"""
-    try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload['username']
-    except jwt.ExpiredSignatureError:
-        return None
-    except jwt.InvalidTokenError:
-        return None
+    payload = token_cache.decode(token)
+    return payload.get('username') if payload is not None else None
+
+
+# 密码哈希
+class PasswordHasherBusy(Exception):
+    """排队等待密码哈希的请求超过上限"""
+
+
+class PasswordHasher:
+    """bcrypt 密码哈希与校验
+
+    计算放在固定大小的线程池中进行（bcrypt 计算期间释放 GIL），同时进行的哈希不超过池的大小，
+    登录高峰时其他接口仍有 CPU 可用；排队数超过上限时直接拒绝，由调用方返回 503。
+    """
+
+    def __init__(self, rounds, workers, max_queue):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self.pending = 0
+        self.max_pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self.total_ns = 0
+
+    def _run(self, fn, *args):
+        """在哈希线程池中执行并等待结果"""
+        with self._lock:
+            if self.pending >= self.max_queue:
+                self.rejected += 1
+                raise PasswordHasherBusy()
+            self.pending += 1
+            self.max_pending = max(self.max_pending, self.pending)
+            # fork 出的子进程不能沿用父进程的线程池
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+                self._pid = os.getpid()
+            executor = self._executor
+
+        start = time.perf_counter_ns()
+        try:
+            return executor.submit(fn, *args).result()
+        finally:
+            with self._lock:
+                self.pending -= 1
+                self.completed += 1
+                self.total_ns += time.perf_counter_ns() - start
+
+    def hash(self, password):
+        """计算密码哈希"""
+        hashed = self._run(bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(self.rounds))
+        return hashed.decode('utf-8')
+
+    def rehash(self, password):
+        """按当前配置重新哈希（登录时升级旧哈希）"""
+        with self._lock:
+            self.rehashed += 1
+        return self.hash(password)
+
+    def verify(self, password, stored_hash):
+        """校验密码，兼容早期版本保存的 SHA256 哈希"""
+        if stored_hash.startswith('$2'):
+            try:
+                return self._run(bcrypt.checkpw, password.encode('utf-8'), stored_hash.encode('utf-8'))
+            except ValueError:
+                return False
+        return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored_hash)
+
+    def needs_rehash(self, stored_hash):
+        """存储的哈希不是 bcrypt 或计算强度与当前配置不同时需要重新哈希"""
+        parts = stored_hash.split('$')  # $2b$12$<salt+hash>
+        return not stored_hash.startswith('$2') or len(parts) < 4 or parts[2] != f"{self.rounds:02d}"
+
+    def stats(self):
+        """获取哈希队列统计"""
+        with self._lock:
+            return {
+                "rounds": self.rounds,
+                "workers": self.workers,
+                "queue_depth": self.pending,
+                "max_queue_depth": self.max_pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "rehashed": self.rehashed,
+                "avg_ms": round(self.total_ns / self.completed / 1e6, 1) if self.completed else 0.0,
+            }
+
+
+password_hasher = PasswordHasher(BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_QUEUE)
+
+
+@app.errorhandler(PasswordHasherBusy)
+def handle_password_hasher_busy(e):
+    """密码哈希排队过多时让客户端稍后重试"""
+    response = jsonify({"error": "服务繁忙，请稍后重试"})
+    response.headers["Retry-After"] = "1"
+    return response, 503
 
 
 # 认证装饰器
@@ -2103,15 +2619,18 @@ def token_required(optional=False):
                 # 移除Bearer前缀
                 if token.startswith('Bearer '):
                     token = token[7:]
-                username = verify_token(token)
+                payload = token_cache.decode(token)
+                username = payload.get('username') if payload is not None else None
 
             if username is not None:
-                # 将用户名添加到请求上下文
+                # 将用户名和令牌添加到请求上下文
                 request.current_user = username
+                request.access_token = token
+                request.token_payload = payload
 
-                # 根据用户身份设置全局配置
+                # 设置本次请求的用户上下文
                 config_manager.set_current_user(username)
-                print(f"当前用户: {username} - {config_manager.DATA_FILE}/{config_manager.IMAGES_DIR}/{config_manager.JOURNALS_DIR}")
+                request_logger.debug("当前用户: %s - %s/%s/%s", username, config_manager.DATA_FILE, config_manager.IMAGES_DIR, config_manager.JOURNALS_DIR)
 
             # 如果认证是可选的，或者用户已认证，则继续执行
             if optional or username:
@@ -2123,6 +2642,12 @@ def token_required(optional=False):
 
     return decorator
 
+
+@app.teardown_request
+def clear_user_context(exc):
+    """请求结束时清除用户上下文，避免线程被复用时下一个请求读到上一个用户"""
+    config_manager.set_current_user(None)
+
 # 修改数据访问函数以支持用户隔离
 # def get_data_file_path(username=None):
 #     """获取数据文件路径"""
@@ -2143,99 +2668,1550 @@ def token_required(optional=False):
 #     return LOGS_FILE
 
 
-# 修改load_data函数以支持用户隔离
-def load_data(allow_default=True):
-    """从文件加载数据"""
-    global _executing_auto_tasks
-    try:
-        data = None
+# 跨进程读写锁
+class DataLockManager:
+    """基于 fcntl.flock 的按用户读写锁，协调多个 gunicorn 工作进程对同一用户文件的读写
 
-        if os.path.exists(config_manager.DATA_FILE):
-            with open(config_manager.DATA_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+    用户目录下的文件共用 users/<用户名>/.lock，其他文件（如 users.json）使用同名 .lock 文件。
+    读操作加共享锁可以并发执行，写操作加排他锁互相串行。同一线程可重入；
+    持有共享锁时再申请排他锁会就地升级，退出时降回共享锁。
+    """
 
-            # 确保所有必需的字段都存在
-            stats = data.get("stats", generate_default_stats())
-            properties = data.get("properties", generate_default_properties())
-            credits = data.get("credits", generate_default_credits())
-            items = data.get("items", generate_default_items())
-            backpack = data.get("backpack", {item: 0 for item in items})
-            # conversion_rates = data.get("conversion_rates", generate_default_conversion_rates())
-            tasks = data.get("tasks", generate_default_tasks())
-            lootbox_miss_counts = data.get("lootbox_miss_counts", {})
-
-            # 处理旧数据兼容性
-            for task in tasks:
-                if "task_type" not in task:
-                    task["task_type"] = "无循环"
-                if "completed_count" not in task:
-                    task["completed_count"] = 0
-                if "max_completions" not in task:
-                    task["max_completions"] = 0
+    def __init__(self):
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            mode: {"acquisitions": 0, "contended": 0, "wait_ns": 0, "max_wait_ns": 0}
+            for mode in ("shared", "exclusive")
+        }
 
-            result = {
-                "stats": stats,
-                "properties": properties,
-                "credits": credits,
-                "items": items,
-                "backpack": backpack,
-                # "conversion_rates": conversion_rates,
-                "tasks": tasks,
-                "lootbox_miss_counts":lootbox_miss_counts
-            }
+    @staticmethod
+    def lock_path(path):
+        users_dir = os.path.abspath(USERS_DIR)
+        path = os.path.abspath(path)
+        rel = os.path.relpath(path, users_dir)
+        if not rel.startswith(os.pardir) and os.sep in rel:
+            return os.path.join(users_dir, rel.split(os.sep, 1)[0], '.lock')
+        return f"{path}.lock"
+
+    def _flock(self, fd, exclusive):
+        """加锁并记录等待时间"""
+        mode = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+        start = time.perf_counter_ns()
+        try:
+            fcntl.flock(fd, mode | fcntl.LOCK_NB)
+            contended = False
+        except BlockingIOError:
+            fcntl.flock(fd, mode)
+            contended = True
+        waited = time.perf_counter_ns() - start
+        with self._stats_lock:
+            stats = self._stats["exclusive" if exclusive else "shared"]
+            stats["acquisitions"] += 1
+            stats["contended"] += contended
+            stats["wait_ns"] += waited
+            stats["max_wait_ns"] = max(stats["max_wait_ns"], waited)
+
+    @contextmanager
+    def acquire(self, path, exclusive=False):
+        """对 path 所属的用户加共享锁或排他锁"""
+        if fcntl is None:
+            yield
+            return
 
-            # 在加载数据后执行自动任务检查（仅在非递归调用时执行）
-            if not _executing_auto_tasks:
-                _executing_auto_tasks = True
-                try:
-                    execute_daily_auto_tasks()
-                finally:
-                    _executing_auto_tasks = False
+        lock_path = self.lock_path(path)
+        held = self._local.__dict__.setdefault("held", {})  # lock_path -> [fd, exclusive, depth]
+        entry = held.get(lock_path)
+        if entry is not None:
+            upgrade = exclusive and not entry[1]
+            if upgrade:
+                self._flock(entry[0], exclusive=True)
+                entry[1] = True
+            entry[2] += 1
+            try:
+                yield
+            finally:
+                entry[2] -= 1
+                if upgrade:
+                    fcntl.flock(entry[0], fcntl.LOCK_SH)
+                    entry[1] = False
+            return
 
+        try:
+            fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+            fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            self._flock(fd, exclusive)
+            held[lock_path] = [fd, exclusive, 1]
+            try:
+                yield
+            finally:
+                del held[lock_path]
+        finally:
+            # 关闭文件描述符即释放锁
+            os.close(fd)
+
+    def stats(self):
+        """获取锁等待统计"""
+        with self._stats_lock:
+            result = {}
+            for mode, stats in self._stats.items():
+                count = stats["acquisitions"]
+                result[mode] = {
+                    "acquisitions": count,
+                    "contended": stats["contended"],
+                    "avg_wait_ms": round(stats["wait_ns"] / count / 1e6, 3) if count else 0.0,
+                    "max_wait_ms": round(stats["max_wait_ns"] / 1e6, 3),
+                }
             return result
+
+
+data_locks = DataLockManager()
+
+
+# 主数据进程内缓存
+class MasterDataCache:
+    """按用户数据文件缓存解析后的主数据
+
+    缓存键为 (mtime_ns, size, inode)，其他 gunicorn 工作进程写入文件后键随之变化，
+    因此无需进程间通信即可保证读到最新数据。缓存内容以 marshal 字节串保存，
+    每次命中都返回一份独立副本，调用方可以随意修改。
+    """
+
+    def __init__(self, max_entries=64):
+        self._entries = OrderedDict()  # path -> (key, racy, blob)
+        self._lock = threading.Lock()
+        self._max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def file_key(path):
+        """获取文件的缓存键"""
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def get(self, path, key):
+        """缓存命中时返回数据副本，否则返回None"""
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry[0] != key or entry[1]:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(path)
+            self.hits += 1
+            blob = entry[2]
+        return marshal.loads(blob)
+
+    def put(self, path, key, data, exact=False):
+        """写入缓存（key 必须在读取文件之前获取）
+
+        exact=True 表示 key 在每次写入后必然变化（如只追加的日志长度），无需时间戳防护。
+        """
+        try:
+            blob = marshal.dumps(data)
+        except ValueError:
+            # 含有无法序列化的对象时放弃缓存
+            self.invalidate(path)
+            return
+        # 文件在缓存写入前不久才被修改时，同一时间戳内可能发生过第二次同尺寸写入，不信任该缓存
+        racy = not exact and time.time_ns() - key[0] < MASTER_DATA_CACHE_RACY_NS
+        with self._lock:
+            self._entries[path] = (key, racy, blob)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def rekey(self, path, old_key, new_key):
+        """文件键变化但缓存内容不受影响时（如日志追加了与该分区无关的记录）沿用原缓存"""
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == old_key:
+                self._entries[path] = (new_key, entry[1], entry[2])
+
+    def invalidate(self, path):
+        """使指定文件的缓存失效"""
+        with self._lock:
+            if self._entries.pop(path, None) is not None:
+                self.invalidations += 1
+
+    def stats(self):
+        """获取缓存命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "pid": os.getpid(),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "invalidations": self.invalidations,
+                "entries": [
+                    {"path": path, "bytes": len(entry[2])}
+                    for path, entry in self._entries.items()
+                ],
+            }
+
+
+master_data_cache = MasterDataCache(MASTER_DATA_CACHE_MAX_ENTRIES)
+
+
+# 用户目录
+class UserDirectory:
+    """users.json 的进程内缓存
+
+    解析后的用户表按文件键 (mtime_ns, size, inode) 缓存，其他工作进程修改文件后会自动重新读取，
+    权限检查等只读操作直接使用内存中的数据。所有修改都在 users.json 的排他锁内基于最新内容进行，
+    并原子写回文件。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._key = None
+        self._racy = True
+        self._users = {}
+
+    def _remember(self, key, users):
+        with self._lock:
+            self._key = key
+            # 与主数据缓存相同，文件刚被修改时时间戳可能不足以区分两次写入，暂不信任缓存
+            self._racy = time.time_ns() - key[0] < MASTER_DATA_CACHE_RACY_NS
+            self._users = users
+
+    def _load(self):
+        """获取最新的用户表（共享的只读对象，调用方不能修改）"""
+        try:
+            key = MasterDataCache.file_key(self.path)
+        except FileNotFoundError:
+            return {}
+        with self._lock:
+            if key == self._key and not self._racy:
+                return self._users
+
+        with data_locks.acquire(self.path):
+            try:
+                key = MasterDataCache.file_key(self.path)
+            except FileNotFoundError:
+                return {}
+            with open(self.path, 'r', encoding='utf-8') as f:
+                users = json.load(f)
+        self._remember(key, users)
+        return users
+
+    def all(self):
+        """获取整个用户表的副本"""
+        return marshal.loads(marshal.dumps(self._load()))
+
+    def usernames(self):
+        """获取所有用户名"""
+        return list(self._load())
+
+    def exists(self, username):
+        """用户是否存在"""
+        return username in self._load()
+
+    def get(self, username):
+        """获取用户记录的副本，用户不存在时返回 None"""
+        record = self._load().get(username)
+        return marshal.loads(marshal.dumps(record)) if record is not None else None
+
+    def permissions(self, username):
+        """获取用户权限列表"""
+        record = self._load().get(username)
+        return list(record.get('permissions', [])) if record is not None else []
+
+    def _write(self, users):
+        """写回用户表（调用方需持有排他锁）"""
+        write_json_atomic(self.path, users)
+        self._remember(MasterDataCache.file_key(self.path), marshal.loads(marshal.dumps(users)))
+
+    @contextmanager
+    def transaction(self):
+        """在排他锁内读取最新用户表供修改，退出时如有变化则原子写回"""
+        with data_locks.acquire(self.path, exclusive=True):
+            users = self.all()
+            before = marshal.dumps(users)
+            yield users
+            if marshal.dumps(users) != before:
+                self._write(users)
+
+    def add(self, username, record):
+        """新增用户，用户名已存在时返回 False"""
+        with self.transaction() as users:
+            if username in users:
+                return False
+            users[username] = record
+        return True
+
+    def update(self, username, **fields):
+        """更新用户记录的字段，用户不存在时返回 False"""
+        with self.transaction() as users:
+            if username not in users:
+                return False
+            users[username].update(fields)
+        return True
+
+    def delete(self, username):
+        """删除用户，用户不存在时返回 False"""
+        with self.transaction() as users:
+            if username not in users:
+                return False
+            del users[username]
+        return True
+
+    def replace(self, users):
+        """整体替换用户表"""
+        with data_locks.acquire(self.path, exclusive=True):
+            self._write(users)
+
+    def add_many(self, records):
+        """批量新增用户；任一用户名已存在时不做修改，返回已存在的用户名列表"""
+        with self.transaction() as users:
+            existing = [username for username in records if username in users]
+            if not existing:
+                users.update(records)
+        return existing
+
+    def list_users(self, query=None, offset=0, limit=None):
+        """按注册顺序分页列出用户，query 按用户名模糊匹配（不区分大小写），返回 (总数, [(用户名, 记录)])"""
+        users = self._load()
+        names = list(users)
+        if query:
+            query = query.lower()
+            names = [name for name in names if query in name.lower()]
+        page = names[offset:] if limit is None else names[offset:offset + limit]
+        return len(names), [(name, marshal.loads(marshal.dumps(users[name]))) for name in page]
+
+
+class SqliteUserRegistry:
+    """SQLite 用户注册表：users/users.db，用户名为主键
+
+    注册、修改都只写入一行，并发注册依靠主键约束去重，用户数量再多也无需重写整个文件。
+    数据库不存在而 users.json 中已有用户时，首次打开会自动导入。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            password TEXT NOT NULL,
+            permissions TEXT NOT NULL,
+            created_at TEXT,
+            extra TEXT NOT NULL
+        );
+    """
+    COLUMNS = ("password", "permissions", "created_at")
+
+    def __init__(self, path, legacy_file=None):
+        self.path = path
+        self.legacy_file = legacy_file
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        """获取本线程的数据库连接（fork 后重新连接）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    if not os.path.exists(self.path) and self.legacy_file and os.path.exists(self.legacy_file):
+                        import_users_json_to_sqlite(self.legacy_file, self.path)
+                    self._initialized = True
+
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(self.SCHEMA)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _write_transaction(self):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @classmethod
+    def _row(cls, username, record):
+        """用户记录 -> 表中的一行"""
+        extra = {key: value for key, value in record.items() if key not in cls.COLUMNS}
+        return (username, record.get("password", ""), json.dumps(record.get("permissions", []), ensure_ascii=False),
+                record.get("created_at"), json.dumps(extra, ensure_ascii=False))
+
+    @staticmethod
+    def _record(row):
+        """表中的一行 -> 用户记录"""
+        password, permissions, created_at, extra = row
+        record = {"password": password, "permissions": json.loads(permissions), "created_at": created_at}
+        record.update(json.loads(extra))
+        return record
+
+    def all(self):
+        """获取整个用户表"""
+        rows = self._connect().execute(
+            "SELECT username, password, permissions, created_at, extra FROM users ORDER BY rowid").fetchall()
+        return {row[0]: self._record(row[1:]) for row in rows}
+
+    def usernames(self):
+        """获取所有用户名"""
+        return [row[0] for row in self._connect().execute("SELECT username FROM users ORDER BY rowid")]
+
+    def exists(self, username):
+        """用户是否存在"""
+        return self._connect().execute("SELECT 1 FROM users WHERE username = ?", (username,)).fetchone() is not None
+
+    def get(self, username):
+        """获取用户记录，用户不存在时返回 None"""
+        row = self._connect().execute(
+            "SELECT password, permissions, created_at, extra FROM users WHERE username = ?", (username,)).fetchone()
+        return self._record(row) if row is not None else None
+
+    def permissions(self, username):
+        """获取用户权限列表"""
+        row = self._connect().execute("SELECT permissions FROM users WHERE username = ?", (username,)).fetchone()
+        return json.loads(row[0]) if row is not None else []
+
+    def add(self, username, record):
+        """新增用户，用户名已存在时返回 False"""
+        try:
+            with self._write_transaction() as conn:
+                conn.execute("INSERT INTO users VALUES (?, ?, ?, ?, ?)", self._row(username, record))
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def add_many(self, records):
+        """批量新增用户；任一用户名已存在时不做修改，返回已存在的用户名列表"""
+        with self._write_transaction() as conn:
+            existing = [username for username in records
+                        if conn.execute("SELECT 1 FROM users WHERE username = ?", (username,)).fetchone()]
+            if not existing:
+                conn.executemany("INSERT INTO users VALUES (?, ?, ?, ?, ?)",
+                                 [self._row(username, record) for username, record in records.items()])
+        return existing
+
+    def update(self, username, **fields):
+        """更新用户记录的字段，用户不存在时返回 False"""
+        with self._write_transaction() as conn:
+            row = conn.execute("SELECT password, permissions, created_at, extra FROM users WHERE username = ?",
+                               (username,)).fetchone()
+            if row is None:
+                return False
+            record = self._record(row)
+            record.update(fields)
+            conn.execute("UPDATE users SET password = ?, permissions = ?, created_at = ?, extra = ? WHERE username = ?",
+                         self._row(username, record)[1:] + (username,))
+        return True
+
+    def delete(self, username):
+        """删除用户，用户不存在时返回 False"""
+        with self._write_transaction() as conn:
+            return conn.execute("DELETE FROM users WHERE username = ?", (username,)).rowcount > 0
+
+    def replace(self, users):
+        """整体替换用户表"""
+        with self._write_transaction() as conn:
+            conn.execute("DELETE FROM users")
+            conn.executemany("INSERT INTO users VALUES (?, ?, ?, ?, ?)",
+                             [self._row(username, record) for username, record in users.items()])
+
+    def list_users(self, query=None, offset=0, limit=None):
+        """按注册顺序分页列出用户，query 按用户名模糊匹配（不区分大小写），返回 (总数, [(用户名, 记录)])"""
+        where, params = "", ()
+        if query:
+            escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            where, params = "WHERE username LIKE ? ESCAPE '\\'", (f"%{escaped}%",)
+        conn = self._connect()
+        total = conn.execute(f"SELECT COUNT(*) FROM users {where}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT username, password, permissions, created_at, extra FROM users {where} "
+            f"ORDER BY rowid LIMIT ? OFFSET ?", params + (-1 if limit is None else limit, offset)).fetchall()
+        return total, [(row[0], self._record(row[1:])) for row in rows]
+
+
+def import_users_json_to_sqlite(json_file, db_file):
+    """把 users.json 中的用户导入 SQLite 用户注册表，已存在的用户名跳过，返回 (导入数, 跳过数)"""
+    with data_locks.acquire(json_file):
+        with open(json_file, 'r', encoding='utf-8') as f:
+            users = json.load(f)
+
+    registry = SqliteUserRegistry(db_file)
+    imported, skipped = 0, 0
+    with registry._write_transaction() as conn:
+        for username, record in users.items():
+            cursor = conn.execute("INSERT OR IGNORE INTO users VALUES (?, ?, ?, ?, ?)",
+                                  SqliteUserRegistry._row(username, record))
+            if cursor.rowcount:
+                imported += 1
+            else:
+                skipped += 1
+    auth_logger.info("已导入 %s 个用户到 %s（跳过已存在的 %s 个）", imported, db_file, skipped)
+    return imported, skipped
+
+
+def create_user_directory():
+    """根据配置创建用户目录"""
+    if USER_REGISTRY_BACKEND == 'sqlite':
+        return SqliteUserRegistry(USERS_SQLITE_FILE, legacy_file=USERS_DB_FILE)
+    return UserDirectory(USERS_DB_FILE)
+
+
+user_directory = create_user_directory()
+
+
+# 主数据分区（json后端每个分区一个文件）
+MASTER_DATA_SECTIONS = ("stats", "properties", "credits", "items", "backpack", "tasks",
+                        "lootbox_miss_counts", "auto_task_log", "task_meta")
+# 修改任务时须同时读取的分区（task_meta 保存下一个任务ID、任务修订号和删除记录）
+TASK_SECTIONS = ("tasks", "task_meta")
+TASK_TOMBSTONES_MAX = 1000  # 保留的任务删除记录数，更早的删除只能通过全量同步获知
+
+
+# 主数据结构版本迁移
+# 每个迁移函数把主数据从上一个版本升级到注册的版本（原地修改），每个用户只执行一次，结果随版本号一起持久化。
+# 迁移函数必须可以重复执行（恢复旧备份或导入旧数据时可能再次执行）。
+MASTER_DATA_SCHEMA_VERSION = 4
+MASTER_DATA_MIGRATIONS = []  # [(目标版本, 迁移函数)]，按版本升序
+
+
+def master_data_migration(version):
+    """注册把主数据升级到 version 的迁移函数"""
+    def decorator(func):
+        MASTER_DATA_MIGRATIONS.append((version, func))
+        MASTER_DATA_MIGRATIONS.sort(key=lambda migration: migration[0])
+        return func
+    return decorator
+
+
+def upgrade_master_data(data, schema_version):
+    """依次执行高于 schema_version 的迁移，返回升级后的数据"""
+    for version, migrate in MASTER_DATA_MIGRATIONS:
+        if version > schema_version:
+            migrate(data)
+    return data
+
+
+@master_data_migration(1)
+def migrate_fill_missing_fields(data):
+    """补全缺失的分区，并为旧任务补充 task_type、completed_count、max_completions"""
+    data.setdefault("stats", generate_default_stats())
+    data.setdefault("properties", generate_default_properties())
+    data.setdefault("credits", generate_default_credits())
+    items = data.setdefault("items", generate_default_items())
+    data.setdefault("backpack", {item: 0 for item in items})
+    data.setdefault("tasks", generate_default_tasks())
+    data.setdefault("lootbox_miss_counts", {})
+
+    for task in data["tasks"]:
+        task.setdefault("task_type", "无循环")
+        task.setdefault("completed_count", 0)
+        task.setdefault("max_completions", 0)
+
+
+def next_task_id_after(tasks):
+    """现有任务之后的第一个空闲ID"""
+    return max((task.get("id") for task in tasks if isinstance(task.get("id"), int)), default=0) + 1
+
+
+@master_data_migration(2)
+def migrate_task_ids(data):
+    """为重复的任务ID重新编号（旧版CSV导入按任务数生成ID，可能与已有任务冲突），并记录下一个任务ID"""
+    tasks = data.setdefault("tasks", [])
+    next_id = next_task_id_after(tasks)
+    seen = set()
+    for task in tasks:
+        if task.get("id") in seen:
+            task["id"] = next_id
+            next_id += 1
+        seen.add(task.get("id"))
+    task_meta = data.setdefault("task_meta", {})
+    task_meta["next_task_id"] = max(task_meta.get("next_task_id", 0), next_id)
+
+
+@master_data_migration(3)
+def migrate_task_revisions(data):
+    """为任务补充修订号 updated_rev，并初始化任务修订号计数与删除记录"""
+    tasks = data.setdefault("tasks", [])
+    for task in tasks:
+        task.setdefault("updated_rev", 1)
+    task_meta = data.setdefault("task_meta", {})
+    task_meta["rev"] = max(task_meta.get("rev", 0), 1)
+    task_meta.setdefault("tombstones", [])
+    task_meta.setdefault("tombstone_floor", 0)
+
+
+@master_data_migration(4)
+def migrate_cycle_reset_schedule(data):
+    """为循环任务计算下次重置时间 next_reset_at，并建立重置时间的最小堆"""
+    tasks = data.setdefault("tasks", [])
+    for task in tasks:
+        schedule_cycle_task(task)
+    data.setdefault("task_meta", {})["reset_heap"] = build_cycle_reset_heap(tasks)
+
+
+# 完整性检查关注的关键字段
+INTEGRITY_KEY_FIELDS = ("items", "tasks")
+
+
+def content_counts(data):
+    """统计各关键字段的数据项数量"""
+    counts = {}
+    for field in INTEGRITY_KEY_FIELDS:
+        value = data.get(field, {})
+        if isinstance(value, (dict, list)):
+            counts[field] = len(value)
         else:
-            # 使用动态生成的默认数据
-            if allow_default:
-                print("数据文件不存在，已启用默认数据")
-                result = get_default_data()
+            counts[field] = 1 if value else 0
+    return counts
+
+
+class MasterDocument(dict):
+    """load_data 返回的主数据，附带加载时的版本号、分区范围和各关键字段的数据项数量
+
+    safe_save_data 以数量为基线做完整性检查，无需再次读取文件；
+    保存时以版本号检查数据在此期间是否被其他请求修改。
+    """
+
+    def __init__(self, data, version=None, sections=None):
+        super().__init__(data)
+        self.version = version
+        self.sections = sections  # 只加载了部分分区时保存也只涉及这些分区
+        self.baseline = content_counts(self)
+        self._task_index = None
+        self._task_index_key = None  # (任务列表, 长度)，列表被替换或在别处增删时重建索引
+
+    def _tasks_by_id(self):
+        """任务ID -> 任务 的索引，首次使用时建立，之后随 append_task、remove_task 维护"""
+        tasks = self.setdefault("tasks", [])
+        key = self._task_index_key
+        if key is None or key[0] is not tasks or key[1] != len(tasks):
+            index = {}
+            for task in tasks:
+                index.setdefault(task.get("id"), task)
+            self._task_index = index
+            self._task_index_key = (tasks, len(tasks))
+        return self._task_index
+
+    def find_task(self, task_id):
+        """按ID查找任务，不存在时返回 None"""
+        return self._tasks_by_id().get(task_id)
+
+    def allocate_task_id(self, preferred=None):
+        """分配新的任务ID
+
+        ID 由 task_meta 中的计数器单调递增分配，删除的任务ID不会被重用；
+        preferred 未被占用时直接使用（客户端自带ID的情况）。已移入归档分段的任务ID同样视为已占用。
+        """
+        index = self._tasks_by_id()
+        archived = get_task_archive().taken_ids()
+        task_meta = self.setdefault("task_meta", {})
+        next_id = task_meta.get("next_task_id") or next_task_id_after(self["tasks"])
+        if preferred and preferred not in index and str(preferred) not in archived:
+            if isinstance(preferred, int) and preferred >= next_id:
+                task_meta["next_task_id"] = preferred + 1
+            return preferred
+        # 整体导入或恢复的数据可能已经用到计数器之后的ID
+        while next_id in index or str(next_id) in archived:
+            next_id += 1
+        task_meta["next_task_id"] = next_id + 1
+        return next_id
+
+    def append_task(self, task):
+        """追加任务并更新索引"""
+        index = self._tasks_by_id()
+        tasks = self["tasks"]
+        tasks.append(task)
+        index.setdefault(task.get("id"), task)
+        self._task_index_key = (tasks, len(tasks))
+
+    def remove_task(self, task_id):
+        """按ID删除任务，返回被删除的任务，不存在时返回 None"""
+        index = self._tasks_by_id()
+        task = index.pop(task_id, None)
+        if task is None:
+            return None
+        tasks = self["tasks"]
+        del tasks[next(pos for pos, item in enumerate(tasks) if item is task)]
+        self._task_index_key = (tasks, len(tasks))
+        return task
+
+
+class VersionConflict(Exception):
+    """保存时数据版本与加载时不一致"""
+
+    def __init__(self, expected_version, current_version):
+        super().__init__(f"数据版本冲突: 期望 {expected_version}，当前 {current_version}")
+        self.expected_version = expected_version
+        self.current_version = current_version
+
+
+# 主数据变更记录
+# 每条变更记录是一个操作列表，操作格式：
+#   ["put", 分区, 值]          整体替换分区
+#   ["drop", 分区]             删除分区
+#   ["set", 分区, 键, 值]      设置字典分区中的一个键
+#   ["del", 分区, 键]          删除字典分区中的一个键
+#   ["task", 任务]             按ID更新任务，不存在时追加到末尾
+#   ["task_del", 任务ID]       按ID删除任务
+def _is_append_only_order(old_keys, new_keys):
+    """判断新序列是否等于旧序列删去部分元素后再在末尾追加新元素"""
+    old_set = set(old_keys)
+    kept = [key for key in new_keys if key in old_set]
+    new_set = set(new_keys)
+    if kept != [key for key in old_keys if key in new_set]:
+        return False
+    # 新增的元素必须全部位于保留元素之后
+    if kept:
+        last_kept = len(new_keys) - 1 - new_keys[::-1].index(kept[-1])
+        return all(key in old_set for key in new_keys[:last_kept])
+    return True
 
-                # 保存默认数据到文件
-                if not save_data(result):
-                    print(f"保存默认数据失败: {config_manager.DATA_FILE}")
 
-                # 对于新数据也执行自动任务检查
-                if not _executing_auto_tasks:
-                    _executing_auto_tasks = True
-                    try:
-                        execute_daily_auto_tasks()
-                    finally:
-                        _executing_auto_tasks = False
-                return result
+def _diff_tasks(old_tasks, new_tasks):
+    """按任务ID比较任务列表，返回操作列表"""
+    old_ids = [task.get("id") for task in old_tasks]
+    new_ids = [task.get("id") for task in new_tasks]
+    # 存在重复ID或顺序发生变化时无法逐条记录，整体替换
+    if (len(set(old_ids)) != len(old_ids) or len(set(new_ids)) != len(new_ids)
+            or not _is_append_only_order(old_ids, new_ids)):
+        return [["put", "tasks", new_tasks]]
+
+    old_by_id = dict(zip(old_ids, old_tasks))
+    ops = []
+    for task in new_tasks:
+        old_task = old_by_id.pop(task.get("id"), None)
+        if old_task is None or old_task != task:
+            ops.append(["task", task])
+    for task_id in old_by_id:
+        ops.append(["task_del", task_id])
+    return ops
+
+
+def diff_master_data(old, new):
+    """计算将 old 变为 new 所需的操作列表"""
+    ops = []
+    for section, value in new.items():
+        if section not in old:
+            ops.append(["put", section, value])
+            continue
+        old_value = old[section]
+        if old_value == value:
+            continue
+        if section == "tasks" and isinstance(value, list) and isinstance(old_value, list):
+            ops.extend(_diff_tasks(old_value, value))
+        elif (isinstance(value, dict) and isinstance(old_value, dict)
+              and _is_append_only_order(list(old_value), list(value))):
+            for key, item in value.items():
+                if key not in old_value or old_value[key] != item:
+                    ops.append(["set", section, key, item])
+            for key in old_value.keys() - value.keys():
+                ops.append(["del", section, key])
+        else:
+            ops.append(["put", section, value])
+    for section in old.keys() - new.keys():
+        ops.append(["drop", section])
+    return ops
+
+
+def master_data_op_section(op):
+    """操作所属的分区"""
+    return "tasks" if op[0] in ("task", "task_del") else op[1]
+
+
+def apply_master_data_ops(data, ops):
+    """将操作列表应用到主数据上（原地修改）"""
+    task_index = None
+    deleted_task_ids = set()
+    for op in ops:
+        kind = op[0]
+        if kind == "put":
+            data[op[1]] = op[2]
+            if op[1] == "tasks":
+                task_index = None
+        elif kind == "drop":
+            data.pop(op[1], None)
+        elif kind == "set":
+            data.setdefault(op[1], {})[op[2]] = op[3]
+        elif kind == "del":
+            data.get(op[1], {}).pop(op[2], None)
+        elif kind == "task":
+            tasks = data.setdefault("tasks", [])
+            if task_index is None:
+                task_index = {task.get("id"): pos for pos, task in enumerate(tasks)}
+            task = op[1]
+            pos = task_index.get(task.get("id"))
+            if pos is None:
+                task_index[task.get("id")] = len(tasks)
+                tasks.append(task)
             else:
-                print(f"数据文件不存在: {config_manager.DATA_FILE}")
-                raise FileNotFoundError
+                tasks[pos] = task
+        elif kind == "task_del":
+            deleted_task_ids.add(op[1])
+    if deleted_task_ids:
+        data["tasks"] = [task for task in data.get("tasks", []) if task.get("id") not in deleted_task_ids]
+    return data
 
-    except Exception as e:
-        # 使用动态生成的默认数据
-        if allow_default:
-            print(f"加载数据失败: {str(e)}\n 已启用默认数据")
-            result = get_default_data()
 
-            # 保存默认数据到文件
-            if not save_data(result):
-                print(f"保存默认数据失败: {config_manager.DATA_FILE}")
+# 主数据存储后端
+class JsonMasterDataStore:
+    """JSON文件存储：每个用户一个 master_data/ 目录，每个分区一个文件，另有变更日志
+
+    目录中包含 <分区>.json（stats、credits、tasks 等各一个）、meta.json（已合并的日志序号、
+    数据结构版本和存储代号）和 journal（变更日志）。读取时只打开所需分区的文件，再重放日志中涉及这些分区的操作。
+    启用日志时，保存操作只把与当前数据的差异作为一行JSON追加到日志并 fsync；日志超过
+    DATA_JOURNAL_COMPACT_BYTES 后由后台线程把涉及的分区重写回分区文件并清空日志。
+    日志中的操作都是赋值而非增量，重复应用结果不变，因此合并过程中断也不会损坏数据。
+    读取加用户共享锁，写入与合并加排他锁。旧版单文件 master_data.json 在首次访问时自动拆分。
+    """
+
+    name = 'json'
+
+    def __init__(self):
+        self.appends = 0
+        self.appended_bytes = 0
+        self.compactions = 0
+        self._journal_tails = {}  # 目录 -> (日志缓存键, 最后一条记录序号)
+
+    @property
+    def path(self):
+        return config_manager.DATA_DIR
+
+    @staticmethod
+    def section_file(directory, section):
+        return os.path.join(directory, f"{section}.json")
+
+    @staticmethod
+    def meta_file(directory):
+        return os.path.join(directory, 'meta.json')
+
+    @staticmethod
+    def journal_path(directory):
+        return os.path.join(directory, 'journal')
+
+    def exists(self):
+        directory = self.path
+        if not os.path.isdir(directory) and os.path.exists(config_manager.DATA_FILE):
+            self.migrate_legacy(config_manager.DATA_FILE, directory)
+        return os.path.exists(self.meta_file(directory))
+
+    @contextmanager
+    def _open(self, directory, exclusive):
+        """加用户锁并打开日志文件"""
+        with data_locks.acquire(directory, exclusive=exclusive):
+            if exclusive:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.journal_path(directory), 'a+b') as journal_file:
+                yield journal_file
+
+    @staticmethod
+    def _journal_key(journal_file):
+        """日志只追加或清空，(长度, inode) 在每次写入后必然变化"""
+        st = os.fstat(journal_file.fileno())
+        return (st.st_size, st.st_ino)
 
-            # 对于出错情况也执行自动任务检查
-            if not _executing_auto_tasks:
-                _executing_auto_tasks = True
+    def _read_meta(self, directory):
+        with open(self.meta_file(directory), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _journal_records(self, directory, journal_file):
+        """解析日志，返回 [[序号, 操作列表], ...]"""
+        journal_key = self._journal_key(journal_file)
+        path = self.journal_path(directory)
+        records = master_data_cache.get(path, journal_key)
+        if records is None:
+            records = []
+            journal_file.seek(0)
+            for line in journal_file:
                 try:
-                    execute_daily_auto_tasks()
-                finally:
-                    _executing_auto_tasks = False
-            return result
-        else:
-            print(f"加载数据失败: {str(e)}")
-            raise e
+                    record = json.loads(line)
+                except ValueError:
+                    # 进程崩溃可能留下写了一半的行，跳过即可
+                    data_logger.warning("跳过损坏的日志记录: %s", path)
+                    continue
+                records.append([record["seq"], record["ops"]])
+            master_data_cache.put(path, journal_key, records, exact=True)
+        self._journal_tails[directory] = (journal_key, records[-1][0] if records else 0)
+        return records
+
+    def _version(self, directory, journal_file, watermark):
+        """当前版本号：已合并序号与日志最后一条记录序号中的较大者"""
+        journal_key = self._journal_key(journal_file)
+        if journal_key[0] == 0:
+            return watermark
+        tail = self._journal_tails.get(directory)
+        if tail is None or tail[0] != journal_key:
+            self._journal_records(directory, journal_file)
+            tail = self._journal_tails[directory]
+        return max(watermark, tail[1])
+
+    def _read_state(self, directory, journal_file, sections, meta=None):
+        """读取指定分区并重放日志，返回 (版本号, 数据)；调用方须持有用户锁
+
+        每个分区按 (分区文件键 + 日志键) 缓存重放后的值，日志追加后由 save 直接更新缓存。
+        """
+        watermark = (meta or self._read_meta(directory))["seq"]
+        journal_key = self._journal_key(journal_file)
+        data = {}
+        pending = {}
+        for section in sections:
+            path = self.section_file(directory, section)
+            try:
+                cache_key = master_data_cache.file_key(path) + journal_key
+            except FileNotFoundError:
+                cache_key = (0, 0, 0) + journal_key
+            cached = master_data_cache.get(path, cache_key)
+            if cached is None:
+                pending[section] = (path, cache_key)
+            elif "value" in cached:
+                data[section] = cached["value"]
+
+        if pending:
+            merged = {}
+            for section, (path, _) in pending.items():
+                if os.path.exists(path):
+                    with open(path, 'r', encoding='utf-8') as f:
+                        merged[section] = json.load(f)
+            for seq, ops in self._journal_records(directory, journal_file):
+                if seq > watermark:
+                    apply_master_data_ops(merged, [op for op in ops if master_data_op_section(op) in pending])
+            for section, (path, cache_key) in pending.items():
+                if section in merged:
+                    data[section] = merged[section]
+                    master_data_cache.put(path, cache_key, {"value": merged[section]})
+                else:
+                    master_data_cache.put(path, cache_key, {})
+
+        version = self._version(directory, journal_file, watermark)
+        return version, data
+
+    def _write_sections(self, directory, journal_file, sections, values, seq, schema_version=None, generation=None):
+        """原子重写指定分区（values 中没有的分区删除文件）、更新 meta.json 并清空日志；调用方须持有用户排他锁
+
+        schema_version、generation 为 None 时沿用原有的数据结构版本和存储代号。
+        """
+        if schema_version is None or generation is None:
+            meta = self._read_meta(directory)
+            if schema_version is None:
+                schema_version = meta.get("schema_version", 0)
+            if generation is None:
+                generation = meta.get("generation")
+        for section in sections:
+            path = self.section_file(directory, section)
+            if section in values:
+                write_json_atomic(path, values[section])
+            elif os.path.exists(path):
+                os.remove(path)
+        write_json_atomic(self.meta_file(directory),
+                          {"seq": seq, "schema_version": schema_version, "generation": generation})
+        # 分区与序号落盘后再清空日志；两步之间崩溃时日志会被再次重放，赋值操作重复应用不影响结果
+        journal_file.truncate(0)
+        journal_file.flush()
+        os.fsync(journal_file.fileno())
+        self._journal_tails.pop(directory, None)
+
+    def load(self, sections=None):
+        """读取主数据，返回 (版本号, 数据, 存储代号)；sections 为 None 时读取全部分区"""
+        directory = self.path
+        with self._open(directory, exclusive=False) as journal_file:
+            meta = self._read_meta(directory)
+            if meta.get("schema_version", 0) >= MASTER_DATA_SCHEMA_VERSION:
+                version, data = self._read_state(directory, journal_file, sections or MASTER_DATA_SECTIONS, meta)
+                return version, data, meta.get("generation")
+        self.upgrade_schema(directory)
+        return self.load(sections)
+
+    def upgrade_schema(self, directory):
+        """执行数据结构迁移并写回全部分区"""
+        with self._open(directory, exclusive=True) as journal_file:
+            meta = self._read_meta(directory)
+            schema_version = meta.get("schema_version", 0)
+            if schema_version >= MASTER_DATA_SCHEMA_VERSION:
+                return
+            version, data = self._read_state(directory, journal_file, MASTER_DATA_SECTIONS, meta)
+            upgrade_master_data(data, schema_version)
+            self._write_sections(directory, journal_file, MASTER_DATA_SECTIONS, data, version + 1,
+                                 MASTER_DATA_SCHEMA_VERSION)
+        data_logger.info("主数据结构已从版本%s升级到%s: %s", schema_version, MASTER_DATA_SCHEMA_VERSION, directory)
+
+    def save(self, data, expected_version=None, sections=None):
+        """保存主数据并返回新版本号：启用日志时只追加差异，否则只重写变化的分区
+
+        sections 不为 None 时只比较和保存这些分区（对应 load_data(sections=...) 读取的部分文档）；
+        expected_version 不为 None 且与当前版本不一致时抛出 VersionConflict。
+        与库中数据比较后为变化的任务标记修订号。
+        """
+        directory = self.path
+        sections = tuple(sections or MASTER_DATA_SECTIONS)
+        new = {section: data[section] for section in sections if section in data}
+        with self._open(directory, exclusive=True) as journal_file:
+            if not os.path.exists(self.meta_file(directory)):
+                if "tasks" in new:
+                    stamp_task_revisions(new["tasks"], new.setdefault("task_meta", {}), {},
+                                         *diff_task_lists([], new["tasks"]))
+                self._write_sections(directory, journal_file, sections, new, 0, MASTER_DATA_SCHEMA_VERSION,
+                                     new_store_generation())
+                return 0
+
+            version, current = self._read_state(directory, journal_file, sections)
+            if expected_version is not None and expected_version != version:
+                raise VersionConflict(expected_version, version)
+            if "tasks" in new:
+                stamp_task_revisions(new["tasks"], new.setdefault("task_meta", {}), current.get("task_meta", {}),
+                                     *diff_task_lists(current.get("tasks", []), new["tasks"]))
+            ops = diff_master_data(current, new)
+            if not ops:
+                return version
+            dirty = {master_data_op_section(op) for op in ops}
+
+            if not DATA_JOURNAL_ENABLED:
+                if self._journal_key(journal_file)[0]:
+                    self._compact(directory, journal_file)
+                self._write_sections(directory, journal_file, dirty, new, version + 1)
+                return version + 1
+
+            record = {"seq": version + 1, "time": datetime.now().isoformat(), "ops": ops}
+            line = json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+
+            old_journal_key = self._journal_key(journal_file)
+            size = old_journal_key[0]
+            if size:
+                # 上一次写入若只写了半行，先补上换行，避免与本条记录粘连
+                journal_file.seek(size - 1)
+                if journal_file.read(1) != b'\n':
+                    line = b'\n' + line
+            journal_file.write(line)
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+            self.appends += 1
+            self.appended_bytes += len(line)
+
+            # 直接更新各分区缓存，下次读取无需重新解析分区文件和日志
+            new_journal_key = self._journal_key(journal_file)
+            new_state = apply_master_data_ops(current, ops)
+            for section in MASTER_DATA_SECTIONS:
+                path = self.section_file(directory, section)
+                try:
+                    file_key = master_data_cache.file_key(path)
+                except FileNotFoundError:
+                    file_key = (0, 0, 0)
+                if section in dirty:
+                    entry = {"value": new_state[section]} if section in new_state else {}
+                    master_data_cache.put(path, file_key + new_journal_key, entry)
+                else:
+                    master_data_cache.rekey(path, file_key + old_journal_key, file_key + new_journal_key)
+            self._journal_tails[directory] = (new_journal_key, version + 1)
+
+        if size + len(line) >= DATA_JOURNAL_COMPACT_BYTES:
+            journal_compactor.schedule(directory)
+        return version + 1
+
+    def _compact(self, directory, journal_file):
+        """将日志涉及的分区重写回分区文件；调用方须持有用户排他锁"""
+        watermark = self._read_meta(directory)["seq"]
+        dirty = set()
+        for seq, ops in self._journal_records(directory, journal_file):
+            if seq > watermark:
+                dirty.update(master_data_op_section(op) for op in ops)
+        dirty &= set(MASTER_DATA_SECTIONS)
+        version, values = self._read_state(directory, journal_file, [s for s in MASTER_DATA_SECTIONS if s in dirty])
+        self._write_sections(directory, journal_file, dirty, values, version)
+
+    def compact(self, directory):
+        """将日志合并回分区文件"""
+        with self._open(directory, exclusive=True) as journal_file:
+            if self._journal_key(journal_file)[0] == 0 or not os.path.exists(self.meta_file(directory)):
+                return
+            self._compact(directory, journal_file)
+            self.compactions += 1
+
+    def backup_to(self, backup_file):
+        """备份合并后的完整数据（单个JSON文件，附带数据结构版本）"""
+        data = self.load()[1]
+        data["schema_version"] = MASTER_DATA_SCHEMA_VERSION
+        write_json_atomic(backup_file, data)
+
+    def restore_from(self, backup_file):
+        directory = self.path
+        with open(backup_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        # 旧备份没有版本号，下次读取时重新执行迁移
+        schema_version = data.pop("schema_version", 0)
+        with self._open(directory, exclusive=True) as journal_file:
+            version = 0
+            if os.path.exists(self.meta_file(directory)):
+                version = self._version(directory, journal_file, self._read_meta(directory)["seq"])
+            self._write_sections(directory, journal_file, MASTER_DATA_SECTIONS, data, version + 1, schema_version,
+                                 new_store_generation())
+
+    def read_legacy(self, legacy_file):
+        """读取旧版单文件 master_data.json（含 master_data.journal 中尚未合并的记录），返回 (版本号, 数据)"""
+        with data_locks.acquire(legacy_file):
+            with open(legacy_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            seq = data.pop("_journal_seq", 0)
+            legacy_journal = os.path.splitext(legacy_file)[0] + '.journal'
+            if os.path.exists(legacy_journal):
+                with open(legacy_journal, 'rb') as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            continue
+                        if record["seq"] > seq:
+                            apply_master_data_ops(data, record["ops"])
+                            seq = record["seq"]
+        return seq, data
+
+    def read_user(self, directory, legacy_file):
+        """读取用户的全部主数据（分区目录或旧版单文件），不触发迁移"""
+        if os.path.exists(self.meta_file(directory)):
+            with self._open(directory, exclusive=False) as journal_file:
+                return self._read_state(directory, journal_file, MASTER_DATA_SECTIONS)[1]
+        return self.read_legacy(legacy_file)[1]
+
+    def migrate_legacy(self, legacy_file, directory):
+        """将旧版单文件 master_data.json 拆分为分区目录，原文件改名为 .migrated 保留"""
+        with data_locks.acquire(directory, exclusive=True):
+            if os.path.isdir(directory):
+                return
+            seq, data = self.read_legacy(legacy_file)
+            tmp_dir = f"{directory}.migrating"
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir)
+            for section in MASTER_DATA_SECTIONS:
+                if section in data:
+                    write_json_atomic(self.section_file(tmp_dir, section), data[section])
+            # 旧版数据未经结构迁移，首次读取时执行
+            write_json_atomic(self.meta_file(tmp_dir),
+                              {"seq": seq, "schema_version": 0, "generation": new_store_generation()})
+            os.rename(tmp_dir, directory)
+
+            os.replace(legacy_file, f"{legacy_file}.migrated")
+            legacy_journal = os.path.splitext(legacy_file)[0] + '.journal'
+            if os.path.exists(legacy_journal):
+                os.remove(legacy_journal)
+        data_logger.info("主数据已拆分为分区文件: %s", directory)
+
+    def stats(self):
+        return {
+            "enabled": DATA_JOURNAL_ENABLED,
+            "appends": self.appends,
+            "appended_bytes": self.appended_bytes,
+            "compactions": self.compactions,
+            "pending_compactions": journal_compactor.pending(),
+        }
+
+
+class JournalCompactor:
+    """后台合并线程：在首次需要时启动（gunicorn fork 之后每个工作进程各自一个）"""
+
+    def __init__(self):
+        self._pending = set()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def schedule(self, path):
+        with self._cond:
+            self._pending.add(path)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='journal-compactor', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def pending(self):
+        with self._cond:
+            return len(self._pending)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                path = self._pending.pop()
+            try:
+                MASTER_DATA_STORES['json'].compact(path)
+            except Exception as e:
+                data_logger.error("合并主数据日志失败 %s: %s", path, e)
+
+
+journal_compactor = JournalCompactor()
+
+
+class SqliteMasterDataStore:
+    """SQLite存储：每个用户一个 master_data.db（WAL模式）
+
+    任务、道具、背包、积分、属性各自一张表，每条记录一行；其余顶层字段（stats、
+    lootbox_miss_counts 等）存放在 meta 表。保存时在同一事务内与库中现有行逐行比较，
+    只写入发生变化的行，因此 buy_item、complete_task 等操作只改动几行而不是重写整份数据。
+    """
+
+    name = 'sqlite'
+
+    # 以字典形式保存的分区：分区名 -> 表名
+    KEYED_SECTIONS = ("items", "backpack", "credits", "properties")
+    # meta 表中保存数据结构版本和存储代号的保留键（不属于主数据）
+    SCHEMA_VERSION_KEY = "_schema_version"
+    GENERATION_KEY = "_generation"
+    RESERVED_KEYS = (SCHEMA_VERSION_KEY, GENERATION_KEY)
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tasks (
+            seq INTEGER PRIMARY KEY,
+            id INTEGER,
+            body TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_tasks_id ON tasks(id);
+        CREATE TABLE IF NOT EXISTS items (key TEXT PRIMARY KEY, seq INTEGER NOT NULL, value TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS backpack (key TEXT PRIMARY KEY, seq INTEGER NOT NULL, value TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS credits (key TEXT PRIMARY KEY, seq INTEGER NOT NULL, value TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS properties (key TEXT PRIMARY KEY, seq INTEGER NOT NULL, value TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+    """
+
+    @property
+    def path(self):
+        return config_manager.DATA_DB_FILE
+
+    def exists(self):
+        # 旧用户只有JSON数据时，首次访问自动迁移
+        if not os.path.exists(self.path) and (
+                os.path.isdir(config_manager.DATA_DIR) or os.path.exists(config_manager.DATA_FILE)):
+            migrate_user_json_to_sqlite(config_manager.DATA_DIR, config_manager.DATA_FILE, self.path)
+        return os.path.exists(self.path)
+
+    @staticmethod
+    def connect(path):
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SqliteMasterDataStore.SCHEMA)
+        return conn
+
+    @staticmethod
+    def file_key(path):
+        """数据库与WAL文件共同构成缓存键（WAL模式下写入只改动-wal文件）"""
+        st = os.stat(path)
+        try:
+            wal = os.stat(path + "-wal")
+            wal_key = (wal.st_mtime_ns, wal.st_size, wal.st_ino)
+        except FileNotFoundError:
+            wal_key = (0, 0, 0)
+        return (max(st.st_mtime_ns, wal_key[0]), st.st_size, st.st_ino) + wal_key
+
+    @staticmethod
+    def _dumps(value):
+        return json.dumps(value, ensure_ascii=False)
+
+    def load(self, sections=None):
+        """读取主数据，返回 (版本号, 数据, 存储代号)；版本号保存在 PRAGMA user_version
+
+        sections 不为 None 时只查询这些分区对应的表（完整读取的结果已缓存时直接从缓存中取）。
+        数据结构版本落后时先执行迁移。
+        """
+        path = self.path
+        cache_key = self.file_key(path)
+        cached = master_data_cache.get(path, cache_key)
+        if cached is not None:
+            data = cached["data"]
+            if sections is not None:
+                data = {section: data[section] for section in sections if section in data}
+            return cached["version"], data, cached["generation"]
+
+        conn = self.connect(path)
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = ?", (self.SCHEMA_VERSION_KEY,)).fetchone()
+            if (json.loads(row[0]) if row else 0) < MASTER_DATA_SCHEMA_VERSION:
+                conn.close()
+                self.upgrade_schema(path)
+                return self.load(sections)
+            version, data, generation = self._query(conn, sections)
+        finally:
+            conn.close()
+
+        if sections is None:
+            master_data_cache.put(path, cache_key, {"version": version, "data": data, "generation": generation})
+        return version, data, generation
+
+    def _query(self, conn, sections=None):
+        """查询主数据，返回 (版本号, 数据, 存储代号)"""
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        data = {}
+        generation = None
+        for key, value in conn.execute("SELECT key, value FROM meta"):
+            if key == self.GENERATION_KEY:
+                generation = json.loads(value)
+            elif key != self.SCHEMA_VERSION_KEY and (sections is None or key in sections):
+                data[key] = json.loads(value)
+        if sections is None or "tasks" in sections:
+            data["tasks"] = [json.loads(body) for (body,) in conn.execute("SELECT body FROM tasks ORDER BY seq")]
+        for section in self.KEYED_SECTIONS:
+            if sections is None or section in sections:
+                rows = conn.execute(f"SELECT key, value FROM {section} ORDER BY seq")
+                data[section] = {key: json.loads(value) for key, value in rows}
+        return version, data, generation
+
+    def upgrade_schema(self, path):
+        """执行数据结构迁移并写回"""
+        while True:
+            conn = self.connect(path)
+            try:
+                row = conn.execute("SELECT value FROM meta WHERE key = ?", (self.SCHEMA_VERSION_KEY,)).fetchone()
+                schema_version = json.loads(row[0]) if row else 0
+                if schema_version >= MASTER_DATA_SCHEMA_VERSION:
+                    return
+                version, data, _ = self._query(conn)
+            finally:
+                conn.close()
+            upgrade_master_data(data, schema_version)
+            try:
+                self.save_to(path, data, expected_version=version, schema_version=MASTER_DATA_SCHEMA_VERSION)
+            except VersionConflict:
+                # 迁移期间数据被其他进程修改，重新读取后再迁移
+                continue
+            finally:
+                master_data_cache.invalidate(path)
+            data_logger.info("主数据结构已从版本%s升级到%s: %s", schema_version, MASTER_DATA_SCHEMA_VERSION, path)
+            return
+
+    def save(self, data, expected_version=None, sections=None):
+        """在一个事务内只写入变化的行，返回新版本号；为变化的任务标记修订号"""
+        try:
+            return self.save_to(self.path, data, expected_version, sections, stamp=True)
+        finally:
+            master_data_cache.invalidate(self.path)
+
+    def save_to(self, path, data, expected_version=None, sections=None, schema_version=None, stamp=False):
+        """将主数据写入指定数据库文件；sections 不为 None 时只处理这些分区，schema_version 不为 None 时更新数据结构版本
+
+        stamp 为 True 时与库中的任务比较，为变化的任务标记修订号（迁移和复制数据时不标记）。
+        """
+        conn = self.connect(path)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if expected_version is not None and expected_version != version:
+                raise VersionConflict(expected_version, version)
+            stored = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+            if (sections is None or "tasks" in sections) and "tasks" in data:
+                stamp_meta = None
+                if stamp:
+                    current_meta = json.loads(stored["task_meta"]) if "task_meta" in stored else {}
+                    stamp_meta = (data.setdefault("task_meta", {}), current_meta)
+                self._save_tasks(conn, data["tasks"], stamp_meta)
+            for section in self.KEYED_SECTIONS:
+                if section in data:
+                    self._save_keyed(conn, section, data[section])
+
+            meta = {key: value for key, value in data.items()
+                    if key != "tasks" and key not in self.KEYED_SECTIONS}
+            for key, value in meta.items():
+                encoded = self._dumps(value)
+                if stored.get(key) != encoded:
+                    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, encoded))
+            for key in stored.keys() - meta.keys():
+                if key not in self.RESERVED_KEYS and (sections is None or key in sections):
+                    conn.execute("DELETE FROM meta WHERE key = ?", (key,))
+            if self.GENERATION_KEY not in stored:
+                # 新建的数据库（包括迁移和复制时写入的临时库）
+                conn.execute("INSERT INTO meta (key, value) VALUES (?, ?)",
+                             (self.GENERATION_KEY, self._dumps(new_store_generation())))
+            if schema_version is not None:
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                             (self.SCHEMA_VERSION_KEY, self._dumps(schema_version)))
+            conn.execute(f"PRAGMA user_version = {version + 1}")
+            conn.execute("COMMIT")
+            return version + 1
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _save_tasks(self, conn, tasks, stamp_meta=None):
+        """按任务ID比较，只写入新增、修改、删除的任务
+
+        stamp_meta 为 (task_meta, 库中的 task_meta) 时先为内容变化的任务标记修订号。
+        """
+        stored = conn.execute("SELECT seq, id, body FROM tasks ORDER BY seq").fetchall()
+        new_ids = [task.get("id") for task in tasks]
+        stored_ids = [row[1] for row in stored]
+        stored_by_id = {task_id: (seq, body) for seq, task_id, body in stored}
+        bodies = [self._dumps(task) for task in tasks]
+
+        if stamp_meta is not None:
+            changed = []
+            for pos, task in enumerate(tasks):
+                existing = stored_by_id.get(task.get("id"))
+                if existing is None or existing[1] != bodies[pos]:
+                    changed.append(pos)
+            new_id_set = set(new_ids)
+            deleted_ids = [task_id for task_id in stored_by_id if task_id not in new_id_set]
+            old_tasks = {pos: json.loads(stored_by_id[tasks[pos].get("id")][1])
+                         for pos in changed if tasks[pos].get("id") in stored_by_id}
+            stamp_task_revisions(tasks, *stamp_meta, [(tasks[pos], old_tasks.get(pos)) for pos in changed],
+                                 deleted_ids)
+            for pos in changed:
+                bodies[pos] = self._dumps(tasks[pos])
+
+        # 存在重复ID（旧版CSV导入可能产生）时无法逐条比较，整表重写
+        if len(set(new_ids)) != len(new_ids) or len(set(stored_ids)) != len(stored_ids):
+            conn.execute("DELETE FROM tasks")
+            conn.executemany("INSERT INTO tasks (seq, id, body) VALUES (?, ?, ?)",
+                             [(seq, task.get("id"), body) for seq, (task, body) in enumerate(zip(tasks, bodies), 1)])
+            return
+
+        # 保留任务的相对顺序若发生变化，同样整表重写
+        kept = [task_id for task_id in new_ids if task_id in stored_by_id]
+        if kept != [task_id for task_id in stored_ids if task_id in set(kept)]:
+            conn.execute("DELETE FROM tasks")
+            conn.executemany("INSERT INTO tasks (seq, id, body) VALUES (?, ?, ?)",
+                             [(seq, task.get("id"), body) for seq, (task, body) in enumerate(zip(tasks, bodies), 1)])
+            return
+
+        next_seq = (stored[-1][0] if stored else 0) + 1
+        for task, body in zip(tasks, bodies):
+            existing = stored_by_id.pop(task.get("id"), None)
+            if existing is None:
+                conn.execute("INSERT INTO tasks (seq, id, body) VALUES (?, ?, ?)", (next_seq, task.get("id"), body))
+                next_seq += 1
+            elif existing[1] != body:
+                conn.execute("UPDATE tasks SET body = ? WHERE seq = ?", (body, existing[0]))
+        for seq, _ in stored_by_id.values():
+            conn.execute("DELETE FROM tasks WHERE seq = ?", (seq,))
+
+    def _save_keyed(self, conn, section, values):
+        """按键比较，只写入新增、修改、删除的行"""
+        stored = conn.execute(f"SELECT key, seq, value FROM {section} ORDER BY seq").fetchall()
+        stored_by_key = {key: (seq, value) for key, seq, value in stored}
+        kept = [key for key in values if key in stored_by_key]
+        if kept != [key for key, _, _ in stored if key in values]:
+            conn.execute(f"DELETE FROM {section}")
+            conn.executemany(f"INSERT INTO {section} (key, seq, value) VALUES (?, ?, ?)",
+                             [(key, seq, self._dumps(value)) for seq, (key, value) in enumerate(values.items(), 1)])
+            return
+
+        next_seq = (stored[-1][1] if stored else 0) + 1
+        for key, value in values.items():
+            encoded = self._dumps(value)
+            existing = stored_by_key.pop(key, None)
+            if existing is None:
+                conn.execute(f"INSERT INTO {section} (key, seq, value) VALUES (?, ?, ?)", (key, next_seq, encoded))
+                next_seq += 1
+            elif existing[1] != encoded:
+                conn.execute(f"UPDATE {section} SET value = ? WHERE key = ?", (encoded, key))
+        for key in stored_by_key:
+            conn.execute(f"DELETE FROM {section} WHERE key = ?", (key,))
+
+    def backup_to(self, backup_file):
+        src = self.connect(self.path)
+        dst = sqlite3.connect(backup_file)
+        try:
+            src.backup(dst)
+        finally:
+            dst.close()
+            src.close()
+
+    def restore_from(self, backup_file):
+        src = sqlite3.connect(backup_file)
+        dst = self.connect(self.path)
+        try:
+            # 备份中的版本号较旧，恢复后继续递增，保证版本号不回退
+            version = dst.execute("PRAGMA user_version").fetchone()[0]
+            src.backup(dst)
+            restored = dst.execute("PRAGMA user_version").fetchone()[0]
+            dst.execute(f"PRAGMA user_version = {max(version, restored) + 1}")
+            dst.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                        (SqliteMasterDataStore.GENERATION_KEY, json.dumps(new_store_generation())))
+        finally:
+            dst.close()
+            src.close()
+            master_data_cache.invalidate(self.path)
+
+
+def new_store_generation():
+    """新的存储代号：创建或恢复主数据时重新生成，与版本号一起标识一份数据（重建后的版本号会从头开始）"""
+    return uuid.uuid4().hex
+
+
+def migrate_user_json_to_sqlite(data_dir, json_file, db_file):
+    """将单个用户的JSON主数据（分区目录或旧版 master_data.json）导入 SQLite（原文件保留不动）"""
+    data = MASTER_DATA_STORES['json'].read_user(data_dir, json_file)
+
+    # 先写入临时库再改名，避免中途失败留下半成品
+    tmp_file = f"{db_file}.migrating"
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(tmp_file + suffix):
+            os.remove(tmp_file + suffix)
+    SqliteMasterDataStore().save_to(tmp_file, data)
+    os.replace(tmp_file, db_file)
+    data_logger.info("已迁移用户数据到SQLite: %s", db_file)
+
+
+MASTER_DATA_STORES = {
+    'json': JsonMasterDataStore(),
+    'sqlite': SqliteMasterDataStore(),
+}
+
+
+def get_master_data_store():
+    """获取配置的主数据存储后端"""
+    return MASTER_DATA_STORES[STORAGE_BACKEND]
+
+
+# 修改load_data函数以支持用户隔离
+def load_data(allow_default=True, sections=None):
+    """从文件加载数据
+
+    sections 指定只读取的分区（如 ("credits",)），返回的文档保存时也只写回这些分区。
+    """
+    store = get_master_data_store()
+    # 修改任务时须一并保存 task_meta（任务ID计数与修订号）
+    if sections is not None and "tasks" in sections and "task_meta" not in sections:
+        sections = tuple(sections) + ("task_meta",)
+    try:
+        if not store.exists():
+            if not allow_default:
+                data_logger.info("数据文件不存在: %s", store.path)
+                raise FileNotFoundError
+
+            # 使用动态生成的默认数据
+            data_logger.info("数据文件不存在，已启用默认数据")
+            # 保存默认数据到文件
+            if not save_data(get_default_data()):
+                data_logger.error("保存默认数据失败: %s", store.path)
+
+        version, result, generation = store.load(sections)
+        note_data_version(version)
+        if has_request_context():
+            g.data_generation = generation
+        # 请求携带 If-Match 时以客户端持有的版本为准，保存时据此检测冲突
+        if has_request_context() and g.get("if_match_version") is not None:
+            version = g.if_match_version
+        return MasterDocument(result, version, sections)
+
+    except Exception as e:
+        data_logger.error("加载数据失败: %s", e)
+        # 数据文件存在但无法读取时直接报错，不能用默认数据覆盖用户数据
+        if allow_default and not store.exists():
+            data_logger.info("已启用默认数据")
+            default_data = {section: value for section, value in get_default_data().items()
+                            if sections is None or section in sections}
+            return MasterDocument(default_data, sections=sections)
+        raise e
+
 
 def load_settings():
     """从文件加载设置"""
@@ -2246,7 +4222,8 @@ def load_settings():
     #     return config_manager._current_user_settings
     try:
         if os.path.exists(config_manager.SETTINGS_FILE):
-            with open(config_manager.SETTINGS_FILE, 'r', encoding='utf-8') as f:
+            with data_locks.acquire(config_manager.SETTINGS_FILE), \
+                    open(config_manager.SETTINGS_FILE, 'r', encoding='utf-8') as f:
                 settings = json.load(f)
                 # config_manager._current_user_settings = settings
                 # print('load_settings - 2. returning settings')
@@ -2258,29 +4235,132 @@ def load_settings():
             # print('load_settings - 3. returning default settings')
             return default_settings
     except Exception as e:
-        print(f"加载设置失败: {str(e)}")
+        data_logger.error("加载设置失败: %s", e)
         # config_manager._current_user_setting = default_settings
         # print('load_settings - 4. returning except default settings')
         return default_settings
 
+def diff_task_lists(old_tasks, new_tasks):
+    """按任务ID比较任务列表，返回 (变化的任务 [(任务, 原任务或 None)], 被删除的任务ID列表)"""
+    old_by_id = {task.get("id"): task for task in old_tasks}
+    changed = []
+    for task in new_tasks:
+        old = old_by_id.pop(task.get("id"), None)
+        if old is None or old != task:
+            changed.append((task, old))
+    return changed, list(old_by_id)
+
+
+def stamp_task_revisions(tasks, task_meta, current_meta, changed, deleted_ids):
+    """为新增和修改的任务标记新的修订号，为删除的任务留下删除记录（原地修改 changed 中的任务和 task_meta）
+
+    由存储后端在保存时调用：此时已持有写锁并读出了库中的任务，changed、deleted_ids 由后端与库中数据比较得到，
+    current_meta 为库中的 task_meta。修订号 task_meta.rev 在每次任务发生变化的保存时加一；删除记录
+    task_meta.tombstones 为 [任务ID, 修订号] 列表，超过 TASK_TOMBSTONES_MAX 条时丢弃最早的记录并抬高
+    tombstone_floor。变化的循环任务重新计算 next_reset_at，新的重置时间加入 task_meta.reset_heap
+    （过期的记录在弹出时跳过，堆明显大于任务数时整体重建）。
+    """
+    if not changed and not deleted_ids:
+        return
+    rev = current_meta.get("rev", 0) + 1
+    heap = task_meta.get("reset_heap")
+    for task, old in changed:
+        schedule_cycle_task(task)
+        task["updated_rev"] = rev
+        next_reset_at = task.get("next_reset_at")
+        if heap is not None and next_reset_at and (old is None or old.get("next_reset_at") != next_reset_at):
+            heapq.heappush(heap, [next_reset_at, task.get("id")])
+    if heap is None or len(heap) > 2 * len(tasks) + 64:
+        heap = build_cycle_reset_heap(tasks)
+
+    # 客户端自带ID重新创建的任务不再视为已删除
+    present = {task.get("id") for task in tasks}
+    tombstones = [entry for entry in current_meta.get("tombstones", []) if entry[0] not in present]
+    tombstones.extend([task_id, rev] for task_id in deleted_ids)
+    floor = current_meta.get("tombstone_floor", 0)
+    if len(tombstones) > TASK_TOMBSTONES_MAX:
+        floor = tombstones[-TASK_TOMBSTONES_MAX - 1][1]
+        tombstones = tombstones[-TASK_TOMBSTONES_MAX:]
+    task_meta.update(rev=rev, tombstones=tombstones, tombstone_floor=floor, reset_heap=heap)
+
+
 def save_data(data):
-    """保存数据到文件"""
+    """保存数据到文件
+
+    data 为 load_data 返回的文档时按其版本号检查并发修改，冲突时抛出 VersionConflict。
+    存储后端在写入时为变化的任务标记修订号（见 stamp_task_revisions）。
+    """
+    sections = getattr(data, "sections", None)
+    if "tasks" in data and (sections is None or "tasks" in sections):
+        data.setdefault("task_meta", {})
     try:
-        with open(config_manager.DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        return True
+        version = get_master_data_store().save(data, expected_version=getattr(data, "version", None),
+                                               sections=getattr(data, "sections", None))
+    except VersionConflict:
+        raise
     except Exception as e:
-        print(f"保存数据失败: {str(e)}")
+        data_logger.error("保存数据失败: %s", e)
         return False
+    if isinstance(data, MasterDocument):
+        data.version = version
+    note_data_version(version)
+    return True
+
+
+def note_data_version(version):
+    """记录本次请求读写的数据版本，响应时作为 ETag 返回"""
+    if has_request_context():
+        g.data_version = version
+
+
+def optimistic_concurrency(f):
+    """修改主数据的路由使用：保存时发现版本冲突则重新执行请求，携带 If-Match 的请求直接返回412"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if_match = request.if_match
+        g.if_match_version = None
+        if if_match and not if_match.star_tag:
+            tag = next(iter(if_match.as_set()), "")
+            g.if_match_version = int(tag) if tag.isdigit() else -1
+
+        attempts = 1 if g.if_match_version is not None else VERSION_CONFLICT_RETRIES + 1
+        for attempt in range(attempts):
+            g.version_conflict = None
+            response = f(*args, **kwargs)
+            conflict = g.version_conflict
+            if conflict is None:
+                return response
+            data_logger.warning("数据版本冲突，第%s次执行 %s: %s", attempt + 1, request.path, conflict)
+
+        if g.if_match_version is not None:
+            return jsonify({"error": "数据已被修改，请刷新后重试",
+                            "current_version": conflict.current_version}), 412
+        return jsonify({"error": "数据正被其他请求修改，请稍后重试"}), 409
+    return decorated
+
+
+@app.after_request
+def add_data_version_etag(response):
+    """为读写过主数据的响应附加 ETag"""
+    version = g.get("data_version")
+    if version is not None and "ETag" not in response.headers:
+        response.set_etag(str(version))
+    return response
+
+
+@app.errorhandler(VersionConflict)
+def handle_version_conflict(e):
+    """未使用 optimistic_concurrency 的路由直接调用 save_data 时发生冲突"""
+    return jsonify({"error": "数据已被修改，请刷新后重试", "current_version": e.current_version}), 409
 
 def save_settings(settings):
     """保存设置到文件"""
     try:
-        with open(config_manager.SETTINGS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(settings, f, ensure_ascii=False, indent=2)
+        with data_locks.acquire(config_manager.SETTINGS_FILE, exclusive=True):
+            write_json_atomic(config_manager.SETTINGS_FILE, settings)
         return True
     except Exception as e:
-        print(f"保存设置失败: {str(e)}")
+        data_logger.error("保存设置失败: %s", e)
         return False
 
 
@@ -2291,7 +4371,8 @@ def load_file_tree():
     """加载文件树结构"""
     try:
         if os.path.exists(config_manager.MARKDOWN_TREE_FILE):
-            with open(config_manager.MARKDOWN_TREE_FILE, 'r', encoding='utf-8') as f:
+            with data_locks.acquire(config_manager.MARKDOWN_TREE_FILE), \
+                    open(config_manager.MARKDOWN_TREE_FILE, 'r', encoding='utf-8') as f:
                 content = f.read().strip()
                 if content:  # 检查文件是否为空
                     tree_data = json.loads(content)
@@ -2313,7 +4394,7 @@ def load_file_tree():
             save_file_tree(default_tree)
             return default_tree
     except json.JSONDecodeError as e:
-        print(f"文件树JSON格式错误: {str(e)}")
+        file_logger.error("文件树JSON格式错误: %s", e)
         # 创建新的默认文件树
         default_tree = create_default_file_tree()
         # 确保创建欢迎文件节点
@@ -2321,7 +4402,7 @@ def load_file_tree():
         save_file_tree(default_tree)
         return default_tree
     except Exception as e:
-        print(f"加载文件树失败: {str(e)}")
+        file_logger.error("加载文件树失败: %s", e)
         # 返回默认文件树结构
         default_tree = create_default_file_tree()
         # 确保创建欢迎文件节点
@@ -2373,7 +4454,7 @@ def ensure_welcome_file_node(tree_data):
         create_welcome_file_if_not_exists()
 
     except Exception as e:
-        print(f"确保欢迎文件节点存在时出错: {str(e)}")
+        file_logger.error("确保欢迎文件节点存在时出错: %s", e)
 
 def create_welcome_file_if_not_exists():
     """如果 welcome 文件不存在则创建它"""
@@ -2403,21 +4484,21 @@ def create_welcome_file_if_not_exists():
         with open(welcome_file_path, 'w', encoding='utf-8') as f:
             f.write(welcome_content)
 
-        print(f"已创建欢迎文件: {welcome_file_path}")
+        file_logger.info("已创建欢迎文件: %s", welcome_file_path)
 
     except Exception as e:
-        print(f"创建欢迎文件时出错: {str(e)}")
+        file_logger.error("创建欢迎文件时出错: %s", e)
 
 def save_file_tree(tree):
     """保存文件树结构"""
     try:
-        print("正在保存文件树结构...")
-        with open(config_manager.MARKDOWN_TREE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(tree, f, ensure_ascii=False, indent=2)
-        print("文件树保存成功")
+        file_logger.debug("正在保存文件树结构...")
+        with data_locks.acquire(config_manager.MARKDOWN_TREE_FILE, exclusive=True):
+            write_json_atomic(config_manager.MARKDOWN_TREE_FILE, tree)
+        file_logger.debug("文件树保存成功")
         return True
     except Exception as e:
-        print(f"保存文件树失败: {str(e)}")
+        file_logger.error("保存文件树失败: %s", e)
         return False
 
 def get_file_path(file_id):
@@ -2448,7 +4529,7 @@ def get_all_image_files():
                     })
         return image_files
     except Exception as e:
-        print(f"获取图片文件列表失败: {str(e)}")
+        file_logger.error("获取图片文件列表失败: %s", e)
         return []
 
 
@@ -3117,6 +5198,7 @@ def clear_settings_cache():
 def get_default_data():
     """生成默认数据"""
     dynamic_items = generate_default_items()
+    default_tasks = generate_default_tasks()
     return {
         "stats": generate_default_stats(),
         "properties": generate_default_properties(),
@@ -3125,7 +5207,9 @@ def get_default_data():
         "backpack": {item: 0 for item in dynamic_items},
         # "use_logs": [],
         # "conversion_rates": generate_default_conversion_rates(),
-        "tasks": generate_default_tasks()
+        "tasks": default_tasks,
+        "task_meta": {"next_task_id": next_task_id_after(default_tasks),
+                      "reset_heap": build_cycle_reset_heap(default_tasks)}
     }
 
 
@@ -3220,7 +5304,7 @@ def get_auto_task_status():
     """获取自动任务执行状态"""
     try:
         # 使用 allow_default=False 避免递归调用
-        data = load_data(allow_default=False)
+        data = load_data(allow_default=False, sections=("auto_task_log",))
 
         # 检查是否存在自动任务日志字段
         if "auto_task_log" not in data:
@@ -3228,120 +5312,369 @@ def get_auto_task_status():
 
         return data["auto_task_log"]
     except Exception as e:
-        print(f"获取自动任务状态失败: {str(e)}")
+        task_logger.error("获取自动任务状态失败: %s", e)
         return {}
 
 
-def update_auto_task_status(task_type):
-    """更新自动任务执行状态"""
-    try:
-        data = load_data()
-
-        # 确保自动任务日志字段存在
-        if "auto_task_log" not in data:
-            data["auto_task_log"] = {}
+# 自动任务类型 -> auto_task_log 中记录最后执行日期的字段
+AUTO_TASK_LOG_FIELDS = {
+    "archive": "last_archive_date",
+    "recycle": "last_recycle_date",
+    "cold_archive": "last_cold_archive_date",
+}
 
-        # 更新对应任务的执行时间
-        current_date = date.today().isoformat()
-        if task_type == "archive":
-            data["auto_task_log"]["last_archive_date"] = current_date
-        elif task_type == "recycle":
-            data["auto_task_log"]["last_recycle_date"] = current_date
 
-        # 保存数据
-        if safe_save_data(data):
-            print(f"自动任务状态已更新: {task_type} 任务执行时间已设置为 {current_date}")
-            return True
-        else:
-            print("保存自动任务状态失败")
-            return False
-    except Exception as e:
-        print(f"更新自动任务状态失败: {str(e)}")
-        return False
+class TaskArchive:
+    """已归档任务的冷存储：用户目录下 task_archive/ 中按月份划分的 gzip 分段（YYYY-MM.jsonl.gz）
 
+    分段只追加：每次归档把该月的新任务作为一个新的 gzip 成员追加到文件末尾（多个成员首尾相接
+    仍是合法的 gzip 文件）。index.json 记录每个分段的任务数、文件大小以及每个任务ID所在的月份，
+    分页查询据此跳过整月的分段，只解压需要的月份；已在索引中的任务不会被重复写入。
+    读写都持有用户锁。
+    """
 
-def should_execute_auto_task(task_type):
-    """检查是否应该执行自动任务"""
-    try:
-        auto_task_log = get_auto_task_status()
-        current_date = date.today().isoformat()
+    _ids_cache = OrderedDict()  # 索引文件路径 -> (stat 键, 任务ID集合)
+    _ids_cache_lock = threading.Lock()
 
-        # 检查对应任务的最后执行日期
-        if task_type == "archive":
-            last_execution_date = auto_task_log.get("last_archive_date")
-        elif task_type == "recycle":
-            last_execution_date = auto_task_log.get("last_recycle_date")
-        else:
-            return False
+    def __init__(self, directory):
+        self.directory = directory
+        self.index_file = os.path.join(directory, "index.json")
 
-        # 如果最后执行日期不等于今天，则应该执行
-        # 注意：这里需要判断 last_execution_date 是否存在，如果不存在则应该执行
-        if last_execution_date is None:
-            return True  # 从未执行过，应该执行
+    def segment_file(self, month):
+        return os.path.join(self.directory, f"{month}.jsonl.gz")
 
-        return last_execution_date != current_date
-    except Exception as e:
-        print(f"检查自动任务执行条件失败: {str(e)}")
-        # 出错时默认不执行，防止重复执行
-        return False
+    @staticmethod
+    def month_of(task):
+        """任务归入的月份：优先按完成时间，其次按开始时间，都没有时归入当月"""
+        moment = normalize_task_time(task.get("complete_time")) or normalize_task_time(task.get("start_time"))
+        return moment[:7] if moment else date.today().strftime("%Y-%m")
 
+    def _read_index(self):
+        if not os.path.exists(self.index_file):
+            return {"segments": {}, "ids": {}}
+        with open(self.index_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _read_segment(self, month):
+        """读取分段中的任务（按写入顺序，同一ID只保留最后一份）"""
+        path = self.segment_file(month)
+        if not os.path.exists(path):
+            return []
+        tasks = {}
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    task = json.loads(line)
+                    tasks.pop(task.get("id"), None)
+                    tasks[task.get("id")] = task
+        return list(tasks.values())
+
+    def _reindex_segment(self, index, month):
+        """分段文件与索引记录的大小不一致时（上次写入分段后、更新索引前中断）按文件内容重建该月索引"""
+        tasks = self._read_segment(month)
+        index["ids"] = {task_id: seg for task_id, seg in index["ids"].items() if seg != month}
+        for task in tasks:
+            index["ids"][str(task.get("id"))] = month
+        index["segments"][month] = {"count": len(tasks), "bytes": os.path.getsize(self.segment_file(month))}
+
+    def taken_ids(self):
+        """归档中全部任务ID的字符串集合，按索引文件的 stat 缓存"""
+        with data_locks.acquire(self.directory):
+            try:
+                stat = os.stat(self.index_file)
+            except FileNotFoundError:
+                return frozenset()
+            key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            with TaskArchive._ids_cache_lock:
+                entry = TaskArchive._ids_cache.get(self.index_file)
+                if entry is not None and entry[0] == key:
+                    TaskArchive._ids_cache.move_to_end(self.index_file)
+                    return entry[1]
+            ids = frozenset(self._read_index()["ids"])
+        with TaskArchive._ids_cache_lock:
+            TaskArchive._ids_cache[self.index_file] = (key, ids)
+            TaskArchive._ids_cache.move_to_end(self.index_file)
+            while len(TaskArchive._ids_cache) > TASK_ARCHIVE_IDS_CACHE_SIZE:
+                TaskArchive._ids_cache.popitem(last=False)
+        return ids
+
+    def append(self, tasks):
+        """把任务追加到各自月份的分段，返回已保存在归档中的任务：本次写入的，以及此前已写入且内容相同的
+
+        ID 已在归档中但内容不同的任务（ID 被新任务重用）既不写入也不返回，调用方应把它留在任务列表中。
+        """
+        with data_locks.acquire(self.directory, exclusive=True):
+            os.makedirs(self.directory, exist_ok=True)
+            index = self._read_index()
+            index_changed = False
+            by_month = {}
+            for task in tasks:
+                by_month.setdefault(self.month_of(task), []).append(task)
+            for month in by_month:
+                path = self.segment_file(month)
+                segment = index["segments"].get(month)
+                if os.path.exists(path) and (segment is None or segment["bytes"] != os.path.getsize(path)):
+                    self._reindex_segment(index, month)
+                    index_changed = True
+
+            stored = []
+            archived = {}  # 月份 -> {任务ID: 归档中的任务}，按需读取
+            for month, month_tasks in sorted(by_month.items()):
+                new_tasks = []
+                new_ids = set()
+                for task in month_tasks:
+                    task_id = str(task.get("id"))
+                    archived_month = index["ids"].get(task_id)
+                    if archived_month is None and task_id not in new_ids:
+                        new_tasks.append(task)
+                        new_ids.add(task_id)
+                        continue
+                    if archived_month is not None:
+                        if archived_month not in archived:
+                            archived[archived_month] = {str(item.get("id")): item
+                                                        for item in self._read_segment(archived_month)}
+                        if archived[archived_month].get(task_id) == task:
+                            stored.append(task)
+                            continue
+                    task_logger.warning("归档中已有ID为%s的其他任务，任务'%s'保留在任务列表中",
+                                        task.get("id"), task.get("name"))
+                if not new_tasks:
+                    continue
+                path = self.segment_file(month)
+                lines = "".join(json.dumps(task, ensure_ascii=False) + "\n" for task in new_tasks)
+                with open(path, 'ab') as f:
+                    f.write(gzip.compress(lines.encode('utf-8')))
+                    f.flush()
+                    os.fsync(f.fileno())
+                segment = index["segments"].setdefault(month, {"count": 0, "bytes": 0})
+                segment["count"] += len(new_tasks)
+                segment["bytes"] = os.path.getsize(path)
+                for task in new_tasks:
+                    index["ids"][str(task.get("id"))] = month
+                stored.extend(new_tasks)
+                index_changed = True
+            if index_changed:
+                write_json_atomic(self.index_file, index)
+            return stored
+
+    def get(self, task_id):
+        """按ID读取归档任务，不存在时返回 None"""
+        with data_locks.acquire(self.directory):
+            month = self._read_index()["ids"].get(str(task_id))
+            if month is None:
+                return None
+            return next((task for task in self._read_segment(month) if task.get("id") == task_id), None)
+
+    def months(self):
+        """各月份分段的任务数，新的月份在前"""
+        with data_locks.acquire(self.directory):
+            segments = self._read_index()["segments"]
+        return [{"month": month, "count": segments[month]["count"]} for month in sorted(segments, reverse=True)]
+
+    def query(self, month=None, offset=0, limit=TASK_ARCHIVE_PAGE_SIZE):
+        """分页查询归档任务（新的月份在前，同一月份内后归档的在前），返回 (总数, 任务列表)"""
+        with data_locks.acquire(self.directory):
+            segments = self._read_index()["segments"]
+            months = sorted(segments, reverse=True)
+            if month is not None:
+                months = [month] if month in segments else []
+            total = sum(segments[m]["count"] for m in months)
+            result = []
+            for m in months:
+                count = segments[m]["count"]
+                if offset >= count:
+                    # 整个分段都在本页之前，不必解压
+                    offset -= count
+                    continue
+                tasks = self._read_segment(m)[::-1]
+                result.extend(tasks[offset:offset + limit - len(result)])
+                offset = 0
+                if len(result) >= limit:
+                    break
+        return total, result
+
+    def remove(self, task_id):
+        """从归档中取出任务（重写所在分段），返回任务，不存在时返回 None"""
+        with data_locks.acquire(self.directory, exclusive=True):
+            index = self._read_index()
+            month = index["ids"].get(str(task_id))
+            if month is None:
+                return None
+            tasks = self._read_segment(month)
+            task = next((item for item in tasks if item.get("id") == task_id), None)
+            remaining = [item for item in tasks if item.get("id") != task_id]
+            path = self.segment_file(month)
+            if remaining:
+                lines = "".join(json.dumps(item, ensure_ascii=False) + "\n" for item in remaining)
+                write_file_atomic(path, gzip.compress(lines.encode('utf-8')))
+                index["segments"][month] = {"count": len(remaining), "bytes": os.path.getsize(path)}
+            else:
+                os.remove(path)
+                index["segments"].pop(month, None)
+            del index["ids"][str(task_id)]
+            write_json_atomic(self.index_file, index)
+            return task
+
+
+def get_task_archive():
+    """当前用户的归档任务冷存储"""
+    return TaskArchive(config_manager.TASK_ARCHIVE_DIR)
+
+
+def _is_archived(task):
+    return task.get("archived") in (True, 1, "true", "是")
+
+
+def move_archived_tasks_to_cold_storage(data, retention_days=None):
+    """把完成时间早于保留期的已归档任务从主数据移入归档分段（只修改 data，由调用方保存），返回移出的任务数
+
+    先写入并 fsync 归档分段，再由调用方保存主数据；两步之间中断时任务会同时留在两处，
+    下次执行时归档索引中已有的任务不再重复写入。只移出确认已保存在归档中的任务，
+    ID 与归档中其他任务冲突的任务留在任务列表中。
+    """
+    if retention_days is None:
+        retention_days = TASK_ARCHIVE_RETENTION_DAYS
+    if retention_days < 0:
+        return 0
+    cutoff = (datetime.now() - timedelta(days=retention_days)).strftime("%Y-%m-%d %H:%M:%S")
+    cold = [task for task in data.get("tasks", []) if _is_archived(task) and
+            (normalize_task_time(task.get("complete_time")) or normalize_task_time(task.get("start_time")) or "") < cutoff]
+    if not cold:
+        return 0
+    stored = get_task_archive().append(cold)
+    if not stored:
+        return 0
+    stored_ids = {id(task) for task in stored}
+    data["tasks"] = [task for task in data["tasks"] if id(task) not in stored_ids]
+    return len(stored)
 
-_execute_auto_task_cnt = 0
-# _should_execute_auto_task = False
-# def get_bool_for_auto_task():
-#     global _should_execute_auto_task
-#     _should_execute_auto_task = {"bool_auto_task_archive":should_execute_auto_task("archive"),"bool_auto_task_recycle":should_execute_auto_task("recycle")}
-#     return _should_execute_auto_task
 
 def execute_daily_auto_tasks():
-    """执行每日自动任务"""
-    global _execute_auto_task_cnt
-    try:
-        if _execute_auto_task_cnt > 0:
-            print("已执行过自动任务，请勿重复执行")
-            return
-        print("开始检查并执行每日自动任务...")
-
-
-        # 标记本次执行中哪些任务被执行了
-        archive_executed = False
-        recycle_executed = False
-
-        # 检查并执行批量归档任务
-        if should_execute_auto_task("archive"):
-            print("执行批量归档任务...")
-            # 直接调用函数而不是使用API端点
-            archived_count = batch_archive_tasks()
-            if archived_count >= 0:  # batch_archive_tasks 返回数字
-                update_auto_task_status("archive")
-                archive_executed = True
-                print(f"批量归档任务完成，共归档 {archived_count} 个任务")
-            else:
-                print("批量归档任务执行失败")
-        else:
-            print("今日已执行过批量归档任务，跳过执行")
-
-        # 检查并执行循环任务刷新
-        if should_execute_auto_task("recycle"):
-            print("执行循环任务刷新...")
-            # 直接调用函数而不是使用API端点
-            updated_count = check_and_update_cycle_tasks()
-            if updated_count >= 0:  # check_and_update_cycle_tasks 返回数字
-                update_auto_task_status("recycle")
-                recycle_executed = True
-                print(f"循环任务刷新完成，共更新 {updated_count} 个任务")
-            else:
-                print("循环任务刷新执行失败")
-        else:
-            print("今日已执行过循环任务刷新，跳过执行")
-        # 如果今天执行了任何任务，可以记录日志
-        if archive_executed or recycle_executed:
-            print(f"今日自动任务执行完成: 归档={archive_executed}, 循环刷新={recycle_executed}")
+    """为当前用户执行今日尚未执行的自动任务，返回 {任务类型: 处理数量}
 
-        _execute_auto_task_cnt += 1
+    批量归档、循环任务刷新和已归档任务移入归档分段在同一份任务数据上完成，执行日期随任务一起保存，只读写一次。
+    整个过程持有用户排他锁，多个工作进程在日界同时触发时只有第一个会真正执行。
+    """
+    store = get_master_data_store()
+    if not store.exists():
+        return {}
 
-    except Exception as e:
-        print(f"执行每日自动任务时出错: {str(e)}")
+    current_date = date.today().isoformat()
+    with data_locks.acquire(store.path, exclusive=True):
+        data = load_data(allow_default=False, sections=TASK_SECTIONS + ("auto_task_log",))
+        auto_task_log = data.setdefault("auto_task_log", {})
+
+        results = {}
+        if auto_task_log.get("last_archive_date") != current_date:
+            results["archive"] = batch_archive_tasks(data)
+        if auto_task_log.get("last_recycle_date") != current_date:
+            results["recycle"] = check_and_update_cycle_tasks(data)
+        # 在归档和循环刷新之后执行，当天产生的已归档副本在保留期内仍留在主数据中
+        if auto_task_log.get("last_cold_archive_date") != current_date:
+            results["cold_archive"] = move_archived_tasks_to_cold_storage(data)
+        if not results:
+            return results
+
+        for task_type in results:
+            auto_task_log[AUTO_TASK_LOG_FIELDS[task_type]] = current_date
+        # 移入归档分段的任务数是确定的，不按单个字段的差异阈值拦截
+        if not safe_save_data(data, enable_single_field_max_check=not results.get("cold_archive")):
+            raise RuntimeError("保存自动任务执行结果失败")
+
+    task_logger.info("今日自动任务执行完成: %s %s", store.path, results)
+    return results
+
+
+class DailyAutoTaskRunner:
+    """每日自动任务调度器
+
+    后台线程在启动时和之后每个日界（本地零点）为所有用户执行一次自动任务，普通请求不再做这项检查。
+    进程内按用户记录最后执行日期，同一天内不会重复读取用户数据；工作进程之间依靠持久化的
+    auto_task_log 和用户排他锁去重。执行失败的用户（或读取用户列表失败时的全部用户）在当天
+    每次醒来时（至多间隔 MAX_SLEEP_SECONDS）重试。
+    """
+
+    # 等待日界时的最长单次休眠，系统休眠或调整时钟后也能及时发现日期变化
+    MAX_SLEEP_SECONDS = 300
+
+    def __init__(self):
+        self._last_run = {}  # 用户名 -> 最后执行日期
+        self._lock = threading.Lock()
+        self._thread = None
+        self.started = False
+        self.last_error = None
+        self.retry_pending = False
+
+    def start(self):
+        """启动后台线程（只启动一次）"""
+        with self._lock:
+            if self.started:
+                return
+            self.started = True
+            self._thread = threading.Thread(target=self._run, name="daily-auto-tasks", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            today = date.today()
+            self.run_all()
+            # 等到日期变化，期间重试执行失败的用户
+            while date.today() == today:
+                next_day = datetime.combine(today + timedelta(days=1), datetime.min.time())
+                remaining = (next_day - datetime.now()).total_seconds()
+                time.sleep(min(max(remaining, 1), self.MAX_SLEEP_SECONDS))
+                if self.retry_pending and date.today() == today:
+                    self.run_all()
+
+    def run_all(self):
+        """为所有用户执行今日尚未执行的自动任务，返回是否全部执行成功"""
+        try:
+            usernames = user_directory.usernames()
+        except Exception as e:
+            task_logger.error("读取用户列表失败，稍后重试: %s", e)
+            self.last_error = str(e)
+            self.retry_pending = True
+            return False
+        current_date = date.today().isoformat()
+        for username in usernames:
+            self.run_for_user(username)
+        self.retry_pending = any(self._last_run.get(username) != current_date for username in usernames)
+        return not self.retry_pending
+
+    def run_for_user(self, username):
+        """为指定用户执行自动任务，今天已执行过时直接返回"""
+        current_date = date.today().isoformat()
+        if self._last_run.get(username) == current_date:
+            return None
+        try:
+            with config_manager.user_scope(username):
+                results = execute_daily_auto_tasks()
+        except Exception as e:
+            task_logger.error("用户 %s 执行每日自动任务时出错: %s", username, e)
+            self.last_error = f"{username}: {str(e)}"
+            return None
+        self._last_run[username] = current_date
+        return results
+
+    def stats(self):
+        """获取调度器状态"""
+        current_date = date.today().isoformat()
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "users_done_today": sum(1 for day in list(self._last_run.values()) if day == current_date),
+            "retry_pending": self.retry_pending,
+            "last_error": self.last_error,
+        }
+
+
+daily_auto_tasks = DailyAutoTaskRunner()
+
+
+@app.before_request
+def start_daily_auto_tasks():
+    """收到第一个请求时启动每日自动任务线程（gunicorn 每个工作进程各一个）"""
+    if AUTO_TASKS_ENABLED and not daily_auto_tasks.started:
+        daily_auto_tasks.start()
 
 
 # def save_data_old(data):
@@ -3361,36 +5694,47 @@ def safe_save_data(data,max_different_fields=2, max_different_items_per_field=10
         max_different_fields = MAX_DIFFERENT_FIELDS if MAX_DIFFERENT_FIELDS else max_different_fields
         max_different_items_per_field = MAX_DIFFERENT_ITEMS_PER_FIELD if MAX_DIFFERENT_ITEMS_PER_FIELD else max_different_items_per_field
 
-        # 加载原始数据用于对比
-        original_data = load_data(allow_default=False)
+        # 与加载时记录的基线对比；调用方自行构造的数据没有基线时才重新读取
+        original_counts = getattr(data, "baseline", None)
+        if original_counts is None:
+            store = get_master_data_store()
+            if not store.exists():
+                raise FileNotFoundError(store.path)
+            original_counts = content_counts(store.load(getattr(data, "sections", None))[1])
 
         # 验证数据结构完整性
         validate_data_structure(data)
 
         # 验证内容完整性
-        is_valid, info = check_content_integrity(original_data, data,max_different_fields=max_different_fields, max_different_items_per_field=max_different_items_per_field,enable_single_field_max_check=enable_single_field_max_check,skip_check=skip_check)
+        is_valid, info = check_content_integrity(original_counts, data,max_different_fields=max_different_fields, max_different_items_per_field=max_different_items_per_field,enable_single_field_max_check=enable_single_field_max_check,skip_check=skip_check)
         if not is_valid:
             error_msg = f"数据内容完整性验证失败: 超过阈值的字段数量={info['different_fields_count']}, " \
                         f"最大允许字段数={info['max_allowed_different_fields']}"
             raise ValueError(error_msg)
 
-        # 智能备份
-        backup_file = smart_backup_data()
+        # 智能备份（定期保留历史版本；写入本身是原子的，失败不会损坏原文件）
+        smart_backup_data()
 
         # 保存数据
-        if save_data(data):
-            return True
-        else:
-            # 如果保存失败，尝试从备份恢复
-            if backup_file:
-                restore_data_from_backup(backup_file)
+        try:
+            saved = save_data(data)
+        except VersionConflict as e:
+            # 数据已被其他请求修改，不能用备份覆盖对方的写入；属于正常的并发冲突，由 optimistic_concurrency 重试或返回412并记录
+            data_logger.debug("保存时发现版本冲突: %s", e)
+            if has_request_context():
+                g.version_conflict = e
             return False
+        if saved:
+            if isinstance(data, MasterDocument):
+                data.baseline = content_counts(data)
+            return True
+        return False
 
     except ValueError as e:
-        print(f"数据验证失败: {str(e)}")
+        data_logger.error("数据验证失败: %s", e)
         return False
     except Exception as e:
-        print(f"保存数据时发生错误: {str(e)}")
+        data_logger.error("保存数据时发生错误: %s", e)
         return False
 
 # 数据备份机制
@@ -3398,15 +5742,16 @@ def safe_save_data(data,max_different_fields=2, max_different_items_per_field=10
 def backup_data():
     """创建数据备份"""
     try:
-        if os.path.exists(config_manager.DATA_FILE):
+        store = get_master_data_store()
+        if os.path.exists(store.path):
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_file = f"{config_manager.DATA_FILE}.backup_{timestamp}"
-            shutil.copy2(config_manager.DATA_FILE, backup_file)
-            print(f"数据备份创建成功: {backup_file}")
+            backup_file = f"{store.path}.backup_{timestamp}"
+            store.backup_to(backup_file)
+            data_logger.info("数据备份创建成功: %s", backup_file)
             return backup_file
         return None
     except Exception as e:
-        print(f"创建数据备份失败: {str(e)}")
+        data_logger.error("创建数据备份失败: %s", e)
         return None
 
 def smart_backup_data():
@@ -3414,7 +5759,8 @@ def smart_backup_data():
     global _last_backup_time
 
     try:
-        if not os.path.exists(config_manager.DATA_FILE):
+        store = get_master_data_store()
+        if not os.path.exists(store.path):
             return None
 
         current_time = time.time()
@@ -3426,16 +5772,16 @@ def smart_backup_data():
         elif (current_time - _last_backup_time) >= _backup_interval:
             should_backup = True  # 超过时间间隔
         else:
-            print("跳过备份：距离上次备份时间不足")
+            data_logger.debug("跳过备份：距离上次备份时间不足")
             return None
 
         if should_backup:
             # 创建新备份
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_file = f"{config_manager.DATA_FILE}.backup_{timestamp}"
-            shutil.copy2(config_manager.DATA_FILE, backup_file)
+            backup_file = f"{store.path}.backup_{timestamp}"
+            store.backup_to(backup_file)
             _last_backup_time = current_time
-            print(f"数据备份创建成功: {backup_file}")
+            data_logger.info("数据备份创建成功: %s", backup_file)
 
             # 清理旧备份
             cleanup_old_backups()
@@ -3443,14 +5789,14 @@ def smart_backup_data():
             return backup_file
 
     except Exception as e:
-        print(f"创建数据备份失败: {str(e)}")
+        data_logger.error("创建数据备份失败: %s", e)
         return None
 
 
 def cleanup_old_backups():
     """清理旧的备份文件"""
     try:
-        backup_pattern = f"{config_manager.DATA_FILE}.backup_*"
+        backup_pattern = f"{get_master_data_store().path}.backup_*"
         backup_files = glob.glob(backup_pattern)
 
         # 按修改时间排序（最新的在前）
@@ -3460,24 +5806,24 @@ def cleanup_old_backups():
         for old_backup in backup_files[_max_backups:]:
             try:
                 os.remove(old_backup)
-                print(f"删除旧备份文件: {old_backup}")
+                data_logger.info("删除旧备份文件: %s", old_backup)
             except Exception as e:
-                print(f"删除备份文件失败 {old_backup}: {str(e)}")
+                data_logger.error("删除备份文件失败 %s: %s", old_backup, e)
 
     except Exception as e:
-        print(f"清理旧备份文件时出错: {str(e)}")
+        data_logger.error("清理旧备份文件时出错: %s", e)
 
 
 def restore_data_from_backup(backup_file):
     """从备份恢复数据"""
     try:
         if os.path.exists(backup_file):
-            shutil.copy2(backup_file, config_manager.DATA_FILE)
-            print(f"数据从备份恢复成功: {backup_file}")
+            get_master_data_store().restore_from(backup_file)
+            data_logger.info("数据从备份恢复成功: %s", backup_file)
             return True
         return False
     except Exception as e:
-        print(f"从备份恢复数据失败: {str(e)}")
+        data_logger.error("从备份恢复数据失败: %s", e)
         return False
 
 
@@ -3493,10 +5839,10 @@ def init_default_file_tree():
         if not os.path.exists(config_manager.MARKDOWN_TREE_FILE):
             default_tree = create_default_file_tree()
             try:
-                with open(config_manager.MARKDOWN_TREE_FILE, 'w', encoding='utf-8') as f:
-                    json.dump(default_tree, f, ensure_ascii=False, indent=2)
+                with data_locks.acquire(config_manager.MARKDOWN_TREE_FILE, exclusive=True):
+                    write_json_atomic(config_manager.MARKDOWN_TREE_FILE, default_tree)
             except Exception as e:
-                print(f"创建默认文件树文件失败: {str(e)}")
+                file_logger.error("创建默认文件树文件失败: %s", e)
 
 
 init_default_file_tree()
@@ -3530,7 +5876,7 @@ def load_file_content(file_id):
                 return f.read()
         return ""
     except Exception as e:
-        print(f"加载文件内容失败: {str(e)}")
+        file_logger.error("加载文件内容失败: %s", e)
         return ""
 
 def save_file_content(file_id, content):
@@ -3541,7 +5887,7 @@ def save_file_content(file_id, content):
             f.write(content)
         return True
     except Exception as e:
-        print(f"保存文件内容失败: {str(e)}")
+        file_logger.error("保存文件内容失败: %s", e)
         return False
 
 def delete_file_content(file_id):
@@ -3552,13 +5898,17 @@ def delete_file_content(file_id):
             os.remove(file_path)
         return True
     except Exception as e:
-        print(f"删除文件内容失败: {str(e)}")
+        file_logger.error("删除文件内容失败: %s", e)
         return False
 
 # 添加数据完整性检查函数
 def validate_data_structure(data):
     """验证数据结构的完整性"""
     required_fields = ["stats", "properties", "credits", "items", "backpack",  "tasks"]
+    # 只加载了部分分区的文档只检查这些分区
+    sections = getattr(data, "sections", None)
+    if sections is not None:
+        required_fields = [field for field in required_fields if field in sections]
 
     # 检查必需字段是否存在
     for field in required_fields:
@@ -3608,7 +5958,7 @@ def get_used_images_in_notes():
 
         return list(used_images)
     except Exception as e:
-        print(f"获取使用中的图片失败: {str(e)}")
+        file_logger.error("获取使用中的图片失败: %s", e)
         return []
 
 # def get_all_image_files_old():
@@ -3675,8 +6025,11 @@ def get_used_images_in_notes():
 #     return intersection / union if union > 0 else 0.0
 
 
-def check_content_integrity(original_data, new_data, max_different_fields=2, max_different_items_per_field=100, enable_single_field_max_check=True, skip_check=False):
-    """检查数据内容完整性，通过字段数据项数量差异验证"""
+def check_content_integrity(original_counts, new_data, max_different_fields=2, max_different_items_per_field=100, enable_single_field_max_check=True, skip_check=False):
+    """检查数据内容完整性，通过字段数据项数量差异验证
+
+    original_counts 为加载时记录的各关键字段数据项数量（见 content_counts）
+    """
 
     # 如果明确要求跳过检查，则直接返回True
     if skip_check:
@@ -3687,7 +6040,7 @@ def check_content_integrity(original_data, new_data, max_different_fields=2, max
         }
 
     # 定义需要检查的关键字段
-    key_fields = ["items", "tasks"]
+    key_fields = INTEGRITY_KEY_FIELDS
 
     # 定义阈值
     max_different_fields = max_different_fields  # A阈值: 允许有差异的字段数量
@@ -3695,26 +6048,12 @@ def check_content_integrity(original_data, new_data, max_different_fields=2, max
 
     # 统计各字段的数据项数量
     field_differences = {}
+    new_counts = content_counts(new_data)
 
     # 通用字段检查逻辑
     for field in key_fields:
-        original_field_data = original_data.get(field, {})
-        new_field_data = new_data.get(field, {})
-
-        # 根据数据类型计算数量
-        if isinstance(original_field_data, dict):
-            original_count = len(original_field_data.keys())
-        elif isinstance(original_field_data, list):
-            original_count = len(original_field_data)
-        else:
-            original_count = 1 if original_field_data else 0
-
-        if isinstance(new_field_data, dict):
-            new_count = len(new_field_data.keys())
-        elif isinstance(new_field_data, list):
-            new_count = len(new_field_data)
-        else:
-            new_count = 1 if new_field_data else 0
+        original_count = original_counts.get(field, 0)
+        new_count = new_counts[field]
 
         # 计算差异
         difference = abs(original_count - new_count)
@@ -3787,7 +6126,8 @@ def get_logs():
     try:
         if hasattr(config_manager, 'LOGS_FILE'):
             if os.path.exists(config_manager.LOGS_FILE):
-                with open(config_manager.LOGS_FILE, 'r', encoding='utf-8') as f:
+                with data_locks.acquire(config_manager.LOGS_FILE), \
+                        open(config_manager.LOGS_FILE, 'r', encoding='utf-8') as f:
                     data = json.load(f)
                     return jsonify({'logs': data.get('logs', {})})
         return jsonify({'logs': []})
@@ -3800,8 +6140,8 @@ def save_logs():
     """保存日志"""
     try:
         data = request.json
-        with open(config_manager.LOGS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        with data_locks.acquire(config_manager.LOGS_FILE, exclusive=True):
+            write_json_atomic(config_manager.LOGS_FILE, data)
         return jsonify({'message': '日志保存成功'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -3828,20 +6168,20 @@ def register():
     if len(password) < 4:
         return jsonify({'error': 'Password must be at least 4 characters'}), 400
 
-    users_db = get_user_db()
-    if username in users_db:
+    if user_directory.exists(username):
         return jsonify({'error': 'User already exists'}), 400
 
     # 密码哈希
-    hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    hashed_password = password_hasher.hash(password)
 
-    users_db[username] = {
+    # 哈希期间可能有同名用户注册，add 会在锁内再次检查
+    if not user_directory.add(username, {
         'password': hashed_password,
         'id': str(uuid.uuid4()),
         'created_at': datetime.now().isoformat(),
         'permissions': ['user']  # 默认权限
-    }
-    save_user_db(users_db)
+    }):
+        return jsonify({'error': 'User already exists'}), 400
     # print("用户数据保存成功:", users_db[username])
 
     # 初始化用户数据
@@ -3904,14 +6244,18 @@ def login():
     if not username or not password:
         return jsonify({'error': 'Username and password are required'}), 400
 
-    users_db = get_user_db()
-    if username not in users_db:
+    user = user_directory.get(username)
+    if user is None:
         return jsonify({'error': 'Invalid credentials'}), 401
 
-    stored_hash = users_db[username]['password']
-    if not bcrypt.checkpw(password.encode('utf-8'), stored_hash.encode('utf-8')):
+    stored_hash = user['password']
+    if not password_hasher.verify(password, stored_hash):
         return jsonify({'error': 'Invalid credentials'}), 401
 
+    # 计算强度配置变化或仍是旧格式哈希时，借登录拿到的明文重新哈希
+    if password_hasher.needs_rehash(stored_hash):
+        user_directory.update(username, password=password_hasher.rehash(password))
+
     # 生成令牌，根据remember_me参数决定过期时间
     access_token, refresh_token = generate_tokens(username, long_term=long_term)
 
@@ -3946,8 +6290,11 @@ def refresh():
 @app.route('/api/auth/logout', methods=['POST'])
 @token_required()
 def logout():
-    """用户登出"""
-    # 在实际应用中，可能需要将令牌加入黑名单
+    """用户登出，吊销本次的访问令牌以及随请求提交的刷新令牌"""
+    token_cache.revoke(request.access_token)
+    refresh_token = (request.get_json(silent=True) or {}).get('refresh_token')
+    if refresh_token and verify_token(refresh_token) == request.current_user:
+        token_cache.revoke(refresh_token)
     return jsonify({'message': 'Logout successful'})
 
 
@@ -3956,8 +6303,7 @@ def logout():
 def get_profile():
     """获取用户资料"""
     username = request.current_user
-    users_db = get_user_db()
-    user_info = users_db.get(username, {})
+    user_info = user_directory.get(username) or {}
 
     # 移除敏感信息
     user_info.pop('password', None)
@@ -3972,7 +6318,10 @@ def get_profile():
 @app.route('/api/users', methods=['GET'])
 @token_required()
 def api_get_users():
-    """获取所有用户列表（仅管理员可访问）"""
+    """获取用户列表（仅管理员可访问）
+
+    查询参数：q 按用户名模糊搜索；page、page_size 分页（不传 page 时返回全部匹配的用户）。
+    """
     try:
         # 检查当前用户是否为管理员
         current_user = request.current_user
@@ -3984,25 +6333,33 @@ def api_get_users():
         if 'admin' not in user_permissions:
             return jsonify({'error': 'Permission denied'}), 403
 
-        # 读取用户数据库
-        if not os.path.exists(USERS_DB_FILE):
-            return jsonify({'users': []})
+        # 解析分页参数
+        query = request.args.get('q', '').strip() or None
+        page = request.args.get('page', type=int)
+        page_size = request.args.get('page_size', USERS_PAGE_SIZE, type=int)
+        if page is not None and (page < 1 or not 1 <= page_size <= USERS_MAX_PAGE_SIZE):
+            return jsonify({'error': f'page 必须大于0，page_size 必须在1到{USERS_MAX_PAGE_SIZE}之间'}), 400
 
-        with open(USERS_DB_FILE, 'r') as f:
-            users_db = json.load(f)
+        if page is None:
+            total, users = user_directory.list_users(query)
+        else:
+            total, users = user_directory.list_users(query, offset=(page - 1) * page_size, limit=page_size)
 
         # 构造返回数据，不包含密码等敏感信息
         users_list = []
-        for username, user_info in users_db.items():
+        for username, user_info in users:
             users_list.append({
                 'username': username,
                 'permissions': user_info.get('permissions', []),
                 'created_at': user_info.get('created_at')
             })
 
-        return jsonify({'users': users_list})
+        result = {'users': users_list, 'total': total}
+        if page is not None:
+            result.update({'page': page, 'page_size': page_size})
+        return jsonify(result)
     except Exception as e:
-        print(f"获取用户列表失败: {str(e)}")
+        auth_logger.error("获取用户列表失败: %s", e)
         return jsonify({'error': '获取用户列表失败'}), 500
 
 
@@ -4041,27 +6398,19 @@ def api_create_user():
             return jsonify({'error': 'Invalid permissions'}), 400
 
         # 检查用户名是否已存在
-        if not os.path.exists(USERS_DB_FILE):
-            users_db = {}
-        else:
-            with open(USERS_DB_FILE, 'r') as f:
-                users_db = json.load(f)
-
-        if username in users_db:
+        if user_directory.exists(username):
             return jsonify({'error': 'Username already exists'}), 400
 
         # 创建新用户
         # hashed_password = hashlib.sha256(password.encode()).hexdigest()
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-        users_db[username] = {
+        hashed_password = password_hasher.hash(password)
+        created_at = datetime.now().isoformat()
+        if not user_directory.add(username, {
             'password': hashed_password,
             'permissions': permissions,  # 使用从前端传递的权限
-            'created_at': datetime.now().isoformat()
-        }
-
-        # 保存用户数据库
-        with open(USERS_DB_FILE, 'w') as f:
-            json.dump(users_db, f)
+            'created_at': created_at
+        }):
+            return jsonify({'error': 'Username already exists'}), 400
 
         # 创建用户目录
         user_dir = get_user_dir(username)
@@ -4072,12 +6421,14 @@ def api_create_user():
             'user': {
                 'username': username,
                 'permissions': permissions,  # 返回设置的权限
-                'created_at': users_db[username]['created_at']
+                'created_at': created_at
             }
         }), 201
 
+    except PasswordHasherBusy:
+        raise
     except Exception as e:
-        print(f"创建用户失败: {str(e)}")
+        auth_logger.error("创建用户失败: %s", e)
         return jsonify({'error': '创建用户失败'}), 500
 
 
@@ -4101,23 +6452,10 @@ def api_delete_user(username):
         if current_user == username:
             return jsonify({'error': 'Cannot delete yourself'}), 400
 
-        # 读取用户数据库
-        if not os.path.exists(USERS_DB_FILE):
-            return jsonify({'error': 'User not found'}), 404
-
-        with open(USERS_DB_FILE, 'r') as f:
-            users_db = json.load(f)
-
-        # 检查用户是否存在
-        if username not in users_db:
-            return jsonify({'error': 'User not found'}), 404
-
         # 删除用户
-        del users_db[username]
-
-        # 保存用户数据库
-        with open(USERS_DB_FILE, 'w') as f:
-            json.dump(users_db, f)
+        if not user_directory.delete(username):
+            return jsonify({'error': 'User not found'}), 404
+        token_revocations.revoke_user(username)
 
         # 可选择性地删除用户目录及其所有数据
         user_dir = get_user_dir(username)
@@ -4127,7 +6465,7 @@ def api_delete_user(username):
         return jsonify({'message': f'User {username} deleted successfully'}), 200
 
     except Exception as e:
-        print(f"删除用户失败: {str(e)}")
+        auth_logger.error("删除用户失败: %s", e)
         return jsonify({'error': '删除用户失败'}), 500
 
 
@@ -4157,24 +6495,18 @@ def api_update_user(username):
         if password is None and permissions is None:
             return jsonify({'error': 'Password or permissions is required'}), 400
 
-        # 读取用户数据库
-        if not os.path.exists(USERS_DB_FILE):
-            return jsonify({'error': 'User not found'}), 404
-
-        with open(USERS_DB_FILE, 'r') as f:
-            users_db = json.load(f)
-
         # 检查用户是否存在
-        if username not in users_db:
+        if not user_directory.exists(username):
             return jsonify({'error': 'User not found'}), 404
 
+        updates = {}
         # 更新密码（如果提供了）
         if password is not None:
             if len(password) < 4:
                 return jsonify({'error': 'Password must be at least 4 characters'}), 400
             # hashed_password = hashlib.sha256(password.encode()).hexdigest()
-            hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-            users_db[username]['password'] = hashed_password
+            hashed_password = password_hasher.hash(password)
+            updates['password'] = hashed_password
 
         # 更新权限（如果提供了）
         if permissions is not None:
@@ -4187,16 +6519,22 @@ def api_update_user(username):
             if not all(permission in valid_permissions for permission in permissions):
                 return jsonify({'error': 'Invalid permissions'}), 400
 
-            users_db[username]['permissions'] = permissions
+            updates['permissions'] = permissions
 
         # 保存用户数据库
-        with open(USERS_DB_FILE, 'w') as f:
-            json.dump(users_db, f)
+        if not user_directory.update(username, **updates):
+            return jsonify({'error': 'User not found'}), 404
+
+        # 管理员重置密码后，该用户已登录的会话全部失效
+        if password is not None:
+            token_revocations.revoke_user(username)
 
         return jsonify({'message': f'User {username} updated successfully'}), 200
 
+    except PasswordHasherBusy:
+        raise
     except Exception as e:
-        print(f"更新用户失败: {str(e)}")
+        auth_logger.error("更新用户失败: %s", e)
         return jsonify({'error': '更新用户失败'}), 500
 
 
@@ -4204,17 +6542,9 @@ def api_update_user(username):
 def get_user_permissions(username):
     """获取用户权限列表"""
     try:
-        if not os.path.exists(USERS_DB_FILE):
-            return []
-
-        with open(USERS_DB_FILE, 'r') as f:
-            users_db = json.load(f)
-
-        if username in users_db:
-            return users_db[username].get('permissions', [])
-        return []
+        return user_directory.permissions(username)
     except Exception as e:
-        print(f"获取用户权限失败: {str(e)}")
+        auth_logger.error("获取用户权限失败: %s", e)
         return []
 
 
@@ -4241,40 +6571,42 @@ def change_password():
         if len(new_password) < 4:
             return jsonify({'error': 'New password must be at least 4 characters'}), 400
 
-        # 获取用户数据库
-        users_db = get_user_db()
+        # 获取用户记录
+        user = user_directory.get(current_user)
 
         # 检查用户是否存在
-        if current_user not in users_db:
+        if user is None:
             return jsonify({'error': 'User not found'}), 404
 
         # 验证原密码
-        stored_hash = users_db[current_user]['password']
+        stored_hash = user['password']
 
-        # 检查存储的密码是否是 bcrypt 格式
-        if stored_hash.startswith('$2'):
-            # 使用 bcrypt 验证
-            if not bcrypt.checkpw(old_password.encode('utf-8'), stored_hash.encode('utf-8')):
-                return jsonify({'error': 'Old password is incorrect'}), 400
-        else:
-            # 如果不是 bcrypt 格式，可能是旧的 SHA256 格式
-            old_password_hash = hashlib.sha256(old_password.encode()).hexdigest()
-            if old_password_hash != stored_hash:
-                return jsonify({'error': 'Old password is incorrect'}), 400
+        # bcrypt 与旧的 SHA256 格式均可验证
+        if not password_hasher.verify(old_password, stored_hash):
+            return jsonify({'error': 'Old password is incorrect'}), 400
 
         # 生成新密码的哈希
-        new_hashed_password = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        new_hashed_password = password_hasher.hash(new_password)
 
         # 更新密码
-        users_db[current_user]['password'] = new_hashed_password
+        if not user_directory.update(current_user, password=new_hashed_password):
+            return jsonify({'error': 'User not found'}), 404
 
-        # 保存用户数据库
-        save_user_db(users_db)
+        # 旧密码下签发的令牌（包括长期登录令牌）全部失效，为当前会话签发新令牌
+        token_revocations.revoke_user(current_user)
+        access_token, refresh_token = generate_tokens(
+            current_user, long_term=bool(request.token_payload.get('long_term')))
 
-        return jsonify({'message': 'Password changed successfully'}), 200
+        return jsonify({
+            'message': 'Password changed successfully',
+            'access_token': access_token,
+            'refresh_token': refresh_token
+        }), 200
 
+    except PasswordHasherBusy:
+        raise
     except Exception as e:
-        print(f"修改密码失败: {str(e)}")
+        auth_logger.error("修改密码失败: %s", e)
         return jsonify({'error': 'Failed to change password'}), 500
 
 
@@ -4321,11 +6653,11 @@ def get_settings():
     return jsonify(settings)
 
 @app.route('/api/settings', methods=['PUT'])
-# @token_required()
+@token_required()
 def update_settings():
     """更新设置"""
     settings_data = request.json
-    print("接收到设置数据:")  # 添加调试日志
+    request_logger.debug("接收到设置数据")
     if save_settings(settings_data):
         # 清除缓存以确保下次加载的是最新设置
         clear_settings_cache()
@@ -4354,7 +6686,7 @@ def update_character_info():
     try:
         data = load_data()
         character_info = request.json
-        print("接收到的角色信息:", character_info)
+        item_logger.debug("接收到的角色信息: %s", character_info)
 
         # 确保 stats 存在
         if "stats" not in data:
@@ -4375,10 +6707,11 @@ def update_character_info():
             return jsonify({"error": "保存数据失败"}), 500
 
     except Exception as e:
-        print(f"更新角色信息时发生错误: {str(e)}")
+        item_logger.error("更新角色信息时发生错误: %s", e)
         return jsonify({"error": f"服务器内部错误: {str(e)}"}), 500
 
 @app.route('/api/character/exp', methods=['POST'])
+@token_required()
 def add_character_exp():
     """增加角色经验值"""
     data = load_data()
@@ -4409,16 +6742,17 @@ def add_character_exp():
 
 
 @app.route('/api/character/properties/<property_category>', methods=['POST'])
+@token_required()
 def add_character_property(property_category):
     """增加角色属性点"""
     try:
         # URL解码中文字符
         property_category = unquote(property_category)
-        print(f"接收到更新属性请求: {property_category}")
+        item_logger.debug("接收到更新属性请求: %s", property_category)
 
         data = load_data()
         amount = request.json.get('amount', 0)
-        print(f"更新量: {amount}")
+        item_logger.debug("更新量: %s", amount)
 
         if amount <= 0:
             return jsonify({"error": "属性点必须大于0"}), 400
@@ -4427,14 +6761,14 @@ def add_character_property(property_category):
         # 确保 properties 是一个字典
         if "properties" not in data or not isinstance(data["properties"], dict):
             data["properties"] = generate_default_properties()
-            print("初始化 properties 为字典")
+            item_logger.debug("初始化 properties 为字典")
 
         # 更新属性值
         if property_category in data["properties"]:
             data["properties"][property_category] += amount
-            print(f"找到属性并更新: {property_category} = {data['properties'][property_category]}")
+            item_logger.debug("找到属性并更新: %s = %s", property_category, data['properties'][property_category])
         else:
-            print(f"未找到属性，创建新属性: {property_category}")
+            item_logger.debug("未找到属性，创建新属性: %s", property_category)
             data["properties"][property_category] = amount
 
         #
@@ -4467,7 +6801,7 @@ def add_character_property(property_category):
         else:
             return jsonify({"error": "保存数据失败"}), 500
     except Exception as e:
-        print(f"更新属性时发生错误: {str(e)}")
+        item_logger.error("更新属性时发生错误: %s", e)
         import traceback
         traceback.print_exc()
         return jsonify({"error": f"服务器内部错误: {str(e)}"}), 500
@@ -4477,17 +6811,20 @@ def add_character_property(property_category):
 @token_required()
 def get_character_stats():
     """获取角色属性数据"""
-    data = load_data()
+    data = load_data(sections=("stats",))
     return jsonify(data["stats"])
 
 @app.route('/api/credits', methods=['GET'])
+@token_required()
 def get_credits():
     """获取积分数据"""
-    data = load_data()
+    data = load_data(sections=("credits",))
     return jsonify(data["credits"])
 
 # 通过url参数更新积分数据
 @app.route('/api/credits/add/<credit_type>/<amount>', methods=['POST'])
+@token_required()
+@optimistic_concurrency
 def add_credit(credit_type, amount):
     """通过URL参数新增积分"""
     try:
@@ -4501,7 +6838,7 @@ def add_credit(credit_type, amount):
     except UnicodeDecodeError:
         return jsonify({"error": "积分类型字符编码错误"}), 400
 
-    data = load_data()
+    data = load_data(sections=("credits",))
 
     # 验证积分类型是否存在
     if credit_type not in data["credits"]:
@@ -4519,9 +6856,11 @@ def add_credit(credit_type, amount):
         return jsonify({"error": "保存数据失败"}), 500
 
 @app.route('/api/credits/<credit_type>', methods=['PUT'])
+@token_required()
+@optimistic_concurrency
 def update_credit(credit_type):
     """更新积分"""
-    data = load_data()
+    data = load_data(sections=("credits",))
     amount = request.json.get('amount')
 
     if amount < 0:
@@ -4537,6 +6876,8 @@ def update_credit(credit_type):
 
 # 转换积分 (to be deprecated)
 @app.route('/api/credits/conversion', methods=['POST'])
+@token_required()
+@optimistic_concurrency
 def convert_credits():
     """转换积分"""
     data = load_data()
@@ -4563,6 +6904,7 @@ def convert_credits():
 
 # 获取转换比率 (to be deprecated)
 @app.route('/api/credits/conversion-rates', methods=['GET'])
+@token_required()
 def get_conversion_rates():
     """获取转换比率"""
     data = load_data()
@@ -4570,6 +6912,8 @@ def get_conversion_rates():
 
 # 更新转换比率 (to be deprecated)
 @app.route('/api/credits/conversion-rates', methods=['PUT'])
+@token_required()
+@optimistic_concurrency
 def update_conversion_rates():
     """更新转换比率"""
     data = load_data()
@@ -4591,13 +6935,16 @@ def update_conversion_rates():
 
 
 @app.route('/api/items', methods=['GET'])
+@token_required()
 def get_items():
     """获取道具列表"""
-    data = load_data()
+    data = load_data(sections=("items",))
     return jsonify(data["items"])
 
 
 @app.route('/api/items', methods=['POST'])
+@token_required()
+@optimistic_concurrency
 def add_item():
     """添加新道具"""
     data = load_data()
@@ -4630,6 +6977,8 @@ def add_item():
 
 
 @app.route('/api/items/<item_name>', methods=['PUT'])
+@token_required()
+@optimistic_concurrency
 def update_item(item_name):
     """更新道具"""
     data = load_data()
@@ -4659,6 +7008,8 @@ def update_item(item_name):
 
 
 @app.route('/api/items/<item_name>', methods=['DELETE'])
+@token_required()
+@optimistic_concurrency
 def delete_item(item_name):
     """删除道具"""
     data = load_data()
@@ -4676,6 +7027,8 @@ def delete_item(item_name):
 
 
 @app.route('/api/items/batch-delete', methods=['POST'])
+@token_required()
+@optimistic_concurrency
 def batch_delete_items():
     """批量删除道具"""
     try:
@@ -4717,13 +7070,15 @@ def batch_delete_items():
             return jsonify({"error": "保存数据失败"}), 500
 
     except Exception as e:
-        print(f"批量删除道具时发生错误: {str(e)}")
+        item_logger.error("批量删除道具时发生错误: %s", e)
         return jsonify({"error": f"服务器内部错误: {str(e)}"}), 500
 
 @app.route('/api/items/buy', methods=['POST'])
+@token_required()
+@optimistic_concurrency
 def buy_item():
     """购买道具"""
-    data = load_data()
+    data = load_data(sections=("items", "credits", "backpack"))
     item_name = request.json.get('item_name')
     count = request.json.get('count')
 
@@ -4752,15 +7107,18 @@ def buy_item():
 
 
 @app.route('/api/backpack', methods=['GET'])
+@token_required()
 def get_backpack():
     """获取包裹数据"""
-    data = load_data()
+    data = load_data(sections=("backpack",))
     # 只返回拥有数量大于0的道具
     backpack = {k: v for k, v in data["backpack"].items() if v > 0}
     return jsonify(backpack)
 
 
 @app.route('/api/backpack/use', methods=['POST'])
+@token_required()
+@optimistic_concurrency
 def use_item():
     """使用道具"""
     settings = load_settings()
@@ -4778,7 +7136,7 @@ def use_item():
     item_info = data["items"][item_name]
     loot_boxes = item_info.get("lootBoxes", [])
 
-    print('using item: ', item_info.get("category"))
+    item_logger.debug("using item: %s", item_info.get("category"))
 
     # 如果有宝箱效果，则执行开箱逻辑
     if loot_boxes and len(loot_boxes) > 0:
@@ -5138,11 +7496,13 @@ def use_item():
 
 
 @app.route('/api/logs_old', methods=['GET'])
+@token_required()
 def get_logs_old():
     """获取日志"""
     try:
         if os.path.exists(config_manager.LOGS_FILE):
-            with open(config_manager.LOGS_FILE, 'r', encoding='utf-8') as f:
+            with data_locks.acquire(config_manager.LOGS_FILE), \
+                    open(config_manager.LOGS_FILE, 'r', encoding='utf-8') as f:
                 data = json.load(f)
                 return jsonify({'logs': data.get('logs', [])})
         else:
@@ -5151,12 +7511,13 @@ def get_logs_old():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/logs/save_old', methods=['POST'])
+@token_required()
 def save_logs_old():
     """保存日志"""
     try:
         data = request.json
-        with open(config_manager.LOGS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        with data_locks.acquire(config_manager.LOGS_FILE, exclusive=True):
+            write_json_atomic(config_manager.LOGS_FILE, data)
         return jsonify({'message': '日志保存成功'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -5166,8 +7527,9 @@ def save_logs_old():
 def clear_logs():
     """清空日志"""
     try:
-        if os.path.exists(config_manager.LOGS_FILE):
-            os.remove(config_manager.LOGS_FILE)
+        with data_locks.acquire(config_manager.LOGS_FILE, exclusive=True):
+            if os.path.exists(config_manager.LOGS_FILE):
+                os.remove(config_manager.LOGS_FILE)
         return jsonify({'message': '日志已清空'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -5192,19 +7554,360 @@ def clear_logs():
 #         return jsonify({"error": "保存数据失败"}), 500
 
 
+def normalize_task_time(value):
+    """把任务中的时间统一为 "YYYY-MM-DD HH:MM:SS" 字符串（可直接按字符串比较），无法解析时返回 None
+
+    支持 ISO 格式、"YYYY/MM/DD HH:MM:SS"、"YYYY-MM-DD HH:MM[:SS]"、只有日期以及 "YYYYMMDD" 的写法。
+    """
+    if not isinstance(value, str) or not value.strip():
+        return None
+    text = value.strip()
+    try:
+        if 'T' in text:
+            parsed = datetime.fromisoformat(text)
+            if parsed.tzinfo is not None:
+                parsed = parsed.astimezone().replace(tzinfo=None)
+            return parsed.strftime("%Y-%m-%d %H:%M:%S")
+        text = text.replace('/', '-')
+        if text.isdigit():
+            return datetime.strptime(text, "%Y%m%d").strftime("%Y-%m-%d %H:%M:%S")
+        for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+            try:
+                return datetime.strptime(text, fmt).strftime("%Y-%m-%d %H:%M:%S")
+            except ValueError:
+                continue
+    except ValueError:
+        pass
+    return None
+
+
+# 任务查询
+TASK_VALUE_FIELDS = ("status", "category", "domain", "priority")  # 按取值筛选的字段
+TASK_TIME_FIELDS = ("start_time", "complete_time")
+TASK_SORT_FIELDS = ("id", "name", "status", "category", "domain", "priority", "start_time", "complete_time")
+TASK_PRIORITY_ORDER = {"重要且紧急": 0, "重要不紧急": 1, "不重要但紧急": 2, "不重要不紧急": 3}
+
+
+def _task_index_value(value):
+    """索引中使用的取值（不可哈希的值转成JSON字符串）"""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return json.dumps(value, ensure_ascii=False, sort_keys=True)
+
+
+class TaskQueryIndex:
+    """某一版本任务列表的二级索引
+
+    按取值筛选的字段记录 取值 -> 任务位置集合；时间字段记录按时间排序的 (时间, 位置) 列表，
+    范围查询用二分查找；排序顺序在首次按该字段排序时计算。索引中只保存位置，
+    查询结果从同一版本的任务列表中取出。
+    """
+
+    def __init__(self, tasks):
+        self.size = len(tasks)
+        self._ids = [task.get("id") if isinstance(task.get("id"), int) else -1 for task in tasks]
+        self._values = {field: {} for field in TASK_VALUE_FIELDS + ("archived", "tags")}
+        self._sort_keys = {field: [] for field in TASK_SORT_FIELDS}
+        for pos, task in enumerate(tasks):
+            for field in TASK_VALUE_FIELDS:
+                self._values[field].setdefault(_task_index_value(task.get(field)), set()).add(pos)
+            self._values["archived"].setdefault(bool(task.get("archived")), set()).add(pos)
+            tags = task.get("tags")
+            if isinstance(tags, list):
+                for tag in {_task_index_value(tag) for tag in tags}:
+                    self._values["tags"].setdefault(tag, set()).add(pos)
+
+            self._sort_keys["id"].append(self._ids[pos])
+            self._sort_keys["priority"].append(TASK_PRIORITY_ORDER.get(task.get("priority"), len(TASK_PRIORITY_ORDER)))
+            for field in ("name", "status", "category", "domain"):
+                value = task.get(field)
+                self._sort_keys[field].append("" if value is None else str(value))
+            for field in TASK_TIME_FIELDS:
+                self._sort_keys[field].append(normalize_task_time(task.get(field)) or "")
+
+        self._times = {}  # 时间字段 -> (时间列表, 位置列表)，不含没有时间的任务
+        for field in TASK_TIME_FIELDS:
+            timed = sorted((value, pos) for pos, value in enumerate(self._sort_keys[field]) if value)
+            self._times[field] = ([value for value, _ in timed], [pos for _, pos in timed])
+        self._orders = {}  # 排序字段 -> (排序键列表, 位置列表)
+
+    def sort_key(self, field, pos):
+        """任务的排序键：(字段值, 任务ID)，同时用作分页游标"""
+        return (self._sort_keys[field][pos], self._ids[pos])
+
+    def _order(self, field):
+        order = self._orders.get(field)
+        if order is None:
+            ranked = sorted(range(self.size), key=lambda pos: self.sort_key(field, pos))
+            order = ([self.sort_key(field, pos) for pos in ranked], ranked)
+            self._orders[field] = order
+        return order
+
+    def match(self, filters, time_ranges):
+        """返回满足全部条件的位置集合，没有条件时返回 None（表示全部）
+
+        filters 为 {字段: 取值列表}：同一字段内任一取值即可，tags 须包含全部标签。
+        time_ranges 为 {时间字段: (起, 止)}，端点为 None 表示不限。
+        """
+        candidates = None
+        for field, wanted in filters.items():
+            values = self._values[field]
+            if field == "tags":
+                matched = [values.get(tag, set()) for tag in wanted]
+            else:
+                matched = [set().union(*(values.get(value, ()) for value in wanted))]
+            for positions in matched:
+                candidates = positions if candidates is None else candidates & positions
+        for field, (start, end) in time_ranges.items():
+            times, positions = self._times[field]
+            lo = bisect.bisect_left(times, start) if start else 0
+            hi = bisect.bisect_right(times, end) if end else len(times)
+            in_range = set(positions[lo:hi])
+            candidates = in_range if candidates is None else candidates & in_range
+        return candidates
+
+    def query(self, filters, time_ranges, sort, descending=False, cursor=None, limit=TASKS_PAGE_SIZE):
+        """按条件筛选并排序分页，返回 (匹配总数, 本页任务位置列表, 下一页游标或 None)"""
+        candidates = self.match(filters, time_ranges)
+        total = self.size if candidates is None else len(candidates)
+
+        if candidates is not None and len(candidates) * 4 < self.size:
+            # 匹配的任务较少时直接对其排序，不必遍历完整的排序顺序
+            ranked = sorted(candidates, key=lambda pos: self.sort_key(sort, pos), reverse=descending)
+            if cursor is not None:
+                ranked = [pos for pos in ranked
+                          if (self.sort_key(sort, pos) < cursor if descending else self.sort_key(sort, pos) > cursor)]
+            page = ranked[:limit + 1]
+        else:
+            keys, ranked = self._order(sort)
+            if descending:
+                index = (bisect.bisect_left(keys, cursor) if cursor is not None else len(keys)) - 1
+                step = -1
+            else:
+                index = bisect.bisect_right(keys, cursor) if cursor is not None else 0
+                step = 1
+            page = []
+            while 0 <= index < len(ranked) and len(page) <= limit:
+                if candidates is None or ranked[index] in candidates:
+                    page.append(ranked[index])
+                index += step
+
+        if len(page) > limit:
+            page = page[:limit]
+            return total, page, self.sort_key(sort, page[-1])
+        return total, page, None
+
+
+class TaskIndexCache:
+    """按用户缓存任务查询索引，任务内容变化后重建
+
+    缓存键为 (数据版本, 存储代号)：删除后重新注册用户时版本号会从头开始，
+    存储代号在创建和恢复数据时重新生成，两者一起才能唯一标识一份任务列表。
+    """
+
+    def __init__(self, max_entries):
+        self._entries = OrderedDict()  # 数据路径 -> ((版本, 存储代号), 索引)
+        self._lock = threading.Lock()
+        self._max_entries = max_entries
+        self.hits = 0
+        self.builds = 0
+
+    def get(self, path, version, generation, tasks):
+        """返回与 version、generation 对应的索引，没有时用 tasks 建立"""
+        key = (version, generation)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == key:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[1]
+            self.builds += 1
+        index = TaskQueryIndex(tasks)
+        # 默认数据尚未保存时没有版本号，不缓存
+        if version is not None:
+            with self._lock:
+                self._entries[path] = (key, index)
+                self._entries.move_to_end(path)
+                while len(self._entries) > self._max_entries:
+                    self._entries.popitem(last=False)
+        return index
+
+    def stats(self):
+        """获取索引命中统计"""
+        with self._lock:
+            return {"pid": os.getpid(), "hits": self.hits, "builds": self.builds, "entries": len(self._entries)}
+
+
+task_index_cache = TaskIndexCache(TASK_INDEX_CACHE_SIZE)
+
+
+def encode_task_cursor(sort, key):
+    return base64.urlsafe_b64encode(json.dumps([sort, *key], ensure_ascii=False).encode('utf-8')).decode('ascii')
+
+
+def parse_task_query(args):
+    """解析任务查询参数，参数无效时抛出 ValueError"""
+    filters = {}
+    for field in TASK_VALUE_FIELDS + ("tags",):
+        if args.get(field):
+            filters[field] = [value.strip() for value in args[field].split(',') if value.strip()]
+    if args.get('archived'):
+        archived = args['archived'].lower()
+        if archived not in ('true', 'false', '1', '0'):
+            raise ValueError("archived 必须为 true 或 false")
+        filters["archived"] = [archived in ('true', '1')]
+
+    time_ranges = {}
+    for field, prefix in (("start_time", "start"), ("complete_time", "complete")):
+        bounds = []
+        for suffix in ("from", "to"):
+            raw = args.get(f"{prefix}_{suffix}")
+            value = normalize_task_time(raw) if raw else None
+            if raw and value is None:
+                raise ValueError(f"{prefix}_{suffix} 时间格式无效: {raw}")
+            # 只写日期的截止时间包含当天
+            if value and suffix == "to" and len(raw.strip()) <= 10:
+                value = value[:10] + " 23:59:59"
+            bounds.append(value)
+        if any(bounds):
+            time_ranges[field] = tuple(bounds)
+
+    sort = args.get('sort', 'id')
+    descending = sort.startswith('-')
+    sort = sort.lstrip('-')
+    if sort not in TASK_SORT_FIELDS:
+        raise ValueError(f"不支持的排序字段: {sort}")
+
+    limit = args.get('page_size', TASKS_PAGE_SIZE, type=int)
+    if not 1 <= limit <= TASKS_MAX_PAGE_SIZE:
+        raise ValueError(f"page_size 必须在1到{TASKS_MAX_PAGE_SIZE}之间")
+
+    cursor = None
+    if args.get('cursor'):
+        try:
+            raw = args['cursor']
+            cursor_sort, *key = json.loads(base64.urlsafe_b64decode(raw + '=' * (-len(raw) % 4)))
+        except (ValueError, TypeError):
+            raise ValueError("cursor 无效")
+        if cursor_sort != sort or len(key) != 2 or not isinstance(key[1], int) \
+                or not isinstance(key[0], int if sort in ("id", "priority") else str):
+            raise ValueError("cursor 与排序方式不匹配")
+        cursor = tuple(key)
+
+    return {"filters": filters, "time_ranges": time_ranges, "sort": sort, "descending": descending,
+            "cursor": cursor, "limit": limit}
+
+
 @app.route('/api/tasks', methods=['GET'])
+@token_required()
 def get_tasks():
-    """获取任务列表"""
-    data = load_data()
-    # 确保所有任务都有必要的字段（兼容旧数据）
-    for task in data["tasks"]:
-        if "task_type" not in task:
-            task["task_type"] = "无循环"
-        if "completed_count" not in task:
-            task["completed_count"] = 0
-        if "max_completions" not in task:
-            task["max_completions"] = 0
-    return jsonify(data["tasks"])
+    """获取任务列表
+
+    不带查询参数时返回全部任务（数组）。带参数时按条件筛选并分页，返回 {tasks, total, next_cursor}：
+      status、category、domain、priority   逗号分隔，匹配其中任一取值
+      tags                               逗号分隔，须包含全部标签
+      archived                           true 或 false
+      start_from、start_to、complete_from、complete_to  时间范围（含端点），可以只写日期
+      sort                               排序字段（默认 id），前缀 - 表示降序
+      page_size、cursor                   每页数量，以及上一页返回的 next_cursor
+    """
+    data = load_data(sections=("tasks",))
+    if not request.args:
+        return jsonify(data["tasks"])
+
+    try:
+        query = parse_task_query(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    tasks = data["tasks"]
+    index = task_index_cache.get(get_master_data_store().path, g.get("data_version"), g.get("data_generation"),
+                                 tasks)
+    total, positions, next_key = index.query(**query)
+    return jsonify({
+        "tasks": [tasks[pos] for pos in positions],
+        "total": total,
+        "page_size": query["limit"],
+        "next_cursor": encode_task_cursor(query["sort"], next_key) if next_key is not None else None,
+    })
+
+@app.route('/api/tasks/changes', methods=['GET'])
+@token_required()
+def get_task_changes():
+    """增量同步：返回修订号 since 之后新增或修改的任务以及删除的任务ID
+
+    返回 {rev, tasks, deleted, full}。客户端保存返回的 rev，下次作为 since 传入。
+    since 早于保留的删除记录或晚于当前修订号（如数据被恢复）时返回全部任务并置 full 为 true，
+    客户端应以 tasks 整体替换本地列表。
+    """
+    since = request.args.get('since', 0, type=int)
+    data = load_data(sections=TASK_SECTIONS)
+    task_meta = data.get("task_meta", {})
+    rev = task_meta.get("rev", 0)
+    tasks = data.get("tasks", [])
+
+    if since < task_meta.get("tombstone_floor", 0) or since > rev:
+        return jsonify({"rev": rev, "tasks": tasks, "deleted": [], "full": True})
+
+    return jsonify({
+        "rev": rev,
+        "tasks": [task for task in tasks if task.get("updated_rev", 0) > since],
+        "deleted": [task_id for task_id, deleted_rev in task_meta.get("tombstones", []) if deleted_rev > since],
+        "full": False,
+    })
+
+
+@app.route('/api/tasks/archive', methods=['GET'])
+@token_required()
+def get_archived_tasks():
+    """分页查询已移入归档分段的任务
+
+    查询参数：month（YYYY-MM，不传时查询全部月份）、page、page_size。
+    返回 {tasks, total, page, page_size, months}，months 为各月份的任务数（新的月份在前）。
+    """
+    month = request.args.get('month') or None
+    page = request.args.get('page', 1, type=int)
+    page_size = request.args.get('page_size', TASK_ARCHIVE_PAGE_SIZE, type=int)
+    if month is not None and not re.fullmatch(r'\d{4}-\d{2}', month):
+        return jsonify({"error": "month 格式应为 YYYY-MM"}), 400
+    if page < 1 or not 1 <= page_size <= TASKS_MAX_PAGE_SIZE:
+        return jsonify({"error": f"page 必须大于0，page_size 必须在1到{TASKS_MAX_PAGE_SIZE}之间"}), 400
+
+    archive = get_task_archive()
+    total, tasks = archive.query(month, offset=(page - 1) * page_size, limit=page_size)
+    return jsonify({"tasks": tasks, "total": total, "page": page, "page_size": page_size,
+                    "months": archive.months()})
+
+
+@app.route('/api/tasks/archive/<int:task_id>/restore', methods=['POST'])
+@token_required()
+@optimistic_concurrency
+def restore_archived_task(task_id):
+    """把归档分段中的任务恢复到任务列表并取消归档"""
+    archive = get_task_archive()
+    task = archive.get(task_id)
+    if task is None:
+        return jsonify({"error": "归档任务不存在"}), 404
+
+    data = load_data(sections=TASK_SECTIONS)
+    existing = data.find_task(task_id)
+    if existing == task:
+        # 上次移入归档后主数据未保存成功，任务仍在列表中
+        task = existing
+    else:
+        if existing is not None:
+            # ID 已被其他任务占用时分配新ID
+            task["id"] = data.allocate_task_id()
+        data.append_task(task)
+    task["archived"] = False
+
+    # 先保存任务列表再从归档中删除，中途失败时任务仍留在归档中
+    if safe_save_data(data):
+        archive.remove(task_id)
+        return jsonify({"message": f"任务'{task['name']}'已恢复", "task": task})
+    else:
+        return jsonify({"error": "保存数据失败"}), 500
+
 
 def tailor_task_name(task_name):
     """若任务名称过长则裁剪任务名称"""
@@ -5217,23 +7920,10 @@ def tailor_task_name(task_name):
     return task_name[:max_length]+"..." if len(task_name) > max_length else task_name
 
 
-@app.route('/api/tasks', methods=['POST'])
-def add_task():
-    """添加新任务"""
-    data = load_data()
-    task_data = request.json
-
-    # 生成新的任务ID
-    all_ids = [task["id"] for task in data["tasks"]]
-    existing_id = task_data.get('id')
-    if existing_id and existing_id not in all_ids:
-        new_id = task_data.get('id')
-    else:
-        new_id = max([task["id"] for task in data["tasks"]], default=0) + 1
-
-
-    new_task = {
-        "id": new_id,
+def build_task(task_id, task_data):
+    """按请求数据构造新任务，未提供的字段使用默认值"""
+    return {
+        "id": task_id,
         "name": tailor_task_name(task_data.get('name')),
         "description": task_data.get('description'),
         "task_type": task_data.get('task_type', '无循环'),
@@ -5254,7 +7944,18 @@ def add_task():
         "tags": task_data.get('tags', []),
     }
 
-    data["tasks"].append(new_task)
+
+@app.route('/api/tasks', methods=['POST'])
+@token_required()
+@optimistic_concurrency
+def add_task():
+    """添加新任务"""
+    data = load_data()
+    task_data = request.json
+
+    # 生成新的任务ID（客户端自带且未被占用的ID直接使用）
+    new_task = build_task(data.allocate_task_id(task_data.get('id')), task_data)
+    data.append_task(new_task)
 
     if safe_save_data(data):
         return jsonify({"message": f"任务'{new_task['name']}'添加成功", "task": new_task})
@@ -5262,49 +7963,144 @@ def add_task():
         return jsonify({"error": "保存数据失败"}), 500
 
 @app.route('/api/tasks/<int:task_id>', methods=['PUT'])
+@token_required()
+@optimistic_concurrency
 def update_task(task_id):
     """更新任务"""
     data = load_data()
     task_data = request.json
 
-    for task in data["tasks"]:
-        if task["id"] == task_id:
-            task["name"] = tailor_task_name(task_data.get('name'))
-            task["description"] = task_data.get('description')
-            task["task_type"] = task_data.get('task_type', '无循环')
-            task["max_completions"] = task_data.get('max_completions', 0)
-            task["category"] = task_data.get('category', '未分类')
-            task["domain"] = task_data.get('domain', '学习')  # 更新领域属性
-            task["priority"] = task_data.get('priority', '重要且紧急')  # 更新重要性属性
-            task["credits_reward"] = task_data.get('credits_reward', {})
-            task["items_reward"] = task_data.get('items_reward', {})
-            # 添加新增字段的处理
-            task["start_time"] = task_data.get('start_time')
-            task["complete_time"] = task_data.get('complete_time')
-            task["archived"] = task_data.get('archived', False)
-            task['status'] = task_data.get('status', '未完成')
-            task['completed_count'] = task_data.get('completed_count', 0)
-            task["total_completion_count"] = task_data.get('total_completion_count', 0)
-            exp_reward=task_data.get('exp_reward', 0)
-            task["exp_reward"] = exp_reward
-            task["notes"] = task_data.get('notes', '')
-            task["tags"] = task_data.get('tags', [])
-            # print(f"设置任务 {task_id} 的经验值为: {exp_reward}")
-
-
-            if safe_save_data(data):
-                return jsonify({"message": f"任务'{task['name']}'更新成功", "task": task})
-            else:
-                return jsonify({"error": "保存数据失败"}), 500
+    task = data.find_task(task_id)
+    if task is None:
+        return jsonify({"error": "任务不存在"}), 404
 
-    return jsonify({"error": "任务不存在"}), 404
+    task["name"] = tailor_task_name(task_data.get('name'))
+    task["description"] = task_data.get('description')
+    task["task_type"] = task_data.get('task_type', '无循环')
+    task["max_completions"] = task_data.get('max_completions', 0)
+    task["category"] = task_data.get('category', '未分类')
+    task["domain"] = task_data.get('domain', '学习')  # 更新领域属性
+    task["priority"] = task_data.get('priority', '重要且紧急')  # 更新重要性属性
+    task["credits_reward"] = task_data.get('credits_reward', {})
+    task["items_reward"] = task_data.get('items_reward', {})
+    # 添加新增字段的处理
+    task["start_time"] = task_data.get('start_time')
+    task["complete_time"] = task_data.get('complete_time')
+    task["archived"] = task_data.get('archived', False)
+    task['status'] = task_data.get('status', '未完成')
+    task['completed_count'] = task_data.get('completed_count', 0)
+    task["total_completion_count"] = task_data.get('total_completion_count', 0)
+    exp_reward=task_data.get('exp_reward', 0)
+    task["exp_reward"] = exp_reward
+    task["notes"] = task_data.get('notes', '')
+    task["tags"] = task_data.get('tags', [])
+    # print(f"设置任务 {task_id} 的经验值为: {exp_reward}")
+
+    if safe_save_data(data):
+        return jsonify({"message": f"任务'{task['name']}'更新成功", "task": task})
+    else:
+        return jsonify({"error": "保存数据失败"}), 500
+
+
+# 任务字段校验：字段 -> (允许的类型, 是否允许 null, 额外检查)，额外检查返回错误信息或 None
+TASK_TYPES = ("无循环", "日循环", "周循环", "月循环", "年循环")
+
+
+def _check_non_negative(value):
+    return "不能为负数" if value < 0 else None
+
+
+def _check_reward_map(value):
+    for key, amount in value.items():
+        if isinstance(amount, bool) or not isinstance(amount, (int, float)):
+            return f"中 {key} 的数量必须为数字"
+    return None
+
+
+def _check_task_time(value):
+    # 空字符串表示清空时间
+    return None if not value or normalize_task_time(value) else "时间格式无效"
+
+
+TASK_FIELD_SCHEMA = {
+    "name": (str, False, lambda value: "不能为空" if not value.strip() else None),
+    "description": (str, True, None),
+    "task_type": (str, False, lambda value: None if value in TASK_TYPES else f"必须为 {'、'.join(TASK_TYPES)} 之一"),
+    "max_completions": (int, False, _check_non_negative),
+    "completed_count": (int, False, _check_non_negative),
+    "total_completion_count": (int, False, _check_non_negative),
+    "category": (str, False, None),
+    "domain": (str, False, None),
+    "priority": (str, False, None),
+    "status": (str, False, None),
+    "start_time": (str, True, _check_task_time),
+    "complete_time": (str, True, _check_task_time),
+    "archived": (bool, False, None),
+    "credits_reward": (dict, False, _check_reward_map),
+    "items_reward": (dict, False, _check_reward_map),
+    "exp_reward": ((int, float), False, _check_non_negative),
+    "notes": (str, True, None),
+    "tags": (list, False, lambda value: None if all(isinstance(tag, str) for tag in value) else "只能包含字符串"),
+}
+
+
+def validate_task_fields(fields):
+    """按 TASK_FIELD_SCHEMA 校验任务字段，返回错误信息列表"""
+    errors = []
+    for field, value in fields.items():
+        schema = TASK_FIELD_SCHEMA.get(field)
+        if schema is None:
+            errors.append(f"不支持修改字段: {field}")
+            continue
+        expected, nullable, check = schema
+        if value is None:
+            if not nullable:
+                errors.append(f"{field} 不能为 null")
+            continue
+        # bool 是 int 的子类，数值字段不接受 true/false
+        if not isinstance(value, expected) or (isinstance(value, bool) and expected is not bool):
+            errors.append(f"{field} 类型错误")
+            continue
+        message = check(value) if check else None
+        if message:
+            errors.append(f"{field} {message}")
+    return errors
+
+
+@app.route('/api/tasks/<int:task_id>', methods=['PATCH'])
+@token_required()
+@optimistic_concurrency
+def patch_task(task_id):
+    """部分更新任务：只修改请求中提供的字段，未提供的字段保持不变"""
+    fields = request.get_json(silent=True)
+    if not isinstance(fields, dict) or not fields:
+        return jsonify({"error": "请求体必须是包含待修改字段的对象"}), 400
+    errors = validate_task_fields(fields)
+    if errors:
+        return jsonify({"error": "; ".join(errors)}), 400
+
+    data = load_data(sections=TASK_SECTIONS)
+    task = data.find_task(task_id)
+    if task is None:
+        return jsonify({"error": "任务不存在"}), 404
+
+    if "name" in fields:
+        fields["name"] = tailor_task_name(fields["name"])
+    task.update(fields)
+
+    if safe_save_data(data):
+        return jsonify({"message": f"任务'{task['name']}'更新成功", "task": task})
+    else:
+        return jsonify({"error": "保存数据失败"}), 500
 
 
 @app.route('/api/tasks/<int:task_id>', methods=['DELETE'])
+@token_required()
+@optimistic_concurrency
 def delete_task(task_id):
     """删除任务"""
     data = load_data()
-    data["tasks"] = [task for task in data["tasks"] if task["id"] != task_id]
+    data.remove_task(task_id)
 
     if safe_save_data(data):
         return jsonify({"message": "任务已删除"})
@@ -5312,9 +8108,118 @@ def delete_task(task_id):
         return jsonify({"error": "保存数据失败"}), 500
 
 
-def check_level_up(data):
+def apply_bulk_task_operation(data, operation):
+    """执行批量修改中的单个操作，返回结果字典；操作无效时抛出 ValueError"""
+    if not isinstance(operation, dict):
+        raise ValueError("操作必须是对象")
+    kind = operation.get("op")
+
+    if kind == "create":
+        task_data = operation.get("task")
+        if not isinstance(task_data, dict) or not task_data.get("name"):
+            raise ValueError("create 操作须提供包含 name 的 task")
+        task_id = task_data.get("id")
+        if task_id is not None and (not isinstance(task_id, int) or isinstance(task_id, bool)):
+            raise ValueError("id 类型错误")
+        errors = validate_task_fields({field: value for field, value in task_data.items() if field != "id"})
+        if errors:
+            raise ValueError("; ".join(errors))
+        task = build_task(data.allocate_task_id(task_data.get("id")), task_data)
+        data.append_task(task)
+        return {"task": task}
+
+    if kind not in ("update", "delete", "complete", "archive"):
+        raise ValueError(f"不支持的操作: {kind}")
+    task_id = operation.get("id")
+    task = data.find_task(task_id)
+    if task is None:
+        raise ValueError(f"任务不存在: {task_id}")
+
+    if kind == "update":
+        fields = operation.get("fields")
+        if not isinstance(fields, dict) or not fields:
+            raise ValueError("update 操作须提供 fields")
+        errors = validate_task_fields(fields)
+        if errors:
+            raise ValueError("; ".join(errors))
+        if "name" in fields:
+            fields["name"] = tailor_task_name(fields["name"])
+        task.update(fields)
+        return {"task": task}
+    if kind == "delete":
+        data.remove_task(task_id)
+        return {"id": task_id}
+    if kind == "complete":
+        rewards = apply_task_completion(data, task, operation.get("fields") or {})
+        return {"task": task, **task_reward_response(data, rewards)}
+    archived = operation.get("archived", True)
+    if not isinstance(archived, bool):
+        raise ValueError("archived 必须为 true 或 false")
+    task["archived"] = archived
+    return {"task": task}
+
+
+@app.route('/api/tasks/bulk', methods=['POST'])
+@token_required()
+@optimistic_concurrency
+def bulk_tasks():
+    """批量修改任务：一次加载、一次完整性检查、一次写入
+
+    请求体 {"operations": [...], "atomic": false}，操作按顺序执行：
+      {"op": "create", "task": {...}}                   字段校验同 PATCH，可另带 id
+      {"op": "update", "id": 任务ID, "fields": {...}}    只修改提供的字段，校验同 PATCH
+      {"op": "delete", "id": 任务ID}
+      {"op": "complete", "id": 任务ID, "fields": {...}}  fields 同 /complete 的请求体
+      {"op": "archive", "id": 任务ID, "archived": true}
+    返回 {"results": [...], "saved": 是否已保存}，每个结果包含 index、ok 以及 task/reward 或 error。
+    失败的操作被跳过；atomic 为 true 时任一操作失败则全部不保存并返回 400。
+    """
+    payload = request.get_json(silent=True) or {}
+    operations = payload.get("operations")
+    if not isinstance(operations, list) or not operations:
+        return jsonify({"error": "operations 必须是非空列表"}), 400
+    if len(operations) > TASKS_BULK_MAX_OPERATIONS:
+        return jsonify({"error": f"一次最多{TASKS_BULK_MAX_OPERATIONS}个操作"}), 400
+
+    # 完成任务会发放奖励，需要读取完整数据
+    needs_all = any(isinstance(op, dict) and op.get("op") == "complete" for op in operations)
+    data = load_data(sections=None if needs_all else TASK_SECTIONS)
+    task_count = len(data["tasks"])
+    expected_count = task_count
+
+    results = []
+    for position, operation in enumerate(operations):
+        try:
+            result = apply_bulk_task_operation(data, operation)
+        except ValueError as e:
+            results.append({"index": position, "ok": False, "error": str(e)})
+            continue
+        if operation["op"] == "create":
+            expected_count += 1
+        elif operation["op"] == "delete":
+            expected_count -= 1
+        results.append({"index": position, "ok": True, **result})
+
+    failed = sum(1 for result in results if not result["ok"])
+    if failed and payload.get("atomic"):
+        return jsonify({"error": f"{failed}个操作失败，未保存任何修改", "results": results, "saved": False}), 400
+    if failed == len(results):
+        return jsonify({"results": results, "saved": False})
+
+    # 任务数必须与操作的预期一致；此时已精确核对，不再按单个字段的差异阈值拦截批量增删
+    if len(data["tasks"]) != expected_count:
+        task_logger.error("批量修改后任务数异常: 期望 %s，实际 %s", expected_count, len(data["tasks"]))
+        return jsonify({"error": "批量修改后任务数异常，未保存"}), 500
+    if safe_save_data(data, enable_single_field_max_check=False):
+        return jsonify({"results": results, "saved": True})
+    else:
+        return jsonify({"error": "保存数据失败"}), 500
+
+
+def check_level_up(data, settings=None):
     """检查并处理角色升级"""
-    settings = load_settings()
+    if settings is None:
+        settings = load_settings()
     if not settings or "expFormulas" not in settings:
         return None
 
@@ -5339,24 +8244,18 @@ def check_level_up(data):
 
     return None
 
-@app.route('/api/tasks/<int:task_id>/complete', methods=['POST'])
-def complete_task(task_id):
-    """完成任务并发放奖励"""
-    data = load_data()
-    new_data = request.json
-
-    # 查找目标任务
-    task = next((t for t in data["tasks"] if t["id"] == task_id), None)
-    if not task:
-        return jsonify({"error": "任务不存在"}), 404
+def apply_task_completion(data, task, new_data):
+    """将任务标记为完成并发放奖励（只修改 data，由调用方保存），返回 grant_task_rewards 的变化量
 
+    new_data 中的 status、complete_time、completed_count、total_completion_count 优先使用。
+    """
     # 使用前端传入的状态、完成时间、完成次数、总完成次数（如果存在）
     if 'status' in new_data:
         task["status"] = new_data['status']
 
     if 'complete_time' in new_data:
         task["complete_time"] = new_data['complete_time']
-    elif not task["complete_time"]:
+    elif not task.get("complete_time"):
         # 完成时间若不存在则补全
         task["complete_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
@@ -5366,62 +8265,107 @@ def complete_task(task_id):
     if 'total_completion_count' in new_data:
         task["total_completion_count"] = new_data['total_completion_count']
 
-    # 发放奖励
-    reward_info = []
+    return grant_task_rewards(data, task)
+
 
-    # 发放经验奖励
-    if task.get("exp_reward", 0) > 0:
-        exp_reward = task['exp_reward']
-        data["stats"]["exp"] += exp_reward
-        reward_info.append(f"经验奖励: {exp_reward}")
+def grant_task_rewards(data, task, settings=None):
+    """发放任务奖励：经验（含升级）、积分、积分对应的角色属性（characterSettings 映射）和道具
 
-        # 检查是否升级
-        level_up_info = check_level_up(data)
+    只修改 data，由调用方在同一次保存中写回。返回本次的变化量：
+    {"exp", "level_before", "level_after", "credits", "properties", "items", "messages"}，
+    messages 为面向用户的奖励说明。
+    """
+    if settings is None:
+        settings = load_settings()
+    stats = data["stats"]
+    rewards = {"exp": 0, "level_before": stats.get("level"), "level_after": stats.get("level"),
+               "credits": {}, "properties": {}, "items": {}, "messages": []}
+    messages = rewards["messages"]
+
+    # 经验奖励
+    exp_reward = task.get("exp_reward", 0)
+    if exp_reward > 0:
+        stats["exp"] += exp_reward
+        rewards["exp"] = exp_reward
+        messages.append(f"经验奖励: {exp_reward}")
+        level_up_info = check_level_up(data, settings)
         if level_up_info:
-            reward_info.append(level_up_info)
-
-    # 发放积分奖励
-    if task.get("credits_reward"):
-        for credit_type, amount in task["credits_reward"].items():
-            if credit_type in data["credits"] and amount > 0:
-                data["credits"][credit_type] += amount
-                reward_info.append(f"{credit_type}: {amount}")
-
-                # 根据积分类型更新对应属性
-                settings = load_settings()
-                if settings and "characterSettings" in settings:
-                    for setting in settings["characterSettings"]:
-                        if setting.get("creditType") == credit_type and "propertyCategory" in setting:
-                            property_category = setting["propertyCategory"]
-                            if property_category in data["properties"]:
-                                data["properties"][property_category] += amount
-                                break
-
-    # 发放道具奖励
-    if task.get("items_reward"):
-        for item_name, count in task["items_reward"].items():
-            if item_name in data["backpack"]:
-                data["backpack"][item_name] += count
-            else:
-                data["backpack"][item_name] = count
-        reward_info.append("道具奖励: " + ", ".join([f"{k}x{v}" for k, v in task["items_reward"].items()]))
+            messages.append(level_up_info)
+        rewards["level_after"] = stats.get("level")
+
+    # 积分奖励，以及积分类型映射的属性
+    property_by_credit = {}
+    for setting in (settings or {}).get("characterSettings", []):
+        credit_type = setting.get("creditType")
+        if (credit_type and credit_type not in property_by_credit
+                and setting.get("propertyCategory") in data["properties"]):
+            property_by_credit[credit_type] = setting["propertyCategory"]
+    for credit_type, amount in (task.get("credits_reward") or {}).items():
+        if credit_type in data["credits"] and amount > 0:
+            data["credits"][credit_type] += amount
+            rewards["credits"][credit_type] = amount
+            messages.append(f"{credit_type}: {amount}")
+            property_category = property_by_credit.get(credit_type)
+            if property_category:
+                data["properties"][property_category] += amount
+                rewards["properties"][property_category] = rewards["properties"].get(property_category, 0) + amount
+
+    # 道具奖励
+    items_reward = task.get("items_reward") or {}
+    if items_reward:
+        for item_name, count in items_reward.items():
+            data["backpack"][item_name] = data["backpack"].get(item_name, 0) + count
+            rewards["items"][item_name] = count
+        messages.append("道具奖励: " + ", ".join([f"{k}x{v}" for k, v in items_reward.items()]))
+
+    return rewards
+
+
+def task_reward_response(data, rewards):
+    """完成任务的响应内容：奖励说明、变化量以及受影响的字段的最新值，客户端无需再单独查询或更新"""
+    return {
+        "reward": "\n".join(rewards["messages"]) if rewards["messages"] else "无奖励",
+        "rewards": {key: value for key, value in rewards.items() if key != "messages"},
+        "totals": {
+            "exp": data["stats"].get("exp"),
+            "level": data["stats"].get("level"),
+            "credits": {key: data["credits"][key] for key in rewards["credits"]},
+            "properties": {key: data["properties"][key] for key in rewards["properties"]},
+            "backpack": {key: data["backpack"][key] for key in rewards["items"]},
+        },
+    }
+
+
+@app.route('/api/tasks/<int:task_id>/complete', methods=['POST'])
+@token_required()
+@optimistic_concurrency
+def complete_task(task_id):
+    """完成任务并发放奖励"""
+    data = load_data()
+    new_data = request.json
+
+    # 查找目标任务
+    task = data.find_task(task_id)
+    if not task:
+        return jsonify({"error": "任务不存在"}), 404
+
+    rewards = apply_task_completion(data, task, new_data)
 
     if safe_save_data(data):
-        return jsonify({
-            "message": f"任务'{task['name']}'已完成",
-            "reward": "\n".join(reward_info) if reward_info else "无奖励"
-        })
+        return jsonify({"message": f"任务'{task['name']}'已完成", **task_reward_response(data, rewards)})
     else:
         return jsonify({"error": "保存数据失败"}), 500
 
 @app.route('/api/tasks/<int:task_id>/complete_old', methods=['POST'])
+@token_required()
+@optimistic_concurrency
 def complete_task_old(task_id):
     """完成任务并发放奖励"""
     data = load_data()
     new_data = request.json
 
     # 查找目标任务
-    task = next((t for t in data["tasks"] if t["id"] == task_id), None)
+    task = data.find_task(task_id)
     if not task:
         return jsonify({"error": "任务不存在"}), 404
 
@@ -5484,13 +8428,15 @@ def complete_task_old(task_id):
     return jsonify({"error": "任务不存在"}), 404
 
 @app.route('/api/tasks/<int:task_id>/update_status_completed', methods=['POST'])
+@token_required()
+@optimistic_concurrency
 def update_as_completed(task_id):
     """完成任务并发放奖励"""
     data = load_data()
     new_data = request.json
 
     # 查找目标任务
-    task = next((t for t in data["tasks"] if t["id"] == task_id), None)
+    task = data.find_task(task_id)
     if not task:
         return jsonify({"error": "任务不存在"}), 404
 
@@ -5554,6 +8500,8 @@ def get_field_mapping():
     }
 
 @app.route('/api/items/import', methods=['POST'])
+@token_required()
+@optimistic_concurrency
 def import_items():
     """从CSV文件导入道具 - 完善版"""
     try:
@@ -5646,7 +8594,7 @@ def import_items():
                             else:
                                 item_data[field] = []
                         except Exception as e:
-                            print(f"JSON处理错误 {field}: {str(e)}, 原始值: {item_data[field]}")
+                            item_logger.error("JSON处理错误 %s: %s, 原始值: %s", field, e, item_data[field])
                             item_data[field] = []
                     else:
                         item_data[field] = []
@@ -5753,7 +8701,7 @@ def import_items():
             return jsonify({"error": "保存数据失败"}), 500
 
     except Exception as e:
-        print(f"导入道具时发生错误: {str(e)}")
+        item_logger.error("导入道具时发生错误: %s", e)
         return jsonify({"error": f"导入失败: {str(e)}"}), 500
 
 
@@ -5805,6 +8753,8 @@ def fix_json_format(json_string):
 
 
 @app.route('/api/tasks/import', methods=['POST'])
+@token_required()
+@optimistic_concurrency
 def import_tasks_from_csv():
     """从CSV文件导入任务"""
     try:
@@ -5831,7 +8781,7 @@ def import_tasks_from_csv():
                     continue
 
                 task = {
-                    "id": len(data["tasks"]) + 1,
+                    "id": data.allocate_task_id(),
                     "name": task_name,
                     "description": row.get('description', '').strip(),
                     "task_type": row.get('task_type', '无循环').strip(),
@@ -5867,7 +8817,7 @@ def import_tasks_from_csv():
                         except ValueError:
                             pass
 
-                data["tasks"].append(task)
+                data.append_task(task)
                 added_count += 1
 
             except (ValueError, KeyError) as e:
@@ -5908,10 +8858,15 @@ def import_tasks_from_csv():
 
 
 
-def batch_archive_tasks():
-    """批量归档已完成的任务"""
+def batch_archive_tasks(data=None):
+    """批量归档已完成的任务
+
+    传入 data 时只在其上修改，由调用方负责保存。
+    """
     try:
-        data = load_data()
+        save = data is None
+        if save:
+            data = load_data(sections=("tasks",))
         updated_count = 0
         today = date.today()
 
@@ -5957,19 +8912,24 @@ def batch_archive_tasks():
                     task["archived"] = True
                     updated_count += 1
 
+        if not save:
+            return updated_count
+
         # 保存更新后的数据
         if updated_count > 0 and safe_save_data(data):
-            print(f"已归档{updated_count}个任务")
+            task_logger.info("已归档%s个任务", updated_count)
             # 返回可序列化的字典而不是Response对象
             return updated_count
         else:
             return 0
 
     except Exception as e:
-        print(f"批量归档任务时出错: {str(e)}")
+        task_logger.error("批量归档任务时出错: %s", e)
         return 0  # 返回数字而不是抛出异常
 
 @app.route('/api/items/craft', methods=['POST'])
+@token_required()
+@optimistic_concurrency
 def craft_item():
     """合成道具"""
     data = load_data()
@@ -6033,126 +8993,114 @@ def craft_item():
         return jsonify({"error": "保存数据失败"}), 500
 
 # 添加循环周期检查函数
-def check_and_update_cycle_tasks():
-    """检查并重置循环任务"""
-    data = load_data()
+# 循环任务类型，重置时回到当前周期的开始
+CYCLE_TASK_TYPES = ("日循环", "周循环", "月循环", "年循环")
+
+
+def cycle_period_start(task_type, moment):
+    """moment 所在周期（日、周一开始的周、月、年）的开始时间"""
+    if task_type == "日循环":
+        return datetime(moment.year, moment.month, moment.day)
+    if task_type == "周循环":
+        monday = moment.date() - timedelta(days=moment.weekday())
+        return datetime(monday.year, monday.month, monday.day)
+    if task_type == "月循环":
+        return datetime(moment.year, moment.month, 1)
+    return datetime(moment.year, 1, 1)
+
+
+def next_cycle_period_start(task_type, moment):
+    """moment 所在周期的下一个周期的开始时间"""
+    start = cycle_period_start(task_type, moment)
+    if task_type == "日循环":
+        return start + timedelta(days=1)
+    if task_type == "周循环":
+        return start + timedelta(days=7)
+    if task_type == "月循环":
+        return datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return datetime(start.year + 1, 1, 1)
+
+
+def schedule_cycle_task(task):
+    """按开始时间计算循环任务的下次重置时间 next_reset_at（开始时间所在周期结束的时刻），非循环任务去掉该字段"""
+    start_time = normalize_task_time(task.get("start_time")) if task.get("task_type") in CYCLE_TASK_TYPES else None
+    if start_time is None:
+        task.pop("next_reset_at", None)
+        return
+    next_reset = next_cycle_period_start(task["task_type"], datetime.strptime(start_time, "%Y-%m-%d %H:%M:%S"))
+    task["next_reset_at"] = next_reset.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def build_cycle_reset_heap(tasks):
+    """按 next_reset_at 建立循环任务的最小堆，元素为 [重置时间, 任务ID]"""
+    heap = [[task["next_reset_at"], task.get("id")] for task in tasks if task.get("next_reset_at")]
+    heapq.heapify(heap)
+    return heap
+
+
+def check_and_update_cycle_tasks(data=None):
+    """检查并重置循环任务
+
+    只从 task_meta.reset_heap 中弹出 next_reset_at 已到的任务，不再逐个解析全部任务的开始时间。
+    传入 data 时只在其上修改，由调用方负责保存。
+    """
+    save = data is None
+    if save:
+        data = load_data(sections=TASK_SECTIONS)
     updated_count = 0
     now = datetime.now()
-    for task in data["tasks"]:
-        # 检查任务是否为循环任务（非"无循环"类型）且有开始时间
-        if task["task_type"] != "无循环" and task.get("start_time"):
-            start_time = task["start_time"]
-            # print('c1_start_time', start_time, type(start_time))
-            if isinstance(task["start_time"], str):
-                start_time=start_time.split(' ')[0].split('T')[0]
-                if '/' in start_time:
-                    start_time = datetime.strptime(start_time, "%Y/%m/%d")
-                elif '-' in start_time:
-                    start_time = datetime.strptime(start_time, "%Y-%m-%d")
-                else:
-                    start_time = datetime.strptime(start_time, "%Y%m%d")
-                print('c2_task_type', start_time)
-
-            # 判断是否需要重置任务
-            should_reset = False
-            new_start_time = None
-
-            # 根据循环周期类型检查是否需要重置
-            if task["task_type"] == "日循环":
-                # 如果不是今天，则需要重置
-                # print("无循环：", start_time.date())
-                # print("今天：", now.date())
-                if start_time.date() != now.date():
-                    should_reset = True
-                    new_start_time = datetime(now.year, now.month, now.day, 0, 0, 0)
-                    # print("无循环reset：", new_start_time)
-            elif task["task_type"] == "周循环":
-                # 如果不在同一周，则需要重置
-                # print("周循环：", start_time.isocalendar())
-                # print("今周：", now.isocalendar())
-                if start_time.isocalendar()[1] != now.isocalendar()[1] or start_time.year != now.year:
-                    should_reset = True
-                    new_start_time = datetime(now.year, now.month, now.day - now.weekday(), 0, 0, 0)
-                    # print("周循环reset：", should_reset)
-            elif task["task_type"] == "月循环":
-                # 如果不在同一月，则需要重置
-                # print("月循环：", start_time.month)
-                # print("今月：", now.month)
-                if start_time.month != now.month or start_time.year != now.year:
-                    should_reset = True
-                    new_start_time = datetime(now.year, now.month, 1, 0, 0, 0)
-                    # print("月循环reset：", should_reset)
-            elif task["task_type"] == "年循环":
-                # 如果不在同一年，则需要重置
-                if start_time.year != now.year:
-                    should_reset = True
-                    new_start_time = datetime(now.year, 1, 1, 0, 0, 0)
-            # 如果需要重置，则建立任务拷贝，并更新拷贝的任务状态
-            if should_reset:
-                # 若循环任务完成过则创建副本，以副本形式分离出已完成任务
-                if task["completed_count"]>0:
-                    # 创建任务副本
-                    task_copy = task.copy()  # 复制原任务的所有属性
-                    # 更新副本的ID，确保唯一性
-                    new_id = max([t["id"] for t in data["tasks"]], default=0) + 1
-                    task_copy["id"] = new_id
-                    # 更新字段状态
-                    task_copy["task_type"] = "无循环"
-                    task_copy["total_completion_count"] = task_copy["completed_count"]
-                    if not task_copy["complete_time"] in task_copy:
-                        # 完成时间不存在则补全
-                        task_copy["complete_time"] = now.strftime("%Y-%m-%d %H:%M:%S")
-                    task_copy["status"] = "已完成"
-                    task_copy['archived'] = True
-                    # 保存副本到任务列表
-                    data["tasks"].append(task_copy)
-
-                # 刷新原任务的状态
-                task["start_time"] = new_start_time.strftime("%Y-%m-%d %H:%M:%S")
-                task["completed_count"] = 0
-                task["status"] = "未完成"
-                task["archived"] = False
-                if "complete_time" in task:
-                    del task["complete_time"]
-
-                # 更新数+1
-                updated_count += 1
-
-    if updated_count > 0 and safe_save_data(data):
-        print(f"已更新{updated_count}个循环任务")
+    now_text = now.strftime("%Y-%m-%d %H:%M:%S")
+    task_meta = data.setdefault("task_meta", {})
+    if "reset_heap" not in task_meta:
+        for task in data["tasks"]:
+            schedule_cycle_task(task)
+        task_meta["reset_heap"] = build_cycle_reset_heap(data["tasks"])
+    heap = task_meta["reset_heap"]
+
+    while heap and heap[0][0] <= now_text:
+        reset_at, task_id = heapq.heappop(heap)
+        task = data.find_task(task_id)
+        # 任务已删除或修改过开始时间、循环类型时堆中的记录已过期
+        if task is None or task.get("next_reset_at") != reset_at or task.get("task_type") not in CYCLE_TASK_TYPES:
+            continue
+
+        # 若循环任务完成过则创建副本，以副本形式分离出已完成任务
+        if task.get("completed_count", 0) > 0:
+            # 创建任务副本
+            task_copy = task.copy()  # 复制原任务的所有属性
+            # 更新副本的ID，确保唯一性
+            task_copy["id"] = data.allocate_task_id()
+            # 更新字段状态
+            task_copy["task_type"] = "无循环"
+            task_copy.pop("next_reset_at", None)
+            task_copy["total_completion_count"] = task_copy["completed_count"]
+            if not task_copy.get("complete_time"):
+                # 完成时间不存在则补全
+                task_copy["complete_time"] = now_text
+            task_copy["status"] = "已完成"
+            task_copy['archived'] = True
+            # 保存副本到任务列表
+            data.append_task(task_copy)
+
+        # 刷新原任务的状态：开始时间回到当前周期的开始
+        task["start_time"] = cycle_period_start(task["task_type"], now).strftime("%Y-%m-%d %H:%M:%S")
+        task["completed_count"] = 0
+        task["status"] = "未完成"
+        task["archived"] = False
+        if "complete_time" in task:
+            del task["complete_time"]
+        # 新的重置时间在保存时加入堆
+        schedule_cycle_task(task)
+
+        # 更新数+1
+        updated_count += 1
+
+    if save and updated_count > 0 and safe_save_data(data):
+        task_logger.info("已更新%s个循环任务", updated_count)
 
     return updated_count
 
 
-# 添加定时任务线程
-def schedule_daily_tasks():
-    """定时执行每日任务"""
-    while True:
-        now = datetime.now()
-        # 计算明天凌晨1点的时间
-        next_run = now.replace(hour=1, minute=0, second=0, microsecond=0) + timedelta(days=1)
-        if now.hour >= 1:
-            next_run = next_run.replace(day=next_run.day)
-
-        # 等待到下次执行时间
-        time_to_wait = (next_run - now).total_seconds()
-        time.sleep(time_to_wait)
-
-        # 执行批量归档
-        batch_archive_tasks()
-
-        # 执行刷新循环任务
-        check_and_update_cycle_tasks()
-        #refresh_cycle_tasks()
-
-# 在应用启动时启动定时任务
-# def start_scheduled_tasks():
-#     """启动定时任务"""
-#     thread = threading.Thread(target=schedule_daily_tasks)
-#     thread.daemon = True
-#     thread.start()
-
-
 @app.route('/api/proxy/image', methods=['POST'])
 def proxy_image():
     """图片代理接口，用于解决跨域问题"""
@@ -6200,6 +9148,7 @@ def get_file_tree():
 
 
 @app.route('/api/files', methods=['POST'])
+@token_required()
 def create_file_or_folder():
     """创建文件或文件夹"""
     try:
@@ -6253,22 +9202,24 @@ def create_file_or_folder():
         return jsonify(new_node), 201
 
     except Exception as e:
-        print(f"创建文件或文件夹失败: {str(e)}")
+        file_logger.error("创建文件或文件夹失败: %s", e)
         return jsonify({"error": "创建失败"}), 500
 
 
 @app.route('/api/files/<file_id>', methods=['GET'])
+@token_required()
 def get_file_content(file_id):
     """获取文件内容"""
     try:
         content = load_file_content(file_id)
         return jsonify({"content": content})
     except Exception as e:
-        print(f"获取文件内容失败: {str(e)}")
+        file_logger.error("获取文件内容失败: %s", e)
         return jsonify({"error": "获取文件内容失败"}), 500
 
 
 @app.route('/api/files/<file_id>', methods=['PUT'])
+@token_required()
 def update_file(file_id):
     """更新文件或文件夹"""
     try:
@@ -6302,11 +9253,12 @@ def update_file(file_id):
             return jsonify({"error": "文件或文件夹不存在"}), 404
 
     except Exception as e:
-        print(f"更新文件失败: {str(e)}")
+        file_logger.error("更新文件失败: %s", e)
         return jsonify({"error": "更新失败"}), 500
 
 
 @app.route('/api/files/<file_id>', methods=['DELETE'])
+@token_required()
 def delete_file(file_id):
     """删除文件或文件夹"""
     try:
@@ -6343,11 +9295,12 @@ def delete_file(file_id):
             return jsonify({"error": "文件或文件夹不存在"}), 404
 
     except Exception as e:
-        print(f"删除文件失败: {str(e)}")
+        file_logger.error("删除文件失败: %s", e)
         return jsonify({"error": "删除失败"}), 500
 
 
 @app.route('/api/load-markdown-file/<file_id>', methods=['GET'])
+@token_required()
 def load_markdown_file(file_id):
     """加载Markdown文件内容"""
     try:
@@ -6360,11 +9313,12 @@ def load_markdown_file(file_id):
             # 文件不存在，返回空内容
             return jsonify({'content': ''}), 200
     except Exception as e:
-        print(f"加载文件失败: {str(e)}")
+        file_logger.error("加载文件失败: %s", e)
         return jsonify({'error': '加载文件失败'}), 500
 
 
 @app.route('/api/save-markdown-file', methods=['POST'])
+@token_required()
 def save_markdown_file():
     """保存Markdown文件内容"""
     try:
@@ -6385,13 +9339,15 @@ def save_markdown_file():
 
         return jsonify({'message': '保存成功'}), 200
     except Exception as e:
-        print(f"保存文件失败: {str(e)}")
+        file_logger.error("保存文件失败: %s", e)
         return jsonify({'error': '保存文件失败'}), 500
 
 
 
 
 @app.route('/api/tasks/refresh-cycle', methods=['POST'])
+@token_required()
+@optimistic_concurrency
 def refresh_cycle_tasks():
     """手动刷新循环任务"""
     try:
@@ -6402,6 +9358,8 @@ def refresh_cycle_tasks():
 
 # 批量归档API端点
 @app.route('/api/tasks/batch-archive', methods=['POST'])
+@token_required()
+@optimistic_concurrency
 def batch_archive_tasks_api():
     """API端点：批量归档已完成的任务"""
     try:
@@ -6416,16 +9374,18 @@ def batch_archive_tasks_api():
 
 
 @app.route('/api/auto-tasks/execute', methods=['POST'])
+@token_required()
 def execute_auto_tasks_manually():
     """手动触发执行自动任务"""
     try:
-        execute_daily_auto_tasks()
-        return jsonify({"message": "自动任务执行完成"}), 200
+        results = execute_daily_auto_tasks()
+        return jsonify({"message": "自动任务执行完成", "results": results}), 200
     except Exception as e:
         return jsonify({"error": f"执行自动任务失败: {str(e)}"}), 500
 
 
 @app.route('/api/auto-tasks/status', methods=['GET'])
+@token_required()
 def get_auto_tasks_status():
     """获取自动任务状态"""
     try:
@@ -6443,7 +9403,26 @@ def get_auto_tasks_status():
         return jsonify({"error": f"获取自动任务状态失败: {str(e)}"}), 500
 
 
+@app.route('/api/system/metrics', methods=['GET'])
+@token_required()
+def get_system_metrics():
+    """获取当前工作进程的运行指标（仅管理员可访问）"""
+    if 'admin' not in get_user_permissions(request.current_user):
+        return jsonify({'error': 'Permission denied'}), 403
+
+    return jsonify({
+        "master_data_cache": master_data_cache.stats(),
+        "task_index_cache": task_index_cache.stats(),
+        "master_data_journal": MASTER_DATA_STORES['json'].stats(),
+        "data_locks": data_locks.stats(),
+        "auto_tasks": daily_auto_tasks.stats(),
+        "password_hasher": password_hasher.stats(),
+        "token_cache": token_cache.stats()
+    })
+
+
 @app.route('/api/jnl/check/<date_str>', methods=['GET'])
+@token_required()
 def check_daily_log_exists(date_str):
     """检查指定日期的日志文件是否存在"""
     try:
@@ -6461,11 +9440,12 @@ def check_daily_log_exists(date_str):
             "date": date_str
         })
     except Exception as e:
-        print(f"检查日志文件时出错: {str(e)}")
+        file_logger.error("检查日志文件时出错: %s", e)
         return jsonify({"error": f"检查日志文件失败: {str(e)}"}), 500
 
 
 @app.route('/api/jnl/list', methods=['GET'])
+@token_required()
 def list_daily_logs():
     """获取所有日志文件列表"""
     try:
@@ -6483,11 +9463,12 @@ def list_daily_logs():
             "count": len(log_files)
         })
     except Exception as e:
-        print(f"获取日志文件列表时出错: {str(e)}")
+        file_logger.error("获取日志文件列表时出错: %s", e)
         return jsonify({"error": f"获取日志文件列表失败: {str(e)}"}), 500
 
 
 @app.route('/api/jnl/delete/<filename_str>', methods=['DELETE'])
+@token_required()
 def delete_daily_log(filename_str):
     """删除指定文件名的文件"""
     try:
@@ -6507,12 +9488,13 @@ def delete_daily_log(filename_str):
             # "date": date_str
         })
     except Exception as e:
-        print(f"删除文件时出错: {str(e)}")
+        file_logger.error("删除文件时出错: %s", e)
         return jsonify({"error": f"删除文件失败: {str(e)}"}), 500
 
 
 # 图片处理api #
 @app.route('/api/files/upload-image', methods=['POST'])
+@token_required()
 def upload_image():
     """上传图片文件"""
     try:
@@ -6544,10 +9526,11 @@ def upload_image():
             }), 200
 
     except Exception as e:
-        print(f"上传图片失败: {str(e)}")
+        file_logger.error("上传图片失败: %s", e)
         return jsonify({"error": f"上传图片失败: {str(e)}"}), 500
 
 @app.route('/api/files/images', methods=['GET'])
+@token_required()
 def get_images_list():
     """获取图片文件列表"""
     try:
@@ -6565,11 +9548,12 @@ def get_images_list():
                     })
         return jsonify(images)
     except Exception as e:
-        print(f"获取图片列表失败: {str(e)}")
+        file_logger.error("获取图片列表失败: %s", e)
         return jsonify([]), 500
 
 
 @app.route('/api/files/images/unused', methods=['GET'])
+@token_required()
 def get_unused_images():
     """获取未使用的图片文件列表"""
     try:
@@ -6579,11 +9563,12 @@ def get_unused_images():
         unused_images = [img for img in images if img["name"] not in used_images]
         return jsonify({"images": unused_images}), 200
     except Exception as e:
-        print(f"获取未使用图片列表失败: {str(e)}")
+        file_logger.error("获取未使用图片列表失败: %s", e)
         return jsonify({"error": f"获取未使用图片列表失败: {str(e)}"}), 500
 
 
 @app.route('/api/files/images/<filename>', methods=['DELETE'])
+@token_required()
 def delete_image(filename):
     """删除指定图片文件"""
     try:
@@ -6594,11 +9579,12 @@ def delete_image(filename):
         else:
             return jsonify({"error": "图片文件不存在"}), 404
     except Exception as e:
-        print(f"删除图片失败: {str(e)}")
+        file_logger.error("删除图片失败: %s", e)
         return jsonify({"error": f"删除图片失败: {str(e)}"}), 500
 
 
 @app.route('/api/files/images/delete-unused', methods=['DELETE'])
+@token_required()
 def delete_unused_images():
     """删除所有未使用的图片文件"""
     try:
@@ -6618,22 +9604,62 @@ def delete_unused_images():
             "deleted_count": deleted_count
         }), 200
     except Exception as e:
-        print(f"删除未使用图片失败: {str(e)}")
+        file_logger.error("删除未使用图片失败: %s", e)
         return jsonify({"error": f"删除未使用图片失败: {str(e)}"}), 500
 
 
 # 添加静态文件路由以提供图片访问
+def generate_image_token(username):
+    """签发图片令牌：只能用于读取该用户自己的图片"""
+    payload = {'username': username, 'iat': time.time(), 'exp': datetime.utcnow() + JWT_IMAGE_EXPIRATION_DELTA}
+    return jwt.encode(payload, IMAGE_TOKEN_SECRET, algorithm=JWT_ALGORITHM)
+
+
+def verify_image_token(token):
+    """校验图片令牌，返回用户名；无效、过期或签发后用户修改过密码时返回 None"""
+    if not token:
+        return None
+    try:
+        payload = jwt.decode(token, IMAGE_TOKEN_SECRET, algorithms=[JWT_ALGORITHM])
+    except jwt.InvalidTokenError:
+        return None
+    if TOKEN_REVOCATION_ENABLED and token_revocations.is_revoked(payload):
+        return None
+    return payload.get('username')
+
+
+@app.route('/api/files/images/token', methods=['GET'])
+@token_required()
+def get_image_token():
+    """签发图片令牌，前端附在图片地址的 token 查询参数中"""
+    return jsonify({
+        "token": generate_image_token(config_manager.current_username),
+        "expires_in": int(JWT_IMAGE_EXPIRATION_DELTA.total_seconds()),
+    })
+
+
 @app.route('/files/images/<filename>')
+@token_required(optional=True)
 def serve_image(filename):
-    """提供图片文件访问"""
+    """提供图片文件访问，只能读取当前用户自己的图片
+
+    <img> 标签无法携带认证头，此时须在查询参数 token 中携带 /api/files/images/token 签发的图片令牌。
+    """
     try:
-        return send_from_directory(config_manager.IMAGES_DIR, filename)
+        username = config_manager.current_username or verify_image_token(request.args.get('token'))
+        if username is None:
+            return jsonify({"error": "需要登录"}), 401
+        with config_manager.user_scope(username):
+            images_dir = config_manager.IMAGES_DIR
+        # send_from_directory 按应用目录解析相对路径，这里按工作目录解析，与保存图片时一致
+        return send_from_directory(os.path.abspath(images_dir), filename)
     except Exception as e:
-        print(f"提供图片文件失败: {str(e)}")
+        file_logger.error("提供图片文件失败: %s", e)
         return jsonify({"error": "文件不存在"}), 404
 
 
 @app.route('/api/files/journals', methods=['GET'])
+@token_required()
 def get_journals_list():
     """获取日志文件列表"""
     try:
@@ -6651,10 +9677,11 @@ def get_journals_list():
                     })
         return jsonify(journals)
     except Exception as e:
-        print(f"获取日志列表失败: {str(e)}")
+        file_logger.error("获取日志列表失败: %s", e)
         return jsonify([]), 500
 
 @app.route('/api/files/journal/<filename>', methods=['GET'])
+@token_required()
 def get_journal_content(filename):
     """获取日志文件内容"""
     try:
@@ -6672,11 +9699,12 @@ def get_journal_content(filename):
         else:
             return jsonify({"error": "文件不存在"}), 404
     except Exception as e:
-        print(f"读取日志文件失败: {str(e)}")
+        file_logger.error("读取日志文件失败: %s", e)
         return jsonify({"error": f"读取文件失败: {str(e)}"}), 500
 
 
 @app.route('/api/files/journal/<filename>', methods=['DELETE'])
+@token_required()
 def delete_journal_file(filename):
     """删除日志文件"""
     try:
@@ -6687,11 +9715,12 @@ def delete_journal_file(filename):
         else:
             return jsonify({"error": "文件不存在"}), 404
     except Exception as e:
-        print(f"删除日志文件失败: {str(e)}")
+        file_logger.error("删除日志文件失败: %s", e)
         return jsonify({"error": f"删除文件失败: {str(e)}"}), 500
 
 
 @app.route('/api/files/journals/batch-delete', methods=['POST'])
+@token_required()
 def batch_delete_journal_files():
     """批量删除日志文件"""
     try:
@@ -6724,10 +9753,11 @@ def batch_delete_journal_files():
                 "deleted_files": deleted_files
             })
     except Exception as e:
-        print(f"批量删除日志文件失败: {str(e)}")
+        file_logger.error("批量删除日志文件失败: %s", e)
         return jsonify({"error": f"批量删除文件失败: {str(e)}"}), 500
 
 @app.route('/api/files/images/batch-delete', methods=['POST'])
+@token_required()
 def batch_delete_images():
     """批量删除图片文件"""
     try:
@@ -6760,10 +9790,11 @@ def batch_delete_images():
                 "deleted_files": deleted_files
             })
     except Exception as e:
-        print(f"批量删除图片文件失败: {str(e)}")
+        file_logger.error("批量删除图片文件失败: %s", e)
         return jsonify({"error": f"批量删除文件失败: {str(e)}"}), 500
 
 @app.route('/api/files/image/<filename>', methods=['DELETE'])
+@token_required()
 def delete_image_file(filename):
     """删除图片文件"""
     try:
@@ -6774,12 +9805,13 @@ def delete_image_file(filename):
         else:
             return jsonify({"error": "文件不存在"}), 404
     except Exception as e:
-        print(f"删除图片文件失败: {str(e)}")
+        file_logger.error("删除图片文件失败: %s", e)
         return jsonify({"error": f"删除文件失败: {str(e)}"}), 500
 
 
 
 @app.route('/api/files/<file_id>/move', methods=['PUT'])
+@token_required()
 def move_file(file_id):
     """移动文件或文件夹到指定目标文件夹"""
     try:
@@ -6824,7 +9856,7 @@ def move_file(file_id):
             return jsonify({"error": "保存文件树失败"}), 500
 
     except Exception as e:
-        print(f"移动文件时出错: {str(e)}")
+        file_logger.error("移动文件时出错: %s", e)
         return jsonify({"error": f"移动文件失败: {str(e)}"}), 500
 
 def find_node_in_tree(nodes, node_id):
@@ -6867,6 +9899,7 @@ def is_descendant_of(target_folder, source_folder):
 
 
 @app.route('/api/settings/toolbar', methods=['POST'])
+@token_required()
 def update_toolbar_settings():
     """更新工具栏设置"""
     try:
@@ -6889,11 +9922,12 @@ def update_toolbar_settings():
             return jsonify({"error": "保存设置失败"}), 500
 
     except Exception as e:
-        print(f"更新工具栏设置时出错: {str(e)}")
+        data_logger.error("更新工具栏设置时出错: %s", e)
         return jsonify({"error": f"更新工具栏设置失败: {str(e)}"}), 500
 
 
 @app.route('/api/settings/toolbar', methods=['GET'])
+@token_required()
 def get_toolbar_settings():
     """获取工具栏设置"""
     try:
@@ -6919,7 +9953,7 @@ def get_toolbar_settings():
         return jsonify(toolbar_settings)
 
     except Exception as e:
-        print(f"获取工具栏设置时出错: {str(e)}")
+        data_logger.error("获取工具栏设置时出错: %s", e)
         return jsonify({"error": f"获取工具栏设置失败: {str(e)}"}), 500
 
 
@@ -6932,7 +9966,6 @@ def backup_user_data(current_user=None):
         data = request.get_json()
         users_to_backup = data.get('users', [])
 
-        users_db= get_user_db()
         if current_user is None:
             current_user = data.get('current_user')
 
@@ -6962,7 +9995,7 @@ def backup_user_data(current_user=None):
                             zipf.write(file_path, f"users/{relative_path}")
 
             # 对于管理员，添加users.json中对应的用户信息
-            if 'admin' in users_db[current_user].get('permissions',[]): #current_user['profile'].get('permissions', []) == ['admin']:
+            if 'admin' in user_directory.permissions(current_user): #current_user['profile'].get('permissions', []) == ['admin']:
                 # users_db = get_user_db()
                 # backup_users_info = {}
                 # for username in users_to_backup:
@@ -6973,8 +10006,7 @@ def backup_user_data(current_user=None):
                 # users_info_path = os.path.join(temp_dir, 'users_info.json')
                 # with open(users_info_path, 'w', encoding='utf-8') as f:
                 #     json.dump(backup_users_info, f, ensure_ascii=False, indent=2)
-                users_info_path = os.path.join(USERS_DIR, 'users.json')
-                zipf.write(users_info_path, 'users.json')
+                zipf.writestr('users.json', dump_json_bytes(user_directory.all()))
 
         return send_file(zip_path, as_attachment=True, download_name=os.path.basename(zip_path))
 
@@ -6993,8 +10025,7 @@ def restore_user_data(current_user=None):
             current_user = getattr(request, 'current_user', None)
             if current_user is None:
                 return jsonify({'error': 'Authentication required'}), 401
-        users_db = get_user_db()
-        is_admin = 'admin' in users_db[current_user].get('permissions', [])
+        is_admin = 'admin' in user_directory.permissions(current_user)
 
         if 'backup' not in request.files:
             return jsonify({'error': '未提供备份文件'}), 400
@@ -7032,41 +10063,33 @@ def restore_user_data(current_user=None):
             with open(users_info_path, 'r', encoding='utf-8') as f:
 
                 backup_users_info = json.load(f)
-                print('1users_info_path:', users_info_path)
-                print('2backup_users_info:', backup_users_info)
+                data_logger.debug("1users_info_path: %s", users_info_path)
+                data_logger.debug("2backup_users_info: %s", backup_users_info)
 
             # 还原用户数据文件夹
             users_backup_dir = os.path.join(extracted_dir, 'users')
-            print('3users_backup_dir:', users_backup_dir)
+            data_logger.debug("3users_backup_dir: %s", users_backup_dir)
             if os.path.exists(users_backup_dir):
                 # 只还原那些在users文件夹中存在对应子文件夹的用户
                 valid_users_to_restore = []
                 for username in os.listdir(users_backup_dir):
-                    print('dir username', username)
+                    data_logger.debug("dir username: %s", username)
                     user_backup_path = os.path.join(users_backup_dir, username)
                     if os.path.isdir(user_backup_path):
                         valid_users_to_restore.append(username)
-                print('4valid_users_to_restore:', valid_users_to_restore)
-                # 检查这些有效用户是否已在当前系统中存在
-                existing_users = []
-                for username in valid_users_to_restore:
-                    if username in users_db:
-                        existing_users.append(username)
-                print('5existing_users:', existing_users)
-                if existing_users:
-                    return jsonify({
-                        'error': f'还原失败，以下用户已存在: {", ".join(existing_users)}'
-                    }), 400
-
+                data_logger.debug("4valid_users_to_restore: %s", valid_users_to_restore)
                 # 只还原有效的用户信息到users.json
                 filtered_backup_users_info = {username: backup_users_info[username]
                                               for username in valid_users_to_restore
                                               if username in backup_users_info}
-                print('6filtered_backup_users_info:', filtered_backup_users_info)
-                # 添加有效的用户信息到users.json
-                users_db.update(filtered_backup_users_info)
-                print('7users_db:', users_db)
-                save_user_db(users_db)
+                data_logger.debug("filtered_backup_users: %s", list(filtered_backup_users_info))
+                # 添加有效的用户信息到用户目录，其中有用户已存在时不做任何修改
+                existing_users = user_directory.add_many(filtered_backup_users_info)
+                data_logger.debug("existing_users: %s", existing_users)
+                if existing_users:
+                    return jsonify({
+                        'error': f'还原失败，以下用户已存在: {", ".join(existing_users)}'
+                    }), 400
 
                 # 还原对应的用户数据文件夹
                 for username in valid_users_to_restore:
@@ -7126,6 +10149,40 @@ def restore_user_data(current_user=None):
         return jsonify({'error': str(e)}), 500
 
 
+@app.cli.command('import-users-to-sqlite')
+def import_users_to_sqlite_command():
+    """把 users.json 中的用户导入 SQLite 用户注册表（flask --app app import-users-to-sqlite）"""
+    if not os.path.exists(USERS_DB_FILE):
+        print(f"{USERS_DB_FILE} 不存在，无需导入")
+        return
+    imported, skipped = import_users_json_to_sqlite(USERS_DB_FILE, USERS_SQLITE_FILE)
+    print(f"导入完成: 成功 {imported} 个, 跳过已存在的 {skipped} 个")
+
+
+@app.cli.command('migrate-to-sqlite')
+def migrate_to_sqlite_command():
+    """将所有用户的JSON主数据一次性迁移到 SQLite（flask --app app migrate-to-sqlite）"""
+    migrated, skipped, failed = 0, 0, 0
+    for username in sorted(os.listdir(USERS_DIR)):
+        user_dir = get_user_dir(username)
+        data_dir = os.path.join(user_dir, "master_data")
+        json_file = os.path.join(user_dir, "master_data.json")
+        db_file = os.path.join(user_dir, "master_data.db")
+        if not os.path.isdir(data_dir) and not os.path.isfile(json_file):
+            continue
+        if os.path.exists(db_file):
+            print(f"跳过 {username}: 已存在 {db_file}")
+            skipped += 1
+            continue
+        try:
+            migrate_user_json_to_sqlite(data_dir, json_file, db_file)
+            migrated += 1
+        except Exception as e:
+            print(f"迁移 {username} 失败: {str(e)}")
+            failed += 1
+    print(f"迁移完成: 成功 {migrated} 个, 跳过 {skipped} 个, 失败 {failed} 个")
+
+
 if __name__ == '__main__':
     # env, debug = get_app_config()
 
@@ -191,14 +191,14 @@ function App() {
   //   setIsLoggedIn(false);
   //   setCurrentUser(null);
   // };
-  const handleLogout = () => {
+  const handleLogout = async () => {
     // 保存当前用户的状态
     if (currentUser) {
       userDataManager.setUserData('floatingButtonHideState', globalHideState);
       userDataManager.setUserData('hideTopControls', hideTopNav);
     }
 
-    AuthManager.clearTokens();
+    await AuthManager.logout(CONFIG.API_BASE_URL);
     userDataManager.clearCurrentUser();
     setIsLoggedIn(false);
     setCurrentUser(null);
@@ -4,6 +4,7 @@ import TagIndexManager from '../utils/TagIndexManager';
 import ImageReferenceIndexManager from '../utils/ImageReferenceIndexManager';
 import './FileExplorer.css';
 import CONFIG from '../config';
+import AuthManager from '../utils/auth';
 import userDataManager from "../utils/userDataManager";
 
 // 创建标签索引管理器实例
@@ -197,7 +198,7 @@ const ImageViewerModal = ({
           onMouseLeave={handleMouseUp}
         >
           <img
-            src={selectedImage.imageUrl}
+            src={AuthManager.imageUrl(selectedImage.imageUrl)}
             alt={selectedImage.name}
             style={{
               transform: `scale(${imageScale}) translate(${imagePosition.x}px, ${imagePosition.y}px)`,
@@ -8,6 +8,7 @@ import { coy } from 'react-syntax-highlighter/dist/esm/styles/prism';
 import './MarkDownEditor.css';
 import rehypeRaw from 'rehype-raw';
 import CONFIG from '../config';
+import AuthManager from '../utils/auth';
 import {useLogs} from "../contexts/LogContext";
 import { createTaskDirectly } from '../utils/taskUtils';
 import TagIndexManager from '../utils/TagIndexManager';
@@ -2514,6 +2515,8 @@ const MarkdownEditor = ({
   const ImgComponent = React.memo(({ node, ...props }) => {
     const [imageError, setImageError] = useState(false);
     const [imageLoading, setImageLoading] = useState(true);
+    // 后端图片需要附带图片令牌
+    const src = AuthManager.imageUrl(props.src);
 
     useEffect(() => {
       if (!props.src) return;
@@ -2549,7 +2552,7 @@ const MarkdownEditor = ({
         setImageError(true);
         setImageLoading(false);
       };
-      img.src = props.src;
+      img.src = src;
 
     }, [props.src]);
 
@@ -2629,6 +2632,7 @@ const MarkdownEditor = ({
     return (
       <img
         {...props}
+        src={src}
         loading="lazy"
         onClick={handleImageClick}
         onLoad={(e) => {
@@ -3,6 +3,7 @@ import React, { useRef, useState, useEffect, useCallback } from 'react';
 import { Link, useLocation } from 'react-router-dom';
 import menuItems from '../utils/menuItems'; // 引入菜单项
 import AuthManager from '../utils/auth';
+import CONFIG from '../config';
 // import UserProfile_old from './UserProfile';
 import UserMenu from './UserMenu';
 import userDataManager from '../utils/userDataManager';
@@ -142,8 +143,8 @@ const Navbar = ({ onSwipe,moduleOrder, hideTopNav, onModuleOrderChange, activeTa
   // console.log("currentuser", currentUser)
   // console.log("stats", stats)
 
-  const handleLogout = () => {
-    AuthManager.clearTokens();
+  const handleLogout = async () => {
+    await AuthManager.logout(CONFIG.API_BASE_URL);
     if (onLogout) {
       onLogout(null);
     }
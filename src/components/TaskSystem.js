@@ -2571,97 +2571,6 @@ const TaskSystem = ({
   };
 
   // 处理任务完成
-  const updateCharacterStats = async (task) => {
-    try {
-      // 1. 更新经验奖励
-      if (task.exp_reward && task.exp_reward > 0) {
-        // console.log('更新角色经验值中:', task.exp_reward);
-        try {
-          const response = await fetch(`${CONFIG.API_BASE_URL}/api/character/exp`, {
-            method: 'POST',
-            headers: {
-              'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({ amount: task.exp_reward })
-          });
-
-          if (!response.ok) {
-            throw new Error(`HTTP error! status: ${response.status}`);
-          }
-
-          const result = await response.json();
-          // console.log('经验值更新结果:', result);
-        } catch (expError) {
-          console.error('更新经验值失败:', expError);
-        }
-      }
-      // console.log('更新角色经验值成功');
-
-      // 2. 更新积分奖励
-      if (task.credits_reward) {
-        for (const [creditType, amount] of Object.entries(task.credits_reward)) {
-          // console.log(`更新角色${creditType}积分中:`, amount);
-          if (amount > 0) {
-            try {
-              const creditResponse = await fetch(`${CONFIG.API_BASE_URL}/api/credits/add/${creditType}/${amount}`, {
-                method: 'POST',
-                headers: {
-                  'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({ amount: amount })
-              });
-
-              if (!creditResponse.ok) {
-                throw new Error(`HTTP error! status: ${creditResponse.status}`);
-              }
-
-              const creditResult = await creditResponse.json();
-              // console.log(`积分${creditType}更新结果:`, creditResult);
-            } catch (creditError) {
-              console.error(`更新积分${creditType}失败:`, creditError);
-              continue; // 继续处理其他积分类型
-            }
-
-            // 3. 根据积分类型到属性类别的映射关系更新属性点
-            if (characterSettings) {
-              // 查找匹配的设置项
-              const matchedSetting = characterSettings.find(
-                item => item.creditType === creditType
-              );
-
-              // 如果找到了匹配的设置项并且有属性类别
-              if (matchedSetting && matchedSetting.propertyCategory) {
-                try {
-                  const propertyResponse = await fetch(`${CONFIG.API_BASE_URL}/api/character/properties/${encodeURIComponent(matchedSetting.propertyCategory)}`, {
-                    method: 'POST',
-                    headers: {
-                      'Content-Type': 'application/json',
-                    },
-                    body: JSON.stringify({ amount: amount })
-                  });
-
-                  if (!propertyResponse.ok) {
-                    throw new Error(`HTTP error! status: ${propertyResponse.status}`);
-                  }
-
-                  const propertyResult = await propertyResponse.json();
-                  // console.log(`属性${matchedSetting.propertyCategory}更新结果:`, propertyResult);
-                } catch (propertyError) {
-                  console.error(`更新属性${matchedSetting.propertyCategory}失败:`, propertyError);
-                }
-              }
-            }
-          }
-        }
-      }
-
-    } catch (error) {
-      console.error('更新角色统计数据时发生错误:', error);
-      // 可以选择显示用户友好的错误消息
-      // alert('更新角色数据时发生部分错误，请检查控制台了解详情');
-    }
-  };
-
   const handleCompleteTask = async (taskId) => {
     try {
       const task = tasks.find(t => t.id === taskId);
@@ -2747,9 +2656,7 @@ const TaskSystem = ({
         }
         addLog('任务','完成任务',`完成${task.name}: ${result.reward}`)
 
-        // 新增：更新角色的经验值、积分和属性点
-        // await updateCharacterStats(task);
-       // 更新道具奖励: 后台处理
+        // 经验、积分、属性和道具奖励已由后台在同一次保存中发放
 
         onCompleteTask();
       } else {
@@ -1630,190 +1630,6 @@ const TaskTab = ({
     }
   };
 
-  const handleCompleteTask_old = async (taskId) => {
-    try {
-      const task = tasks.find(t => t.id === taskId);
-      if (!task) return;
-      // 状态为已完成则退出
-      if (task.status === '已完成') return;
-
-      let newCompletedCount = (task.completed_count || 0) + 1;
-      let newTotalCompletionCount = (task.total_completion_count || 0) + 1;
-      let newStatus = task.status;
-      let max_completes = task.max_completions || 99999; // 若为0则使用默认最大完成次数99999
-
-      // 计算完成状态
-      if (max_completes > 0 && newCompletedCount >= max_completes) {
-        newStatus = '已完成';
-      } else if (newCompletedCount > 0 && newCompletedCount < max_completes) {
-        newStatus = '重复中';
-      }
-      // 完成次数溢出的任务：只更新状态为已完成，不发奖励
-      if (newCompletedCount > max_completes) {
-        const updatedTask0 = {
-          ...task,
-          status: newStatus,
-        };
-
-
-        // 发送更新请求
-        const response0 = await fetch(`${CONFIG.API_BASE_URL}/api/tasks/${taskId}/update_completed`, {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json',
-          },
-          body: JSON.stringify(updatedTask0)
-        });
-
-
-        const result0 = await response0.json();
-
-        if (response0.ok) {
-          onShowStatus(result0.message || '任务已完成');
-          onCompleteTask();
-        }
-
-        return;
-      }
-
-      let completeTime = new Date().toLocaleString('sv-SE');
-
-      // 为后台更新准备任务数据
-      const updatedTask = {
-        ...task,
-        completed_count: newCompletedCount,
-        total_completion_count: newTotalCompletionCount,
-        status: newStatus,
-        complete_time: completeTime,
-        items_reward: task.items_reward,
-      };
-      console.log('发送到后台的更新任务数据:', updatedTask);
-
-      // 发送更新请求至后台
-      const response = await fetch(`${CONFIG.API_BASE_URL}/api/tasks/${taskId}/complete`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify(updatedTask)
-      });
-
-      const result = await response.json();
-
-
-      if (response.ok) {
-        onShowStatus(result.message || '任务已完成');
-
-        // 显示奖励信息
-        // const rewardText = formatReward(task);
-        alert(`任务已完成!\n\n获得以下奖励:\n${result.reward}`);
-        addLog('任务', '完成任务', `完成${task.name}: ${result.reward}`)
-
-        // 新增：更新角色的经验值、积分和属性点
-        await updateCharacterStats_old(task);
-       // 更新道具奖励: 后台处理
-        onCompleteTask();
-      } else {
-        alert(result.error || '完成任务失败');
-        addLog('任务', '完成失败', `任务${task.name} 完成失败: ${result.error}`)
-      }
-    } catch (error) {
-      console.error('完成任务时发生错误:', error);
-      alert('网络错误');
-    }
-  };
-  // 修改 updateCharacterStats 函数，添加更详细的错误处理
-  const updateCharacterStats_old = async (task) => {
-    try {
-      // 1. 更新经验奖励
-      if (task.exp_reward && task.exp_reward > 0) {
-        // console.log('更新角色经验值中:', task.exp_reward);
-        try {
-          const response = await fetch(`${CONFIG.API_BASE_URL}/api/character/exp`, {
-            method: 'POST',
-            headers: {
-              'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({ amount: task.exp_reward })
-          });
-
-          if (!response.ok) {
-            throw new Error(`HTTP error! status: ${response.status}`);
-          }
-
-          const result = await response.json();
-          // console.log('经验值更新结果:', result);
-        } catch (expError) {
-          console.error('更新经验值失败:', expError);
-        }
-      }
-      // console.log('更新角色经验值成功');
-
-      // 2. 更新积分奖励
-      if (task.credits_reward) {
-        for (const [creditType, amount] of Object.entries(task.credits_reward)) {
-          // console.log(`更新角色${creditType}积分中:`, amount);
-          if (amount > 0) {
-            try {
-              const creditResponse = await fetch(`${CONFIG.API_BASE_URL}/api/credits/add/${creditType}/${amount}`, {
-                method: 'POST',
-                headers: {
-                  'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({ amount: amount })
-              });
-
-              if (!creditResponse.ok) {
-                throw new Error(`HTTP error! status: ${creditResponse.status}`);
-              }
-
-              const creditResult = await creditResponse.json();
-              // console.log(`积分${creditType}更新结果:`, creditResult);
-            } catch (creditError) {
-              console.error(`更新积分${creditType}失败:`, creditError);
-              continue; // 继续处理其他积分类型
-            }
-
-            // 3. 根据积分类型到属性类别的映射关系更新属性点
-            if (characterSettings) {
-              // 查找匹配的设置项
-              const matchedSetting = characterSettings.find(
-                item => item.creditType === creditType
-              );
-
-              // 如果找到了匹配的设置项并且有属性类别
-              if (matchedSetting && matchedSetting.propertyCategory) {
-                try {
-                  const propertyResponse = await fetch(`${CONFIG.API_BASE_URL}/api/character/properties/${encodeURIComponent(matchedSetting.propertyCategory)}`, {
-                    method: 'POST',
-                    headers: {
-                      'Content-Type': 'application/json',
-                    },
-                    body: JSON.stringify({ amount: amount })
-                  });
-
-                  if (!propertyResponse.ok) {
-                    throw new Error(`HTTP error! status: ${propertyResponse.status}`);
-                  }
-
-                  const propertyResult = await propertyResponse.json();
-                  // console.log(`属性${matchedSetting.propertyCategory}更新结果:`, propertyResult);
-                } catch (propertyError) {
-                  console.error(`更新属性${matchedSetting.propertyCategory}失败:`, propertyError);
-                }
-              }
-            }
-          }
-        }
-      }
-
-    } catch (error) {
-      console.error('更新角色统计数据时发生错误:', error);
-      // 可以选择显示用户友好的错误消息
-      // alert('更新角色数据时发生部分错误，请检查控制台了解详情');
-    }
-  };
-
   const formatReward = (task) => {
     let rewardText = '';
 
@@ -2145,26 +1961,21 @@ const TaskTab = ({
     // ----------------------------------------------------
 
     try {
-      let successCount = 0;
-      const totalTasks = selectedTasks.length;
-
-      for (let i = 0; i < selectedTasks.length; i++) {
-        const taskId = selectedTasks[i];
-        const response = await fetch(`${CONFIG.API_BASE_URL}/api/tasks/${taskId}`, {
-          method: 'DELETE'
-        });
-
-        if (response.ok) {
-          successCount++;
-        }
-
-        // --- 新增：更新进度条 ---
-        const processedCount = i + 1;
-        const currentProgress = (processedCount / totalTasks) * 100;
-        // 设置进度为 90%，留出最后的 UI 更新时间
-        setBatchDeleteProgress(Math.min(90, currentProgress));
-        // ------------------------
+      // 一次请求删除全部选中的任务，服务器只读写一次数据
+      setBatchDeleteProgress(30);
+      const response = await fetch(`${CONFIG.API_BASE_URL}/api/tasks/bulk`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+          operations: selectedTasks.map(taskId => ({ op: 'delete', id: taskId }))
+        })
+      });
+      const result = await response.json();
+      if (!response.ok) {
+        throw new Error(result.error || '批量删除失败');
       }
+      const successCount = result.saved ? result.results.filter(item => item.ok).length : 0;
+      setBatchDeleteProgress(90);
 
       const message = `成功删除${successCount}个任务`;
       onShowStatus(message);
@@ -2178,7 +1989,7 @@ const TaskTab = ({
 
     } catch (error) {
       console.error("批量删除过程中出错:", error);
-      alert('网络错误');
+      alert(error.message || '网络错误');
       // --- 新增：出错时关闭弹窗 ---
       setIsBatchDeleteDialogOpen(false);
       // ----------------------------
@@ -2368,16 +2179,11 @@ const TaskTab = ({
       const taskToUpdate = tasks.find(task => task.id === taskId);
       if (!taskToUpdate) return;
 
-      let updatedTask = { ...taskToUpdate };
-
-      // 同时更新 status 字段和 completed_count 字段
-      updatedTask.status = targetStatus;
-
-
+      // 只提交变化的字段
       const response = await fetch(`${CONFIG.API_BASE_URL}/api/tasks/${taskId}`, {
-        method: 'PUT',
+        method: 'PATCH',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(updatedTask)
+        body: JSON.stringify({ status: targetStatus })
       });
 
       if (response.ok) {
@@ -2419,15 +2225,10 @@ const TaskTab = ({
       const taskToUpdate = tasks.find(task => task.id === taskId);
       if (!taskToUpdate) return;
 
-      const updatedTask = {
-        ...taskToUpdate,
-        [field]: value
-      };
-
       const response = await fetch(`${CONFIG.API_BASE_URL}/api/tasks/${taskId}`, {
-        method: 'PUT',
+        method: 'PATCH',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(updatedTask)
+        body: JSON.stringify({ [field]: value })
       });
 
       if (response.ok) {
@@ -2444,15 +2245,10 @@ const TaskTab = ({
       const taskToUpdate = tasks.find(task => task.id === taskId);
       if (!taskToUpdate) return;
 
-      const updatedTask = {
-        ...taskToUpdate,
-        category: newCategory
-      };
-
       const response = await fetch(`${CONFIG.API_BASE_URL}/api/tasks/${taskId}`, {
-        method: 'PUT',
+        method: 'PATCH',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(updatedTask)
+        body: JSON.stringify({ category: newCategory })
       });
 
       if (response.ok) {
@@ -3074,16 +2870,11 @@ const TaskTab = ({
         return;
       }
 
-      // 更新任务的归档状态
-      const updatedTask = {
-        ...taskToUpdate,
-        archived: true
-      };
-
+      // 只更新任务的归档状态
       const response = await fetch(`${CONFIG.API_BASE_URL}/api/tasks/${taskId}`, {
-        method: 'PUT',
+        method: 'PATCH',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(updatedTask)
+        body: JSON.stringify({ archived: true })
       });
 
       const result = await response.json();
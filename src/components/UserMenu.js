@@ -319,8 +319,8 @@ const UserMenu = ({
     }
   };
 
-  const handleLogout = () => {
-    AuthManager.clearTokens();
+  const handleLogout = async () => {
+    await AuthManager.logout(CONFIG.API_BASE_URL);
     if (onLogout) onLogout(null);
     setShowMenu(false);
     setShowProfile(false);
@@ -524,6 +524,10 @@ const UserMenu = ({
       const data = await response.json();
 
       if (response.ok) {
+        // 改密码后旧令牌全部失效，换用服务器签发的新令牌
+        if (data.access_token && data.refresh_token) {
+          AuthManager.setTokens(data.access_token, data.refresh_token);
+        }
         setPasswordSuccess('密码修改成功');
         setPasswordError('');
         // 清空表单
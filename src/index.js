@@ -2,6 +2,12 @@ import React from 'react';
 import ReactDOM from 'react-dom/client';
 import './index.css';
 import App from './App';
+import CONFIG from './config';
+import AuthManager from './utils/auth';
+
+// 所有后端请求都需要携带登录令牌
+AuthManager.installFetchInterceptor(CONFIG.API_BASE_URL);
+AuthManager.installImageTokenRefresher(CONFIG.API_BASE_URL);
 
 const root = ReactDOM.createRoot(document.getElementById('root'));
 root.render(
@@ -11,11 +11,77 @@ class AuthManager {
   static setTokens(accessToken, refreshToken) {
     localStorage.setItem('access_token', accessToken);
     localStorage.setItem('refresh_token', refreshToken);
+    // 登录或刷新令牌后重新获取图片令牌（可能换了用户，或旧令牌因修改密码失效）
+    localStorage.setItem('image_token_expires_at', '0');
+    if (this.apiBaseUrl !== undefined) {
+      this.refreshImageToken().catch(() => {});
+    }
   }
 
   static clearTokens() {
     localStorage.removeItem('access_token');
     localStorage.removeItem('refresh_token');
+    localStorage.removeItem('image_token');
+    localStorage.removeItem('image_token_expires_at');
+  }
+
+  // <img> 标签无法携带认证头，后端图片地址附加短期有效的图片令牌
+  static imageUrl(url) {
+    const token = localStorage.getItem('image_token');
+    if (!url || !token || !url.includes('/files/images/')) {
+      return url;
+    }
+    return `${url}${url.includes('?') ? '&' : '?'}token=${encodeURIComponent(token)}`;
+  }
+
+  static async refreshImageToken() {
+    if (!this.getToken()) {
+      return null;
+    }
+    const response = await fetch(`${this.apiBaseUrl || ''}/api/files/images/token`);
+    if (!response.ok) {
+      return null;
+    }
+    const data = await response.json();
+    localStorage.setItem('image_token', data.token);
+    localStorage.setItem('image_token_expires_at', String(Date.now() + data.expires_in * 1000));
+    return data.token;
+  }
+
+  // 图片令牌到期前 10 分钟内自动续签
+  static installImageTokenRefresher(apiBaseUrl) {
+    if (this.apiBaseUrl !== undefined) {
+      return;
+    }
+    this.apiBaseUrl = apiBaseUrl;
+    const refreshIfNeeded = () => {
+      const expiresAt = Number(localStorage.getItem('image_token_expires_at') || 0);
+      if (this.getToken() && expiresAt - Date.now() < 10 * 60 * 1000) {
+        this.refreshImageToken().catch(() => {});
+      }
+    };
+    refreshIfNeeded();
+    setInterval(refreshIfNeeded, 60 * 1000);
+  }
+
+  // 登出：先请求后端吊销访问令牌和刷新令牌，再清除本地令牌（请求失败时同样清除）
+  static async logout(apiBaseUrl = '') {
+    const token = this.getToken();
+    if (token) {
+      try {
+        await fetch(`${apiBaseUrl}/api/auth/logout`, {
+          method: 'POST',
+          headers: {
+            'Content-Type': 'application/json',
+            'Authorization': `Bearer ${token}`,
+          },
+          body: JSON.stringify({ refresh_token: this.getRefreshToken() }),
+        });
+      } catch (error) {
+        console.error('Logout request failed:', error);
+      }
+    }
+    this.clearTokens();
   }
 
   static isAuthenticated() {
@@ -99,6 +165,34 @@ class AuthManager {
     return response;
   }
 
+  // 为发往后端的 fetch 请求自动附加访问令牌，组件中直接调用 fetch 的地方无需逐个修改
+  static installFetchInterceptor(apiBaseUrl) {
+    if (window.fetch.authInterceptorInstalled) {
+      return;
+    }
+
+    const originalFetch = window.fetch.bind(window);
+    const isBackendUrl = (url) =>
+      url.startsWith('/api/') || url.startsWith('/files/') ||
+      url.startsWith(`${apiBaseUrl}/api/`) || url.startsWith(`${apiBaseUrl}/files/`);
+
+    const interceptedFetch = (input, init = {}) => {
+      const url = input instanceof Request ? input.url : String(input);
+      const token = this.getToken();
+      if (!token || !isBackendUrl(url)) {
+        return originalFetch(input, init);
+      }
+
+      const headers = new Headers(init.headers || (input instanceof Request ? input.headers : undefined));
+      if (!headers.has('Authorization')) {
+        headers.set('Authorization', `Bearer ${token}`);
+      }
+      return originalFetch(input, { ...init, headers });
+    };
+    interceptedFetch.authInterceptorInstalled = true;
+    window.fetch = interceptedFetch;
+  }
+
 }
 
 export default AuthManager;
\ No newline at end of file
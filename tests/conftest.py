@@ -0,0 +1,37 @@
+"""测试公共夹具：在临时目录中导入 app，避免污染仓库下的 users 目录"""
+import os
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+os.environ.setdefault('JWT_SECRET', 'test-secret-for-glifeist-unit-tests')
+os.environ.setdefault('GLIFEIST_AUTO_TASKS', '0')
+
+# app 使用相对路径（users/...），导入前切换到临时工作目录
+os.chdir(tempfile.mkdtemp(prefix='glifeist-tests-'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module  # noqa: E402
+
+
+@pytest.fixture
+def app_mod():
+    return app_module
+
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def user(client):
+    """注册并登录一个新用户，返回 (用户名, 认证头)"""
+    username = 'u' + uuid.uuid4().hex[:10]
+    r = client.post('/api/auth/register', json={'username': username, 'password': 'pass1234'})
+    assert r.status_code == 200, r.get_json()
+    r = client.post('/api/auth/login', json={'username': username, 'password': 'pass1234'})
+    assert r.status_code == 200, r.get_json()
+    return username, {'Authorization': 'Bearer ' + r.get_json()['access_token']}
@@ -0,0 +1,102 @@
+"""批量修改任务：混合操作、atomic 回滚、部分成功与大批量删除"""
+
+
+def _create(client, headers, name, **fields):
+    r = client.post('/api/tasks', headers=headers, json=dict(fields, name=name))
+    assert r.status_code == 200, r.get_json()
+    return r.get_json()['task']
+
+
+def _bulk(client, headers, operations, **options):
+    return client.post('/api/tasks/bulk', headers=headers, json=dict(options, operations=operations))
+
+
+def _tasks_by_name(client, headers):
+    return {task['name']: task for task in client.get('/api/tasks', headers=headers).get_json()}
+
+
+def test_mixed_batch_is_saved_once(app_mod, client, user):
+    username, headers = user
+    doomed = _create(client, headers, 'doomed')
+    chore = _create(client, headers, 'chore', exp_reward=10)
+    draft = _create(client, headers, 'draft')
+    with app_mod.config_manager.user_scope(username):
+        exp_before = app_mod.load_data()["stats"]["exp"]
+
+    r = _bulk(client, headers, [
+        {"op": "create", "task": {"name": "fresh"}},
+        {"op": "delete", "id": doomed['id']},
+        {"op": "complete", "id": chore['id'], "fields": {"status": "已完成"}},
+        {"op": "update", "id": draft['id'], "fields": {"name": "final"}},
+    ])
+    assert r.status_code == 200, r.get_json()
+    body = r.get_json()
+    assert body['saved'] is True
+    assert [result['ok'] for result in body['results']] == [True] * 4
+    assert body['results'][2]['totals']['exp'] == exp_before + 10
+
+    tasks = _tasks_by_name(client, headers)
+    assert 'fresh' in tasks and 'doomed' not in tasks and 'draft' not in tasks
+    assert tasks['final']['id'] == draft['id']
+    assert tasks['chore']['status'] == '已完成' and tasks['chore']['complete_time']
+    with app_mod.config_manager.user_scope(username):
+        assert app_mod.load_data()["stats"]["exp"] == exp_before + 10
+
+
+def test_atomic_batch_with_failing_op_saves_nothing(client, user):
+    _, headers = user
+    keep = _create(client, headers, 'keep')
+    before = _tasks_by_name(client, headers)
+
+    r = _bulk(client, headers, [
+        {"op": "create", "task": {"name": "never"}},
+        {"op": "delete", "id": keep['id']},
+        {"op": "delete", "id": 987654321},
+    ], atomic=True)
+    assert r.status_code == 400
+    body = r.get_json()
+    assert body['saved'] is False
+    assert [result['ok'] for result in body['results']] == [True, True, False]
+    assert _tasks_by_name(client, headers) == before
+
+
+def test_failing_op_is_skipped_without_atomic(client, user):
+    _, headers = user
+    keep = _create(client, headers, 'keep')
+
+    r = _bulk(client, headers, [
+        {"op": "create", "task": {"name": "added"}},
+        {"op": "create", "task": {"priority": "高"}},
+        {"op": "update", "id": 987654321, "fields": {"name": "ghost"}},
+        {"op": "update", "id": keep['id'], "fields": {"name": "kept"}},
+    ])
+    assert r.status_code == 200, r.get_json()
+    body = r.get_json()
+    assert body['saved'] is True
+    assert [result['ok'] for result in body['results']] == [True, False, False, True]
+    assert all(result['error'] for result in body['results'] if not result['ok'])
+
+    tasks = _tasks_by_name(client, headers)
+    assert 'added' in tasks and 'ghost' not in tasks
+    assert tasks['kept']['id'] == keep['id']
+
+
+def test_large_batch_delete_keeps_expected_count(client, user):
+    _, headers = user
+    before = len(client.get('/api/tasks', headers=headers).get_json())
+
+    r = _bulk(client, headers, [{"op": "create", "task": {"name": f"bulk-{n}"}} for n in range(300)])
+    assert r.status_code == 200, r.get_json()
+    created = [result['task']['id'] for result in r.get_json()['results']]
+    assert len(set(created)) == 300
+    assert len(client.get('/api/tasks', headers=headers).get_json()) == before + 300
+
+    # 远超单个字段的差异阈值（MAX_DIFFERENT_ITEMS_PER_FIELD），批量接口按预期任务数核对
+    r = _bulk(client, headers, [{"op": "delete", "id": task_id} for task_id in created[:250]])
+    assert r.status_code == 200, r.get_json()
+    assert r.get_json()['saved'] is True
+
+    remaining = client.get('/api/tasks', headers=headers).get_json()
+    assert len(remaining) == before + 50
+    assert {task['id'] for task in remaining} >= set(created[250:])
+    assert not {task['id'] for task in remaining} & set(created[:250])
@@ -0,0 +1,70 @@
+"""JSON 存储的变更日志：进程崩溃留下半行记录后的重放、续写与合并"""
+import json
+import os
+import uuid
+
+import pytest
+
+
+@pytest.fixture
+def store(app_mod, monkeypatch):
+    """在新用户目录下使用启用日志的 JSON 存储，合并只由测试显式触发"""
+    monkeypatch.setattr(app_mod, 'DATA_JOURNAL_ENABLED', True)
+    monkeypatch.setattr(app_mod, 'DATA_JOURNAL_COMPACT_BYTES', 1 << 30)
+    with app_mod.config_manager.user_scope('j' + uuid.uuid4().hex[:10]):
+        yield app_mod.MASTER_DATA_STORES['json']
+
+
+def _reload(app_mod, monkeypatch, store):
+    # 换用空缓存，模拟重启后的进程从磁盘读取
+    monkeypatch.setattr(app_mod, 'master_data_cache', app_mod.MasterDataCache())
+    return store.load()[:2]
+
+
+def test_replay_skips_truncated_append(app_mod, monkeypatch, store):
+    directory = store.path
+    store.save(app_mod.upgrade_master_data({}, 0))
+    version, data = store.load()[:2]
+    data["lootbox_miss_counts"] = {"box": 1}
+    version = store.save(data, expected_version=version)
+
+    journal = store.journal_path(directory)
+    with open(journal, 'rb') as f:
+        assert f.read().count(b'\n') == 1
+    # 写入下一条记录时进程崩溃，只留下半行
+    with open(journal, 'ab') as f:
+        f.write(b'{"seq":%d,"time":"2024-01-01T00:00:00","ops":[["set",' % (version + 1))
+
+    reloaded_version, reloaded = _reload(app_mod, monkeypatch, store)
+    assert reloaded_version == version
+    assert reloaded["lootbox_miss_counts"] == {"box": 1}
+
+    # 续写的记录不能与半行粘连，否则这次保存在重放时也会丢失
+    reloaded["lootbox_miss_counts"] = {"box": 2}
+    assert store.save(reloaded, expected_version=version) == version + 1
+    with open(journal, 'rb') as f:
+        lines = f.read().split(b'\n')
+    assert json.loads(lines[-2])["seq"] == version + 1
+
+    version, data = _reload(app_mod, monkeypatch, store)
+    assert version == reloaded_version + 1
+    assert data["lootbox_miss_counts"] == {"box": 2}
+
+
+def test_compaction_merges_journal_into_sections(app_mod, monkeypatch, store):
+    directory = store.path
+    store.save(app_mod.upgrade_master_data({}, 0))
+    version, data = store.load()[:2]
+    data["lootbox_miss_counts"] = {"box": 3}
+    version = store.save(data, expected_version=version)
+    with open(store.journal_path(directory), 'ab') as f:
+        f.write(b'{"seq":')
+
+    store.compact(directory)
+    assert os.path.getsize(store.journal_path(directory)) == 0
+    with open(store.section_file(directory, "lootbox_miss_counts"), 'r', encoding='utf-8') as f:
+        assert json.load(f) == {"box": 3}
+
+    compacted_version, compacted = _reload(app_mod, monkeypatch, store)
+    assert compacted_version == version
+    assert compacted == data
@@ -0,0 +1,70 @@
+"""主数据结构迁移：从版本0（无 schema_version 的旧数据）升级到当前版本"""
+import json
+import os
+import uuid
+
+
+def _legacy_tasks():
+    # 旧版数据：没有 task_type 等字段，CSV 导入留下了重复ID，循环任务没有重置时间
+    return [
+        {"id": 1, "name": "legacy"},
+        {"id": 1, "name": "duplicate"},
+        {"id": 2, "name": "weekly", "task_type": "周循环", "start_time": "2024-12-31 08:00:00"},
+    ]
+
+
+def _assert_current_schema(app_mod, data):
+    tasks = {task["name"]: task for task in data["tasks"]}
+    legacy, duplicate, weekly = tasks["legacy"], tasks["duplicate"], tasks["weekly"]
+
+    # 1: 补全分区与任务字段
+    for section in ("stats", "properties", "credits", "items", "backpack", "lootbox_miss_counts"):
+        assert section in data
+    assert legacy["task_type"] == "无循环"
+    assert legacy["completed_count"] == 0 and legacy["max_completions"] == 0
+
+    # 2: 重复ID重新编号，计数器位于所有ID之后
+    ids = [task["id"] for task in data["tasks"]]
+    assert len(ids) == len(set(ids))
+    assert legacy["id"] == 1 and duplicate["id"] == 3
+    task_meta = data["task_meta"]
+    assert task_meta["next_task_id"] > max(ids)
+
+    # 3: 修订号
+    assert all(task["updated_rev"] >= 1 for task in data["tasks"])
+    assert task_meta["rev"] >= 1
+    assert task_meta["tombstones"] == []
+
+    # 4: 循环任务的下次重置时间与最小堆
+    assert weekly["next_reset_at"] == "2025-01-06 00:00:00"
+    assert "next_reset_at" not in legacy
+    assert ["2025-01-06 00:00:00", weekly["id"]] in task_meta["reset_heap"]
+
+
+def test_upgrade_v0_document_runs_every_migration(app_mod):
+    assert [version for version, _ in app_mod.MASTER_DATA_MIGRATIONS] == \
+        list(range(1, app_mod.MASTER_DATA_SCHEMA_VERSION + 1))
+    data = app_mod.upgrade_master_data({"tasks": _legacy_tasks()}, 0)
+    _assert_current_schema(app_mod, data)
+
+
+def test_upgrade_is_idempotent(app_mod):
+    once = app_mod.upgrade_master_data({"tasks": _legacy_tasks()}, 0)
+    twice = app_mod.upgrade_master_data(json.loads(json.dumps(once)), 0)
+    assert twice == once
+
+
+def test_legacy_master_data_file_is_migrated_on_load(app_mod, monkeypatch):
+    username = 'm' + uuid.uuid4().hex[:10]
+    paths = app_mod.config_manager.user_paths(username)
+    os.makedirs(os.path.dirname(paths["DATA_FILE"]), exist_ok=True)
+    with open(paths["DATA_FILE"], 'w', encoding='utf-8') as f:
+        json.dump({"tasks": _legacy_tasks()}, f, ensure_ascii=False)
+
+    with app_mod.config_manager.user_scope(username):
+        data = app_mod.load_data()
+        _assert_current_schema(app_mod, data)
+
+        # 迁移结果已持久化，再次读取不会重新编号
+        monkeypatch.setattr(app_mod, 'master_data_cache', app_mod.MasterDataCache())
+        assert app_mod.load_data()["tasks"] == data["tasks"]
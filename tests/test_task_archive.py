@@ -0,0 +1,100 @@
+"""冷归档：按月分段写入、ID 冲突与恢复"""
+
+
+def _archived_task(client, headers, name, complete_time, **extra):
+    payload = {'name': name, 'archived': True, 'complete_time': complete_time}
+    payload.update(extra)
+    r = client.post('/api/tasks', headers=headers, json=payload)
+    assert r.status_code == 200, r.get_json()
+    return r.get_json()['task']
+
+
+def _archive_names(client, headers):
+    r = client.get('/api/tasks/archive', headers=headers)
+    assert r.status_code == 200, r.get_json()
+    return sorted(t['name'] for t in r.get_json()['tasks'])
+
+
+def test_archived_tasks_move_to_monthly_segments(app_mod, client, user):
+    username, headers = user
+    jan = _archived_task(client, headers, 'jan', '2024-01-05 10:00:00')
+    feb = _archived_task(client, headers, 'feb', '2024-02-10 10:00:00')
+
+    with app_mod.config_manager.user_scope(username):
+        assert app_mod.execute_daily_auto_tasks()['cold_archive'] == 2
+        archive = app_mod.get_task_archive()
+        assert [m['month'] for m in archive.months()] == ['2024-02', '2024-01']
+        assert archive.get(jan['id'])['name'] == 'jan'
+        assert archive.get(feb['id'])['name'] == 'feb'
+
+    hot_ids = {t['id'] for t in client.get('/api/tasks', headers=headers).get_json()}
+    assert jan['id'] not in hot_ids and feb['id'] not in hot_ids
+    assert _archive_names(client, headers) == ['feb', 'jan']
+
+
+def test_allocate_task_id_skips_archived_ids(app_mod, client, user):
+    username, headers = user
+    first = _archived_task(client, headers, 'first', '2024-01-05 10:00:00')
+    with app_mod.config_manager.user_scope(username):
+        assert app_mod.execute_daily_auto_tasks()['cold_archive'] == 1
+        data = app_mod.load_data(sections=app_mod.TASK_SECTIONS)
+        # 模拟计数器回退（例如旧数据迁移后 next_task_id 偏小）
+        data['task_meta']['next_task_id'] = first['id']
+        assert data.allocate_task_id() != first['id']
+
+    second = _archived_task(client, headers, 'second', '2024-01-06 10:00:00', id=first['id'])
+    assert second['id'] != first['id']
+
+
+def test_colliding_id_stays_in_hot_list(app_mod, client, user):
+    username, headers = user
+    first = _archived_task(client, headers, 'first', '2024-01-05 10:00:00')
+    with app_mod.config_manager.user_scope(username):
+        assert app_mod.execute_daily_auto_tasks()['cold_archive'] == 1
+
+        # 绕过 ID 分配，直接构造一个与归档中 ID 相同但内容不同的任务
+        data = app_mod.load_data(sections=app_mod.TASK_SECTIONS)
+        clash = dict(first, name='clash', complete_time='2024-01-07 10:00:00')
+        data.append_task(clash)
+        assert app_mod.move_archived_tasks_to_cold_storage(data) == 0
+        assert any(t['name'] == 'clash' for t in data['tasks'])
+        app_mod.safe_save_data(data)
+
+        # 归档中的原记录未被覆盖
+        assert app_mod.get_task_archive().get(first['id'])['name'] == 'first'
+
+    hot = client.get('/api/tasks', headers=headers).get_json()
+    assert [t['name'] for t in hot if t['id'] == first['id']] == ['clash']
+    assert _archive_names(client, headers) == ['first']
+
+
+def test_reappending_identical_task_is_idempotent(app_mod, client, user):
+    username, headers = user
+    task = _archived_task(client, headers, 'same', '2024-03-01 10:00:00')
+    with app_mod.config_manager.user_scope(username):
+        archive = app_mod.get_task_archive()
+        assert archive.append([task]) == [task]
+        # 上次迁移写入归档后、保存热数据前中断：再次写入同一记录应视为已持久化
+        assert archive.append([task]) == [task]
+        assert archive.query()[0] == 1
+
+
+def test_restore_assigns_new_id_when_hot_list_reuses_it(app_mod, client, user):
+    username, headers = user
+    first = _archived_task(client, headers, 'first', '2024-01-05 10:00:00')
+    with app_mod.config_manager.user_scope(username):
+        assert app_mod.execute_daily_auto_tasks()['cold_archive'] == 1
+        data = app_mod.load_data(sections=app_mod.TASK_SECTIONS)
+        data.append_task(dict(first, name='other', archived=False))
+        app_mod.safe_save_data(data)
+
+    r = client.post(f"/api/tasks/archive/{first['id']}/restore", headers=headers)
+    assert r.status_code == 200, r.get_json()
+    restored = r.get_json()['task']
+    assert restored['name'] == 'first'
+    assert restored['id'] != first['id']
+    assert _archive_names(client, headers) == []
+
+    hot = {t['name']: t['id'] for t in client.get('/api/tasks', headers=headers).get_json()}
+    assert hot['first'] == restored['id']
+    assert hot['other'] == first['id']
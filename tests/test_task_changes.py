@@ -0,0 +1,99 @@
+"""任务修订号与删除记录：/api/tasks/changes 的增量同步与全量回退"""
+import pytest
+
+
+@pytest.fixture(params=['json', 'sqlite'])
+def backend(request, app_mod, monkeypatch):
+    """两种存储后端都在保存时标记修订号，分别验证"""
+    monkeypatch.setattr(app_mod, 'STORAGE_BACKEND', request.param)
+    return request.param
+
+
+def _create(client, headers, name, **fields):
+    r = client.post('/api/tasks', headers=headers, json=dict(fields, name=name))
+    assert r.status_code == 200, r.get_json()
+    return r.get_json()['task']
+
+
+def _changes(client, headers, since):
+    r = client.get(f'/api/tasks/changes?since={since}', headers=headers)
+    assert r.status_code == 200, r.get_json()
+    return r.get_json()
+
+
+def test_changes_since_returns_changed_tasks_and_deleted_ids(backend, client, user):
+    _, headers = user
+    edited = _create(client, headers, 'edited')
+    removed = _create(client, headers, 'removed')
+    _create(client, headers, 'untouched')
+    since = _changes(client, headers, 0)['rev']
+
+    assert client.patch(f"/api/tasks/{edited['id']}", headers=headers, json={'name': 'renamed'}).status_code == 200
+    assert client.delete(f"/api/tasks/{removed['id']}", headers=headers).status_code == 200
+    added = _create(client, headers, 'added')
+
+    changes = _changes(client, headers, since)
+    assert changes['full'] is False
+    assert changes['rev'] > since
+    assert sorted(task['name'] for task in changes['tasks']) == ['added', 'renamed']
+    assert all(task['updated_rev'] > since for task in changes['tasks'])
+    assert changes['deleted'] == [removed['id']]
+    assert added['id'] not in changes['deleted']
+
+    latest = _changes(client, headers, changes['rev'])
+    assert latest['full'] is False
+    assert latest['tasks'] == [] and latest['deleted'] == []
+
+
+def test_since_below_tombstone_floor_returns_full_list(backend, app_mod, client, user, monkeypatch):
+    _, headers = user
+    monkeypatch.setattr(app_mod, 'TASK_TOMBSTONES_MAX', 2)
+    created = [_create(client, headers, f'task-{n}') for n in range(4)]
+    since = _changes(client, headers, 0)['rev']
+    for task in created[:3]:
+        assert client.delete(f"/api/tasks/{task['id']}", headers=headers).status_code == 200
+
+    changes = _changes(client, headers, since)
+    assert changes['full'] is True
+    assert changes['deleted'] == []
+    assert [task['id'] for task in changes['tasks']] == \
+        [task['id'] for task in client.get('/api/tasks', headers=headers).get_json()]
+
+    # 仍保留的删除记录可以增量返回
+    recent = _changes(client, headers, changes['rev'] - 2)
+    assert recent['full'] is False
+    assert recent['deleted'] == [created[1]['id'], created[2]['id']]
+
+
+def test_since_after_restore_returns_full_list(backend, app_mod, client, user):
+    username, headers = user
+    _create(client, headers, 'before-backup')
+    with app_mod.config_manager.user_scope(username):
+        backup_file = app_mod.backup_data()
+    assert backup_file
+
+    _create(client, headers, 'after-backup')
+    since = _changes(client, headers, 0)['rev']
+    with app_mod.config_manager.user_scope(username):
+        assert app_mod.restore_data_from_backup(backup_file)
+
+    # 客户端持有的修订号晚于恢复后的数据
+    changes = _changes(client, headers, since)
+    assert changes['full'] is True
+    names = [task['name'] for task in changes['tasks']]
+    assert 'before-backup' in names and 'after-backup' not in names
+
+
+def test_recreating_deleted_id_drops_tombstone(backend, client, user):
+    _, headers = user
+    task = _create(client, headers, 'first', id=4242)
+    assert task['id'] == 4242
+    since = _changes(client, headers, 0)['rev']
+
+    assert client.delete('/api/tasks/4242', headers=headers).status_code == 200
+    assert _changes(client, headers, since)['deleted'] == [4242]
+
+    assert _create(client, headers, 'second', id=4242)['id'] == 4242
+    changes = _changes(client, headers, since)
+    assert changes['deleted'] == []
+    assert [(t['id'], t['name']) for t in changes['tasks']] == [(4242, 'second')]
@@ -0,0 +1,55 @@
+"""任务查询索引缓存：以 (数据版本, 存储代号) 为键，数据重建或恢复后不会沿用旧索引"""
+import os
+import shutil
+
+
+def _names(client, headers, category):
+    r = client.get(f'/api/tasks?category={category}&sort=id', headers=headers)
+    assert r.status_code == 200, r.get_json()
+    return [task['name'] for task in r.get_json()['tasks']]
+
+
+def test_generation_is_kept_across_saves_and_renewed_on_restore(app_mod, user, tmp_path):
+    username, _ = user
+    with app_mod.config_manager.user_scope(username):
+        app_mod.load_data()  # 首次读取时创建默认数据
+        store = app_mod.get_master_data_store()
+        version, data, generation = store.load()
+        assert generation
+
+        data["lootbox_miss_counts"] = {"box": 1}
+        assert store.save(data, expected_version=version) == version + 1
+        assert store.load()[2] == generation
+
+        backup_file = str(tmp_path / "backup")
+        store.backup_to(backup_file)
+        store.restore_from(backup_file)
+        assert store.load()[2] not in (None, generation)
+
+
+def test_index_is_rebuilt_when_store_is_recreated_at_same_version(app_mod, client, user):
+    username, headers = user
+    for name in ("a", "b"):
+        r = client.post('/api/tasks', headers=headers, json={'name': name, 'category': 'old'})
+        assert r.status_code == 200, r.get_json()
+    assert _names(client, headers, 'old') == ["a", "b"]
+    hits = app_mod.task_index_cache.hits
+    _names(client, headers, 'old')
+    assert app_mod.task_index_cache.hits == hits + 1
+
+    with app_mod.config_manager.user_scope(username):
+        store = app_mod.get_master_data_store()
+        old_version, old_data, old_generation = store.load()
+        # 删除用户数据后重新创建，版本号从头开始，直到与原来的版本号相同
+        shutil.rmtree(app_mod.get_user_dir(username))
+        os.makedirs(app_mod.get_user_dir(username))
+        data = dict(old_data, tasks=[dict(task, category="new") for task in old_data["tasks"]])
+        version = store.save(data)
+        while version < old_version:
+            data["lootbox_miss_counts"] = {"box": version}
+            version = store.save(data)
+        assert version == old_version
+        assert store.load()[2] != old_generation
+
+    assert _names(client, headers, 'old') == []
+    assert _names(client, headers, 'new')[-2:] == ["a", "b"]
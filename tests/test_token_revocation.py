@@ -0,0 +1,127 @@
+"""令牌吊销：修改密码、登出以及图片令牌，已缓存的令牌同样不能再通过校验"""
+import os
+import uuid
+
+import pytest
+
+
+def _login(client, username, password='pass1234'):
+    r = client.post('/api/auth/login', json={'username': username, 'password': password})
+    assert r.status_code == 200, r.get_json()
+    body = r.get_json()
+    return body['access_token'], body['refresh_token']
+
+
+def _bearer(token):
+    return {'Authorization': 'Bearer ' + token}
+
+
+def _profile_status(client, token):
+    return client.get('/api/user/profile', headers=_bearer(token)).status_code
+
+
+def _refresh_status(client, refresh_token):
+    return client.post('/api/auth/refresh', json={'refresh_token': refresh_token}).status_code
+
+
+def test_password_change_revokes_earlier_tokens(client, user):
+    username, _ = user
+    access, refresh = _login(client, username)
+    # 先通过一次校验，令牌进入 TokenCache
+    assert _profile_status(client, access) == 200
+
+    r = client.put('/api/user/change-password', headers=_bearer(access),
+                   json={'old_password': 'pass1234', 'new_password': 'newpass5678'})
+    assert r.status_code == 200, r.get_json()
+    renewed = r.get_json()
+
+    assert _profile_status(client, access) == 401
+    assert _refresh_status(client, refresh) == 401
+    assert _profile_status(client, renewed['access_token']) == 200
+    assert _refresh_status(client, renewed['refresh_token']) == 200
+
+    assert client.post('/api/auth/login', json={'username': username, 'password': 'pass1234'}).status_code == 401
+    access, _ = _login(client, username, 'newpass5678')
+    assert _profile_status(client, access) == 200
+
+
+def test_logout_revokes_only_that_session(client, user):
+    username, _ = user
+    access, refresh = _login(client, username)
+    other_access, other_refresh = _login(client, username)
+    assert _profile_status(client, access) == 200
+
+    r = client.post('/api/auth/logout', headers=_bearer(access), json={'refresh_token': refresh})
+    assert r.status_code == 200, r.get_json()
+
+    assert _profile_status(client, access) == 401
+    assert _refresh_status(client, refresh) == 401
+    assert _profile_status(client, other_access) == 200
+    assert _refresh_status(client, other_refresh) == 200
+
+
+def test_revocations_are_shared_and_persisted(app_mod, client, user):
+    username, _ = user
+    access, _ = _login(client, username)
+    payload = app_mod.token_cache.decode(access)
+    assert payload is not None
+
+    # 另一个工作进程（或重启后的进程）从同一个数据库加载吊销记录
+    other_worker = app_mod.TokenRevocationStore(app_mod.TOKEN_REVOCATIONS_FILE)
+    assert not other_worker.is_revoked(payload)
+    assert app_mod.token_cache.revoke(access)
+    assert other_worker.is_revoked(payload)
+    assert app_mod.TokenRevocationStore(app_mod.TOKEN_REVOCATIONS_FILE).is_revoked(payload)
+
+
+@pytest.fixture
+def image(app_mod, user):
+    """在用户的图片目录中放一张图片，返回文件名"""
+    username, _ = user
+    filename = f"img_{uuid.uuid4().hex[:8]}.png"
+    with app_mod.config_manager.user_scope(username):
+        images_dir = app_mod.config_manager.IMAGES_DIR
+    os.makedirs(images_dir, exist_ok=True)
+    with open(os.path.join(images_dir, filename), 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\nimage')
+    return filename
+
+
+def _image_token(client, access):
+    r = client.get('/api/files/images/token', headers=_bearer(access))
+    assert r.status_code == 200, r.get_json()
+    return r.get_json()['token']
+
+
+def test_image_token_is_scoped_and_revoked_with_password_change(client, user, image):
+    username, _ = user
+    access, _ = _login(client, username)
+    token = _image_token(client, access)
+
+    assert client.get(f'/files/images/{image}').status_code == 401
+    r = client.get(f'/files/images/{image}?token={token}')
+    assert r.status_code == 200
+    assert r.data.endswith(b'image')
+
+    # 图片令牌不能当作访问令牌使用
+    assert _profile_status(client, token) == 401
+
+    r = client.put('/api/user/change-password', headers=_bearer(access),
+                   json={'old_password': 'pass1234', 'new_password': 'newpass5678'})
+    assert r.status_code == 200, r.get_json()
+    assert client.get(f'/files/images/{image}?token={token}').status_code == 401
+
+    # 新签发的图片令牌可以继续使用
+    token = _image_token(client, r.get_json()['access_token'])
+    assert client.get(f'/files/images/{image}?token={token}').status_code == 200
+
+
+def test_image_token_cannot_read_other_users_images(client, user, image):
+    other = 'o' + uuid.uuid4().hex[:10]
+    r = client.post('/api/auth/register', json={'username': other, 'password': 'pass1234'})
+    assert r.status_code == 200, r.get_json()
+    access, _ = _login(client, other)
+
+    token = _image_token(client, access)
+    assert client.get(f'/files/images/{image}?token={token}').status_code == 404
+    assert client.get(f'/files/images/{image}', headers=_bearer(access)).status_code == 404